@@ -1,36 +1,50 @@
 # Process simulation tools For Capstone
+import os
 from schemas import DailyPlan, ActivityProposal
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
 from datetime import datetime, timedelta
+from functools import lru_cache
+from instrumentation import traced_tool, emit
+
+if TYPE_CHECKING:
+    # memory_store and logistics pull in numpy; they are imported on first use of their tool.
+    from logistics import LogisticsEngine
+    from memory_store import TripMemoryStore
 
 class TravelTools:
     """Contains simulation tools used by agents"""
 
+    _logistics: Optional["LogisticsEngine"] = None
+
+    @staticmethod
+    def logistics() -> "LogisticsEngine":
+        """The shared logistics engine over the POI file of TRAVEL_POI_PATH (data/pois.json by default)."""
+        if TravelTools._logistics is None:
+            from logistics import DEFAULT_POI_PATH, LogisticsEngine
+
+            TravelTools._logistics = LogisticsEngine.from_file(os.environ.get("TRAVEL_POI_PATH") or DEFAULT_POI_PATH)
+        return TravelTools._logistics
+
     @staticmethod
-    def calculate_travel_time(activities_list: List[str]) -> str:
-        """(Maps/Distance Tool) تحاكي حساب وقت التنقل بين نقاط الاهتمام."""
-        print(f"--- TOOL USE: Calculating travel logistics for {len(activities_list)} points ---")
-        # Simulation for calculating distances to estimate travel time
-        return "Logistics Report: 4 activities/day is optimal to keep travel time under 1.5 hours total. Keep Louvre and Orsay together. Eiffel Tower requires half a day."
+    @traced_tool("TravelTools.calculate_travel_time")
+    def calculate_travel_time(activities_list: List[str], destination: Optional[str] = None) -> str:
+        """
+        (Maps/Distance Tool) Travel times between the activities, from the local POI coordinates.
+
+        :param activities_list: Names of the activities to visit.
+        :param destination: The trip's destination (e.g. "Cairo, Egypt"); without it, the destination whose POIs match the most activities.
+        :returns: The logistics report: areas, visit orders and minutes of travel.
+        """
+        emit(f"--- TOOL USE: Calculating travel logistics for {len(activities_list)} activities ---")
+        return TravelTools.logistics().report(activities_list, destination)
 
     @staticmethod
+    @traced_tool("TravelTools.calendar_scheduler")
     def calendar_scheduler(plan: List[DailyPlan]) -> str:
         """(Calendar Tool) تحاكي جدولة المسار في تقويم خارجي."""
-        print(f"--- TOOL USE: Scheduling {len(plan)} days in Calendar ---")
+        emit(f"--- TOOL USE: Scheduling {len(plan)} days in Calendar ---")
         # محاكاة نتيجة الجدولة
         return f"SUCCESS: The 7-day itinerary has been successfully added to the user's calendar starting on {plan[0].date}. Booking links (simulated) have been attached."
-        
-    
-    @staticmethod
-    def calculate_travel_time(activities_list: List[str]) -> str:
-        """(Maps/Distance Tool Simulation) Simulates travel time between points of interest."""
-        print(f"--- TOOL USE: Calculating travel logistics for {len(activities_list)} activities ---")
-        # Provides logical data needed by the agent to arrange activities
-        return (
-            "Logistics Report: The Pyramids require a full morning. "
-            "The Egyptian Museum and Khan el-Khalili are geographically close and can be grouped into one day. "
-            "The Citadel is best visited on a separate day due to traffic."
-        )
 
 class LongTermMemoryTool:
     """
@@ -47,38 +61,83 @@ class LongTermMemoryTool:
             {"trip_id": 3, "destination": "UAE (Dubai)", "duration": 4, "budget_spent": 1800, "interests": ["Shopping", "Luxury"], "season": "Winter"},
         ]
 
+    # Approximate spend per day (USD) of the budget levels users ask for.
+    _BUDGET_LEVELS = {"low": 80, "budget": 80, "mid": 200, "moderate": 200, "متوسطة": 200, "high": 450, "عالية": 450, "luxury": 600}
+
+    _store: Optional["TripMemoryStore"] = None
+
     @staticmethod
-    def analyze_past_trips(budget_range: str, duration_days: int) -> str:
+    def store() -> "TripMemoryStore":
+        """
+        The shared trip memory store (SQLite file from TRAVEL_MEMORY_PATH).
+        The default user is seeded with the mock history the first time it is opened.
+        """
+        if LongTermMemoryTool._store is None:
+            from memory_store import TripMemoryStore
+
+            store = TripMemoryStore(os.environ.get("TRAVEL_MEMORY_PATH", ".travel_memory.sqlite"))
+            if store.trip_count("default") == 0:
+                for trip in LongTermMemoryTool._mock_user_history():
+                    store.add_trip("default", trip["destination"], trip["duration"], trip["budget_spent"], trip["interests"], trip["season"])
+            LongTermMemoryTool._store = store
+        return LongTermMemoryTool._store
+
+    @staticmethod
+    @traced_tool("LongTermMemoryTool.record_trip")
+    def record_trip(destination: str, duration: int, budget_spent: float, interests: List[str], start_date: str, user_id: str = "default") -> int:
+        """Add a completed trip to the user's long-term memory. :returns: The new trip id."""
+        from memory_store import season_of
+
+        return LongTermMemoryTool.store().add_trip(user_id, destination, duration, budget_spent, interests, season_of(start_date))
+
+    @staticmethod
+    @traced_tool("LongTermMemoryTool.analyze_past_trips")
+    def analyze_past_trips(budget_range: str, duration_days: int, interests: Optional[List[str]] = None,
+                           start_date: Optional[str] = None, user_id: str = "default", top_k: int = 3) -> str:
         """
         تقوم بتحليل السجلات السابقة وتقديم تقرير للمقارنة والاقتراح.
 
+        The report is built from the store's incrementally maintained aggregates and the top-k most
+        similar past trips, so its size and cost do not grow with the length of the history.
+
         :param budget_range: الميزانية المطلوبة من المستخدم (مثلاً: "متوسطة" أو "عالية").
         :param duration_days: المدة المطلوبة للرحلة.
+        :param interests: The interests of the new request (used to find similar trips).
+        :param start_date: The start date of the new request (its season is used to find similar trips).
+        :param user_id: The user whose history is analysed.
+        :param top_k: Number of similar past trips included in the report.
         :returns: تقرير نصي يعتمد عليه الوكيل للاقتراح.
         """
-        history = LongTermMemoryTool._mock_user_history()
-        
-        # 1. حساب المتوسطات والتفضيلات
-        total_spent = sum(t['budget_spent'] for t in history)
-        avg_spent = total_spent / len(history) if history else 0
-        
-        # 2. تحديد الاهتمام الأكثر تكراراً
-        all_interests = [i for trip in history for i in trip['interests']]
-        most_common_interest = max(set(all_interests), key=all_interests.count) if all_interests else "N/A"
+        from memory_store import season_of
+
+        store = LongTermMemoryTool.store()
+
+        # 1. حساب المتوسطات والتفضيلات (from the aggregate tables)
+        stats = store.aggregates(user_id)
+        top_interests = ", ".join(f"{name} ({count})" for name, count in stats["top_interests"]) or "N/A"
+        top_seasons = ", ".join(f"{name} ({count})" for name, count in stats["top_seasons"]) or "N/A"
+
+        # 2. Retrieve the most similar past trips
+        level = budget_range.strip().lower()
+        daily_spend = next((spend for name, spend in LongTermMemoryTool._BUDGET_LEVELS.items() if name in level), None)
+        similar = store.similar_trips(user_id, duration_days, interests or [], season_of(start_date) if start_date else None, daily_spend, top_k)
+        similar_lines = "\n".join(
+            f"{rank}. {trip['destination']}: {trip['duration']} days, ${trip['budget_spent']:.0f}, "
+            f"{'/'.join(trip['interests'])}, {trip['season']} (similarity {score:.2f})"
+            for rank, (trip, score) in enumerate(similar, start=1)
+        ) or "No past trips recorded."
 
         # 3. صياغة تقرير الذاكرة
         report = (
             f"--- MEMORY ANALYSIS REPORT ---\n"
-            f"User History: {len(history)} past trips recorded.\n"
-            f"Average total trip cost: ${avg_spent:.2f}. Past budgets suggest a preference for trips between $1200 and $3500.\n"
-            f"Most preferred interests: {most_common_interest} (e.g., Culture, Food).\n"
-            f"Past seasons chosen: Spring, Autumn, Winter.\n\n"
-            f"Proposed Destinations (based on past success and new budget/duration of {duration_days} days):\n"
-            f"1. **Thailand (Bangkok):** Suitable for a {budget_range} budget, strong Food and Culture interests, similar to Japan but lower cost. Estimated cost: $1500.\n"
-            f"2. **Portugal (Lisbon):** Strong History/Culture interest, similar to Italy but offers new scenery. Estimated cost: $1000.\n"
-            f"3. **South Korea (Seoul):** New Culture experience, good for {duration_days} days. Estimated cost: $2200."
+            f"User History: {stats['trip_count']} past trips recorded.\n"
+            f"Average total trip cost: ${stats['avg_spent']:.2f} (min ${stats['min_spent']:.0f}, max ${stats['max_spent']:.0f}, std ${stats['std_spent']:.0f}).\n"
+            f"Most preferred interests: {top_interests}.\n"
+            f"Past seasons chosen: {top_seasons}.\n\n"
+            f"Most similar past trips to the new request ({duration_days} days, {budget_range} budget):\n"
+            f"{similar_lines}"
         )
-        print("--- 🌐 TOOL USE: Executing LongTermMemoryTool ---")
+        emit("--- 🌐 TOOL USE: Executing LongTermMemoryTool ---")
         return report
 
 class SchedulerTools:
@@ -87,6 +146,7 @@ class SchedulerTools:
     """
     
     @staticmethod
+    @traced_tool("SchedulerTools.send_to_booking_api")
     def send_to_booking_api(activity: str, date: str) -> bool:
         """
         Simulate the process of sending a final booking request to an external API.
@@ -96,9 +156,17 @@ class SchedulerTools:
         :returns: True If the booking is ‘successful’ (in the simulation).
         """
         # في مشروع حقيقي، سيتم هنا استدعاء requests.post('booking_service/api/...')
-        print(f"--- 📞 TOOL USE: Sending simulated booking request for {activity} on {date} ---")
+        emit(f"--- 📞 TOOL USE: Sending simulated booking request for {activity} on {date} ---")
         return True
 
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def parse_start_date(start_date_str: str) -> datetime:
+        """Parse a 'YYYY-MM-DD' start date once; later days of the same trip reuse the result."""
+        return datetime.strptime(start_date_str, '%Y-%m-%d')
+
+    @staticmethod
+    @traced_tool("SchedulerTools.calculate_itinerary_date")
     def calculate_itinerary_date(start_date_str: str, day_number: int) -> str:
         """
         Calculate the actual date for a given day in the track.
@@ -108,11 +176,11 @@ class SchedulerTools:
         :returns: The actual date of that day in the format 'YYYY-MM-DD'.
         """
         try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+            start_date = SchedulerTools.parse_start_date(start_date_str)
             
             target_date = start_date + timedelta(days=day_number - 1)
             
             return target_date.strftime('%Y-%m-%d')
         except ValueError:
-            print("⚠️ Error in start date format. Must be 'YYYY-MM-DD'.")
+            emit("⚠️ Error in start date format. Must be 'YYYY-MM-DD'.")
             return "N/A"
\ No newline at end of file
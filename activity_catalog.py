@@ -0,0 +1,196 @@
+# Activity catalog: validated investigator proposals per destination, indexed by interest
+import math
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pydantic import ValidationError
+
+from schemas import ActivityProposal
+
+# Activities the investigator proposes per request; a request served (partly) from the catalog gets as many.
+ACTIVITIES_PER_REQUEST = 5
+
+def normalize_key(text: str) -> str:
+    """Case-, spacing- and punctuation-insensitive key of a destination, interest or activity name."""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+def matches_interest(category: str, interest: str) -> bool:
+    """True when an activity category answers an interest, e.g. "History" for "Ancient History"."""
+    category_words, interest_words = set(normalize_key(category).split()), set(normalize_key(interest).split())
+    return bool(category_words) and bool(interest_words) and (category_words <= interest_words or interest_words <= category_words)
+
+def merge_activities(groups: Iterable[Sequence[ActivityProposal]], limit: int = ACTIVITIES_PER_REQUEST) -> List[ActivityProposal]:
+    """Take activities from each group in turn (one interest's, then the next one's), skipping duplicates, up to `limit`."""
+    groups = [list(group) for group in groups]
+    merged: List[ActivityProposal] = []
+    seen = set()
+    for position in range(max((len(group) for group in groups), default=0)):
+        for group in groups:
+            if position < len(group) and normalize_key(group[position].activity_name) not in seen:
+                seen.add(normalize_key(group[position].activity_name))
+                merged.append(group[position])
+                if len(merged) == limit:
+                    return merged
+    return merged
+
+class ActivityCatalog:
+    """
+    Persistent catalog of the activities researched for each destination, with an inverted
+    index from interest (and activity category) to activities.
+
+    A proposal is indexed under its own category and under every requested interest its
+    category matches; when a single interest was researched, all proposals are indexed
+    under it. An interest counts as covered once it has its share of a request's activities
+    (e.g. 3 of 5 for one of two interests) that are not older than the TTL, so a request can
+    be served entirely or partly from the catalog and only its missing interests need fresh
+    research. A request without interests is never served from the catalog.
+    """
+
+    def __init__(self, path: str = ".travel_catalog.sqlite", ttl: float = 7 * 24 * 3600,
+                 per_request: int = ACTIVITIES_PER_REQUEST):
+        """
+        :param path: SQLite file of the catalog (":memory:" keeps it for this process only).
+        :param ttl: Seconds an indexed activity is served for; 0 disables the catalog.
+        :param per_request: Activities a request served entirely from the catalog must get.
+        """
+        self.ttl = ttl
+        self.per_request = per_request
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS activities ("
+            "destination TEXT, name_key TEXT, payload TEXT, saved_at REAL, PRIMARY KEY (destination, name_key))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS interest_index ("
+            "destination TEXT, interest TEXT, name_key TEXT, rank INTEGER, saved_at REAL, "
+            "PRIMARY KEY (destination, interest, name_key))"
+        )
+        self._db.commit()
+        self.purge_expired()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def lookup(self, destination: str, interests: List[str]) -> Tuple[Dict[str, List[ActivityProposal]], List[str]]:
+        """
+        Split a request's interests into the ones the catalog covers and the ones still to research.
+
+        :returns: (covered interest -> its activities, in research order; missing interests), both in request order.
+        """
+        if not self.enabled:
+            return {}, list(interests)
+        if not interests:
+            with self._lock:
+                self.misses += 1
+            return {}, []
+
+        destination_key = normalize_key(destination)
+        keys = {interest: normalize_key(interest) for interest in interests}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT i.interest, a.payload FROM interest_index i "
+                "JOIN activities a ON a.destination = i.destination AND a.name_key = i.name_key "
+                f"WHERE i.destination = ? AND i.interest IN ({placeholders}) AND i.saved_at > ? "
+                "ORDER BY i.interest, i.rank",
+                (destination_key, *keys.values(), time.time() - self.ttl),
+            ).fetchall() if keys else []
+
+        by_key: Dict[str, List[ActivityProposal]] = {}
+        for interest_key, payload in rows:
+            try:
+                by_key.setdefault(interest_key, []).append(ActivityProposal.model_validate_json(payload))
+            except ValidationError:
+                continue
+
+        share = math.ceil(self.per_request / len(keys))
+        covered = {interest: by_key[key] for interest, key in keys.items() if len(by_key.get(key, ())) >= share}
+        if len(covered) == len(keys) and len(merge_activities(covered.values(), self.per_request)) < self.per_request:
+            # The interests share activities, so together they fall short of a full request.
+            covered = {}
+        missing = [interest for interest in interests if interest not in covered]
+        with self._lock:
+            if not missing:
+                self.hits += 1
+            elif covered:
+                self.partial_hits += 1
+            else:
+                self.misses += 1
+        return covered, missing
+
+    def add(self, destination: str, interests: List[str], proposals: List[ActivityProposal]) -> None:
+        """
+        Index freshly researched proposals. The researched interests' earlier entries are
+        replaced; entries of other interests and categories are kept or refreshed.
+        """
+        if not self.enabled or not proposals:
+            return
+        destination_key = normalize_key(destination)
+        interest_keys = list(dict.fromkeys(normalize_key(interest) for interest in interests if normalize_key(interest)))
+        now = time.time()
+
+        activity_rows, index_rows = [], []
+        for rank, proposal in enumerate(proposals):
+            name_key = normalize_key(proposal.activity_name)
+            if not name_key:
+                continue
+            activity_rows.append((destination_key, name_key, proposal.model_dump_json(), now))
+            indexed_under = {key for key in interest_keys if len(interest_keys) == 1 or matches_interest(proposal.category, key)}
+            if normalize_key(proposal.category):
+                indexed_under.add(normalize_key(proposal.category))
+            index_rows += [(destination_key, key, name_key, rank, now) for key in indexed_under]
+
+        with self._lock:
+            self._db.executemany(
+                "DELETE FROM interest_index WHERE destination = ? AND interest = ?",
+                [(destination_key, key) for key in interest_keys],
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO activities (destination, name_key, payload, saved_at) VALUES (?, ?, ?, ?)",
+                activity_rows,
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO interest_index (destination, interest, name_key, rank, saved_at) VALUES (?, ?, ?, ?, ?)",
+                index_rows,
+            )
+            self._db.commit()
+
+    def invalidate(self, destination: Optional[str] = None) -> None:
+        """Forget the activities of one destination, or of every destination."""
+        with self._lock:
+            if destination is None:
+                self._db.execute("DELETE FROM interest_index")
+                self._db.execute("DELETE FROM activities")
+            else:
+                self._db.execute("DELETE FROM interest_index WHERE destination = ?", (normalize_key(destination),))
+                self._db.execute("DELETE FROM activities WHERE destination = ?", (normalize_key(destination),))
+            self._db.commit()
+
+    def purge_expired(self) -> int:
+        """Delete index entries past the TTL and the activities no entry refers to. :returns: Entries removed."""
+        if not self.enabled:
+            return 0
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM interest_index WHERE saved_at <= ?", (time.time() - self.ttl,))
+            self._db.execute(
+                "DELETE FROM activities WHERE NOT EXISTS (SELECT 1 FROM interest_index i "
+                "WHERE i.destination = activities.destination AND i.name_key = activities.name_key)"
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            destinations, activities = self._db.execute(
+                "SELECT COUNT(DISTINCT destination), COUNT(*) FROM activities"
+            ).fetchone()
+            return {"hits": self.hits, "partial_hits": self.partial_hits, "misses": self.misses,
+                    "destinations": destinations, "activities": activities}
@@ -0,0 +1,100 @@
+# Batch trip planning: stream TripRequest lines from a JSONL file through the agent pipeline
+import argparse
+import asyncio
+import json
+from typing import Dict, Iterator, Tuple
+
+from pydantic import ValidationError
+
+from schemas import TripRequest, TripPlanResult
+from travel import run_full_sequence_async
+from instrumentation import tracer
+from rate_limit import PRIORITY_BATCH, request_priority
+
+def read_trip_requests(input_path: str) -> Iterator[Tuple[int, TripRequest | None, str | None]]:
+    """
+    Lazily read trip requests from a JSONL file, one request per line.
+
+    :param input_path: Path of the JSONL file (fields: duration, start_date, interests, budget_range, daily_budget).
+    :returns: An iterator of (line_number, request, error); `request` is None when the line is invalid.
+    """
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, TripRequest.model_validate_json(line), None
+            except ValidationError as e:
+                yield line_number, None, f"Invalid trip request: {e.errors()[0]['msg']}"
+
+async def run_batch(input_path: str, output_path: str, workers: int = 8) -> Dict[str, int]:
+    """
+    Plan every trip of `input_path` with a bounded pool of async workers.
+
+    Results are appended to `output_path` (JSONL) as soon as each trip finishes, so the run
+    never holds more than a few requests in memory. Model calls are queued at batch priority,
+    behind interactive requests. Each output line is a TripPlanResult with
+    the input `line` number; failed trips carry `failed_stage` and `error`.
+
+    :param input_path: JSONL file of trip requests.
+    :param output_path: JSONL file receiving one result per request, in completion order.
+    :param workers: Number of trips planned concurrently.
+    :returns: Summary counters: total, ok, and one `failed_<stage>` entry per failing stage.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    summary: Dict[str, int] = {"total": 0, "ok": 0}
+
+    async def _produce() -> None:
+        for item in read_trip_requests(input_path):
+            await queue.put(item)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def _work(out) -> None:
+        while (item := await queue.get()) is not None:
+            line_number, trip, error = item
+            if trip is None:
+                record = {"line": line_number, "failed_stage": "request", "error": error}
+                failed_stage = "request"
+            else:
+                with request_priority(PRIORITY_BATCH):
+                    result: TripPlanResult = await run_full_sequence_async(trip)
+                record = {"line": line_number, **result.model_dump(mode="json")}
+                failed_stage = result.failed_stage
+
+            # Only one coroutine runs between awaits, so each line is written whole.
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+            summary["total"] += 1
+            if failed_stage is None:
+                summary["ok"] += 1
+            else:
+                summary[f"failed_{failed_stage}"] = summary.get(f"failed_{failed_stage}", 0) + 1
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        await asyncio.gather(_produce(), *(_work(out) for _ in range(workers)))
+
+    return summary
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Plan a batch of trips from a JSONL request file.")
+    parser.add_argument("input", help="JSONL file of trip requests.")
+    parser.add_argument("output", help="JSONL file to append the results to.")
+    parser.add_argument("--workers", type=int, default=8, help="Number of trips planned concurrently.")
+    parser.add_argument("--trace", help="Write the spans of the run to this JSONL file.")
+    parser.add_argument("--metrics", help="Write a Prometheus text snapshot of the run's metrics to this file.")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run_batch(args.input, args.output, max(1, args.workers)))
+    print(f"🏁 Batch complete: {summary}")
+
+    if args.trace:
+        tracer.export_jsonl(args.trace)
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(tracer.prometheus_text())
+
+if __name__ == "__main__":
+    main()
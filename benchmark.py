@@ -0,0 +1,398 @@
+# Offline benchmark of the agent pipeline against the fake Gemini client
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+# Keep every store in memory so runs neither read nor leave state on disk.
+os.environ.setdefault("TRAVEL_CACHE_PATH", "")
+os.environ.setdefault("TRAVEL_CHECKPOINT_PATH", "")
+os.environ.setdefault("TRAVEL_CATALOG_PATH", "")
+os.environ.setdefault("TRAVEL_MEMORY_PATH", ":memory:")
+os.environ.setdefault("AGENT_MODEL", "gemini-2.5-flash")
+
+import numpy as np
+
+import travel
+from batch import run_batch
+from cache import DEFAULT_TTLS, ResponseCache
+from checkpoints import CheckpointStore
+from activity_catalog import ActivityCatalog
+from semantic_cache import SemanticCache
+from fake_client import FakeGeminiClient
+from instrumentation import tracer
+from schemas import TripRequest
+from providers import client_provider
+from rate_limit import RateLimiter
+from deadlines import DeadlinePolicy
+from hedging import Hedger
+
+# Import-time budgets (median ms over fresh interpreters) of the modules that workers and CLIs load first,
+# about 1.6x their medians on a single-core machine (schemas ~155 ms, travel ~220 ms) so that noise does not
+# fail the check; loading a deferred dependency is caught separately, whatever the time.
+IMPORT_BUDGETS_MS: Dict[str, float] = {"schemas": 250.0, "travel": 350.0}
+
+# Heavy dependencies that importing the agents must not load; they are deferred to first use.
+DEFERRED_MODULES = ("google.genai", "dotenv", "httpx", "numpy")
+
+_INTERESTS = [["History", "Food"], ["Art", "Culture"], ["Food", "Nightlife"], ["History", "Art", "Food"]]
+
+def make_trips(count: int) -> List[TripRequest]:
+    """Distinct trip requests, so that checkpoints and caches do not short-circuit the runs."""
+    return [
+        TripRequest(
+            duration=3 + i % 5,
+            start_date=f"2026-{1 + i % 12:02d}-{1 + (i // 12) % 28:02d}",
+            interests=_INTERESTS[i % len(_INTERESTS)],
+            budget_range="Mid-range",
+            daily_budget=120.0 + 10 * (i % 7),
+        )
+        for i in range(count)
+    ]
+
+def _reset(client: FakeGeminiClient, cache: bool, limiter: RateLimiter, hedger: Hedger, deadlines: DeadlinePolicy,
+           catalog: bool = False, semantic: bool = False) -> None:
+    client_provider.set(client)
+    travel.rate_limiter.set(limiter)
+    travel.hedger.set(hedger)
+    travel.deadline_policy.set(deadlines)
+    travel.cache_provider.set(ResponseCache(path=None, ttls=None if cache else {agent: 0 for agent in DEFAULT_TTLS}))
+    travel.checkpoint_provider.set(CheckpointStore(":memory:"))
+    travel.catalog_provider.set(ActivityCatalog(":memory:", ttl=7 * 24 * 3600 if catalog else 0))
+    travel.semantic_cache_provider.set(SemanticCache(enabled=semantic))
+    tracer.reset()
+
+def _run_sequential(trips: List[TripRequest], concurrency: int) -> None:
+    for trip in trips:
+        travel.test_full_sequence_interactive(trip.duration, trip.start_date, trip.interests, trip.budget_range, trip.daily_budget)
+
+def _run_concurrent(trips: List[TripRequest], concurrency: int) -> None:
+    asyncio.run(travel.run_trips_async(trips, max_concurrency=concurrency))
+
+def _run_batch(trips: List[TripRequest], concurrency: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path, output_path = os.path.join(tmp, "in.jsonl"), os.path.join(tmp, "out.jsonl")
+        with open(input_path, "w", encoding="utf-8") as f:
+            f.writelines(trip.model_dump_json() + "\n" for trip in trips)
+        asyncio.run(run_batch(input_path, output_path, workers=concurrency))
+
+MODES: Dict[str, Callable[[List[TripRequest], int], None]] = {
+    "sequential": _run_sequential,
+    "concurrent": _run_concurrent,
+    "batch": _run_batch,
+}
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+    return {"count": len(values), "p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2)}
+
+def _trip_durations(spans: List[Any]) -> List[float]:
+    """Wall time of each trip, from its first span's start to its last span's end."""
+    bounds: Dict[str, List[float]] = {}
+    for s in spans:
+        if s.trip_id:
+            start, end = bounds.setdefault(s.trip_id, [s.start, s.start + s.duration_s])
+            bounds[s.trip_id] = [min(start, s.start), max(end, s.start + s.duration_s)]
+    return [end - start for start, end in bounds.values()]
+
+def run_mode(mode: str, trips: List[TripRequest], client: FakeGeminiClient, concurrency: int, cache: bool = False,
+             verbose: bool = False, limiter: RateLimiter | None = None, hedger: Hedger | None = None,
+             deadlines: DeadlinePolicy | None = None, catalog: bool = False, semantic: bool = False) -> Dict[str, Any]:
+    """
+    Run one pipeline mode over `trips` and collect its performance figures.
+
+    :returns: trips/s, completed and failed trips, per-stage and per-agent latency percentiles, peak
+              traced memory (MiB), the rate limiter's, the hedger's, the activity catalog's and the semantic cache's counters.
+    """
+    limiter = limiter or RateLimiter()
+    hedger = hedger or Hedger()
+    _reset(client, cache, limiter, hedger, deadlines or DeadlinePolicy(), catalog, semantic)
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with output:
+        MODES[mode](trips, concurrency)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    spans = list(tracer.spans)
+    completed = sum(1 for s in spans if s.kind == "stage" and s.name == "schedule" and not s.error)
+    return {
+        "mode": mode,
+        "trips": len(trips),
+        "completed": completed,
+        "failed": len(trips) - completed,
+        "elapsed_s": round(elapsed, 3),
+        "trips_per_s": round(len(trips) / elapsed, 2) if elapsed else 0.0,
+        "peak_memory_mib": round(peak / 2 ** 20, 2),
+        "stages": {stage: _percentiles([s.duration_s for s in spans if s.kind == "stage" and s.name == stage]) for stage in travel.STAGES},
+        "model_calls": {
+            agent: {**_percentiles([s.duration_s for s in spans if s.kind == "model" and s.name == agent]),
+                    "errors": sum(1 for s in spans if s.kind == "model" and s.name == agent and s.error),
+                    "prompt_tokens": sum(s.prompt_tokens for s in spans if s.kind == "model" and s.name == agent),
+                    "first_item": _percentiles([s.attributes["first_item_s"] for s in spans
+                                                if s.kind == "model" and s.name == agent and "first_item_s" in s.attributes])}
+            for agent in sorted({s.name for s in spans if s.kind == "model"})
+        },
+        "trip_p99_ms": _percentiles(_trip_durations(spans))["p99_ms"],
+        "rate_limiter": limiter.stats(),
+        "hedger": hedger.stats(),
+        "catalog": travel.catalog_provider.get().stats(),
+        "semantic_cache": travel.semantic_cache_provider.get().stats(),
+    }
+
+# Destinations the recorded memory analyst proposes, used for the investigator-only runs.
+_DESTINATIONS = ["Cairo, Egypt", "Lisbon, Portugal", "Bangkok, Thailand"]
+
+def compare_investigators(trips: List[TripRequest], make_client: Callable[[], FakeGeminiClient], concurrency: int) -> List[Dict[str, Any]]:
+    """
+    Run the investigator stage alone on the same (destination, interests) requests, once with the
+    two-call path (search summary, then structuring) and once fused (one grounded call).
+
+    :returns: Per path: latency percentiles, model calls and prompt tokens, and quality figures:
+              valid results, proposals per result, share of requested interests with a matching
+              activity, and (for the fused path) the activity-name overlap with the two-call results.
+    """
+    from activity_catalog import matches_interest, normalize_key
+
+    requests = [(_DESTINATIONS[i % len(_DESTINATIONS)], trip.interests) for i, trip in enumerate(trips)]
+    previous, results, names_by_path = travel.FUSED_INVESTIGATOR, [], []
+
+    async def _run_all() -> List[Any]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _one(destination: str, interests: List[str]) -> Any:
+            async with semaphore:
+                started = time.perf_counter()
+                proposals = await travel.run_investigator_agent_async(destination, interests)
+                return proposals, time.perf_counter() - started
+
+        return await asyncio.gather(*(_one(destination, interests) for destination, interests in requests))
+
+    try:
+        for fused in (False, True):
+            _reset(make_client(), False, RateLimiter(), Hedger(), DeadlinePolicy())
+            travel.FUSED_INVESTIGATOR = fused
+            with contextlib.redirect_stdout(io.StringIO()):
+                outcomes = asyncio.run(_run_all())
+
+            valid = [proposals for proposals, _ in outcomes if proposals]
+            coverage = [
+                sum(any(matches_interest(p.category, interest) for p in proposals) for interest in interests) / len(interests)
+                for (proposals, _), (_, interests) in zip(outcomes, requests) if proposals and interests
+            ]
+            names_by_path.append([{normalize_key(p.activity_name) for p in proposals or []} for proposals, _ in outcomes])
+            spans = [s for s in tracer.spans if s.kind == "model"]
+            results.append({
+                "path": "fused" if fused else "two-call",
+                "latency": _percentiles([elapsed for _, elapsed in outcomes]),
+                "model_calls": len(spans),
+                "prompt_tokens": sum(s.prompt_tokens for s in spans),
+                "valid": len(valid),
+                "requests": len(requests),
+                "proposals_per_result": round(statistics.mean(len(p) for p in valid), 2) if valid else 0.0,
+                "interest_coverage": round(statistics.mean(coverage), 3) if coverage else 0.0,
+            })
+    finally:
+        travel.FUSED_INVESTIGATOR = previous
+
+    overlaps = [len(a & b) / len(a | b) for a, b in zip(*names_by_path) if a and b]
+    results[1]["overlap_with_two_call"] = round(statistics.mean(overlaps), 3) if overlaps else 0.0
+    return results
+
+def benchmark_logistics(sizes: List[int], seed: int = 0, repeat: int = 5) -> List[Dict[str, Any]]:
+    """
+    Time the logistics engine on synthetic cities of `sizes` POIs (spread like a large city, ~10 km across).
+
+    :returns: Per size: median ms of a cold matrix build, a cached lookup, ordering every POI,
+              splitting them into areas and ordering one 4-activity day, and the route length
+              of the ordered tour relative to the POIs in random order.
+    """
+    from logistics import LogisticsEngine, path_cost, shortest_path_order
+
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in sizes:
+        engine = LogisticsEngine()
+        pois = [{"name": f"Place {i}", "lat": 30.05 + rng.normal() * 0.04, "lon": 31.24 + rng.normal() * 0.04} for i in range(size)]
+        names = [poi["name"] for poi in pois]
+        timings: Dict[str, List[float]] = {"matrix_ms": [], "cached_ms": [], "order_all_ms": [], "areas_ms": [], "order_day_ms": []}
+
+        def _timed(name: str, fn: Callable[[], Any]) -> Any:
+            started = time.perf_counter()
+            value = fn()
+            timings[name].append((time.perf_counter() - started) * 1000)
+            return value
+
+        for _ in range(repeat):
+            engine.add_destination("Synthetic City", pois)
+            _timed("matrix_ms", lambda: engine.matrix("Synthetic City"))
+            minutes = _timed("cached_ms", lambda: engine.matrix("Synthetic City"))[1]
+            order = _timed("order_all_ms", lambda: shortest_path_order(minutes))
+            _timed("areas_ms", lambda: engine.areas(names, "Synthetic City"))
+            day = list(rng.choice(names, size=min(4, size), replace=False))
+            _timed("order_day_ms", lambda: engine.route(day, "Synthetic City"))
+        results.append({
+            "pois": size,
+            **{name: round(statistics.median(samples), 3) for name, samples in timings.items()},
+            "route_vs_random": round(path_cost(minutes, order) / path_cost(minutes, list(rng.permutation(size))), 3),
+        })
+    return results
+
+def measure_import(module: str, repeat: int = 7) -> Dict[str, Any]:
+    """
+    Time `import module` in fresh interpreters (so nothing is already cached in sys.modules).
+
+    :returns: The median and best import time (ms), the budget, and the deferred modules the import loaded anyway.
+    """
+    code = (
+        "import json, sys, time\n"
+        f"started = time.perf_counter()\nimport {module}\nelapsed = time.perf_counter() - started\n"
+        f"print(json.dumps({{'ms': elapsed * 1000, 'loaded': [m for m in {DEFERRED_MODULES!r} if m in sys.modules]}}))"
+    )
+    samples, loaded = [], set()
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        samples.append(sample["ms"])
+        loaded.update(sample["loaded"])
+    median = statistics.median(samples)
+    budget = IMPORT_BUDGETS_MS.get(module)
+    return {
+        "module": module,
+        "median_ms": round(median, 1),
+        "best_ms": round(min(samples), 1),
+        "budget_ms": budget,
+        "loaded_deferred": sorted(loaded),
+        "ok": (budget is None or median <= budget) and not loaded,
+    }
+
+def _print_report(result: Dict[str, Any]) -> None:
+    print(f"\n=== {result['mode']} === {result['completed']}/{result['trips']} trips in {result['elapsed_s']}s "
+          f"({result['trips_per_s']} trips/s), trip p99 {result['trip_p99_ms']} ms, peak memory {result['peak_memory_mib']} MiB")
+    print(f"{'':20}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, stats in result["stages"].items():
+        print(f"stage:{stage:<14}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    for agent, stats in result["model_calls"].items():
+        print(f"model:{agent:<14}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}  "
+              f"errors={stats['errors']} prompt_tokens={stats['prompt_tokens']}"
+              + (f" first_item_p50={stats['first_item']['p50_ms']} ms" if stats["first_item"]["count"] else ""))
+    limiter = result["rate_limiter"]
+    print(f"rate limiter: {limiter['retries']} retries ({limiter['throttled']} throttled), {limiter['failed']} gave up, "
+          f"mean queue wait {limiter['mean_wait_s'] * 1000:.1f} ms, max {limiter['max_wait_s'] * 1000:.1f} ms")
+    hedger = result["hedger"]
+    if hedger["hedges"]:
+        print(f"hedger: {hedger['hedges']} hedges for {hedger['calls']} calls, {hedger['hedge_wins']} won")
+    catalog = result["catalog"]
+    if catalog["hits"] or catalog["partial_hits"]:
+        print(f"catalog: {catalog['hits']} requests served, {catalog['partial_hits']} partly served, {catalog['misses']} researched")
+    for stage, stats in result["semantic_cache"]["stages"].items():
+        print(f"semantic cache {stage}: {stats['hits']} hits ({stats['exact_hits']} exact), {stats['misses']} misses "
+              f"({stats['near_misses']} near), similarity p50 {stats['similarity_p50']}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the travel agents with a fake Gemini client.")
+    parser.add_argument("--trips", type=int, default=20)
+    parser.add_argument("--modes", default="sequential,concurrent,batch", help=f"Comma-separated subset of {', '.join(MODES)}.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrency cap of the concurrent and batch modes.")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="Multiplier of the recorded latencies (1.0 = realistic).")
+    parser.add_argument("--latency-sigma", type=float, default=0.35, help="Log-normal sigma of the call latencies.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability of a 503 per model call.")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Probability of truncated JSON per model call.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Probability of a 429 per model call.")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Probability that a model call is stuck for 20x its latency.")
+    parser.add_argument("--hedge", action="store_true", help="Hedge model calls that run past their p95 (max 10%% extra calls).")
+    parser.add_argument("--trip-deadline", type=float, help="End-to-end trip deadline in (unscaled) seconds.")
+    parser.add_argument("--rpm", type=float, help="Requests-per-minute quota of the rate limiter (scaled by --time-scale).")
+    parser.add_argument("--tpm", type=float, help="Tokens-per-minute quota of the rate limiter (scaled by --time-scale).")
+    parser.add_argument("--cache", action="store_true", help="Enable the response cache during the runs.")
+    parser.add_argument("--catalog", action="store_true", help="Serve researched interests from the activity catalog during the runs.")
+    parser.add_argument("--semantic", action="store_true", help="Serve near-duplicate memory/investigate requests from the semantic cache.")
+    parser.add_argument("--llm-scheduler", action="store_true", help="Have the model write the booking confirmations (one more call per trip).")
+    parser.add_argument("--stream", action="store_true", help="Stream the model responses and hand over each item as it completes.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    parser.add_argument("--verbose", action="store_true", help="Show the agents' progress messages.")
+    parser.add_argument("--investigators", action="store_true", help="Only compare the two-call and the fused investigator.")
+    parser.add_argument("--logistics", action="store_true", help="Only time the logistics engine on synthetic cities of 100-1000 POIs.")
+    parser.add_argument("--imports", action="store_true", help="Only check the import times of schemas and travel against their budgets.")
+    args = parser.parse_args()
+
+    if args.imports:
+        results = [measure_import(module) for module in IMPORT_BUDGETS_MS]
+        for result in results:
+            extra = f", loaded {', '.join(result['loaded_deferred'])}" if result["loaded_deferred"] else ""
+            print(f"{'✅' if result['ok'] else '❌'} import {result['module']}: {result['median_ms']} ms "
+                  f"(best {result['best_ms']} ms, budget {result['budget_ms']} ms{extra})")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        sys.exit(0 if all(result["ok"] for result in results) else 1)
+
+    if args.logistics:
+        results = benchmark_logistics([100, 300, 500, 1000], seed=args.seed)
+        for result in results:
+            print(f"logistics {result['pois']:>5} POIs: matrix {result['matrix_ms']} ms (cached {result['cached_ms']} ms), "
+                  f"order all {result['order_all_ms']} ms, areas {result['areas_ms']} ms, order a day {result['order_day_ms']} ms, "
+                  f"route {result['route_vs_random']}x the random order")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        return
+
+    def make_client() -> FakeGeminiClient:
+        return FakeGeminiClient(latency_sigma=args.latency_sigma, time_scale=args.time_scale,
+                                failure_rate=args.failure_rate, malformed_rate=args.malformed_rate, seed=args.seed,
+                                throttle_rate=args.throttle_rate, stall_rate=args.stall_rate)
+
+    trips = make_trips(args.trips)
+    if args.investigators:
+        results = compare_investigators(trips, make_client, args.concurrency)
+        for result in results:
+            latency = result["latency"]
+            overlap = f", overlap with two-call {result['overlap_with_two_call']}" if "overlap_with_two_call" in result else ""
+            print(f"investigator {result['path']:<9} p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, "
+                  f"{result['model_calls']} model calls, {result['prompt_tokens']} prompt tokens; "
+                  f"{result['valid']}/{result['requests']} valid, {result['proposals_per_result']} proposals each, "
+                  f"interest coverage {result['interest_coverage']}{overlap}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        return
+
+    travel.LLM_SCHEDULER = args.llm_scheduler
+    travel.STREAMING = args.stream
+    results = []
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        client = make_client()
+        # Quotas and backoff are scaled like the latencies, so a quick run keeps the real proportions.
+        limiter = RateLimiter(requests_per_minute=args.rpm / args.time_scale if args.rpm else None,
+                              tokens_per_minute=args.tpm / args.time_scale if args.tpm else None,
+                              backoff=1.0 * args.time_scale, max_backoff=30.0 * args.time_scale)
+        hedger = Hedger(enabled=args.hedge, min_delay=0.0)
+        deadlines = DeadlinePolicy(trip=args.trip_deadline * args.time_scale if args.trip_deadline else None)
+        result = run_mode(mode, trips, client, args.concurrency, cache=args.cache, verbose=args.verbose,
+                          limiter=limiter, hedger=hedger, deadlines=deadlines, catalog=args.catalog, semantic=args.semantic)
+        _print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
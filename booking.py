@@ -0,0 +1,380 @@
+# Bulk booking dispatch (concurrent, idempotent) and a local stub booking service
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from schemas import BookingOutcome, DailyPlan
+from TravelTools import SchedulerTools
+
+if TYPE_CHECKING:
+    # httpx is only needed to talk to a real booking service; it is imported on first use.
+    import httpx
+
+# HTTP statuses worth retrying: throttling and transient server errors.
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+class BookingDispatcher:
+    """
+    Sends all bookings of an itinerary to the booking service at once.
+
+    With a `base_url`, bookings go over one pooled HTTP client: through the service's
+    batch endpoint (POST /bookings/batch) when it exists, otherwise as concurrent
+    POST /bookings requests. Every booking carries a deterministic Idempotency-Key, so
+    retries (and re-runs of the same trip) never book twice. Without a `base_url` the
+    simulated SchedulerTools.send_to_booking_api tool is used.
+
+    Long-running callers (e.g. the planning service) can `await open()` once to keep one
+    connection pool warm across dispatches, and `await aclose()` it on shutdown.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, max_concurrency: int = 8, max_retries: int = 3,
+                 backoff: float = 0.2, timeout: float = 5.0, batch_size: int = 50):
+        """
+        :param base_url: Root URL of the booking service, or None for the simulated tool.
+        :param max_concurrency: Maximum number of booking requests in flight.
+        :param max_retries: Retries per booking (or per batch) on transient failures.
+        :param backoff: Base delay in seconds of the exponential backoff between retries.
+        :param timeout: Per-request timeout in seconds.
+        :param batch_size: Maximum number of bookings per batch request.
+        """
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.batch_size = max(1, batch_size)
+        # None until the first dispatch finds out whether the service has a batch endpoint.
+        self.batch_supported: Optional[bool] = None
+        self._http: Optional["httpx.AsyncClient"] = None
+
+    @staticmethod
+    def idempotency_key(activity: str, date: str, slot: int, namespace: str) -> str:
+        """Deterministic key of one booking; `slot` tells apart repeats of an activity on the same day, `namespace` other trips."""
+        return hashlib.sha256(f"{namespace}|{date}|{slot}|{activity}".encode("utf-8")).hexdigest()[:32]
+
+    def plan_requests(self, itinerary: List[DailyPlan], start_date: str, namespace: str) -> List[Dict[str, str]]:
+        """Flatten the itinerary into booking requests (the start date is parsed once per trip)."""
+        requests = []
+        for day_plan in itinerary:
+            date = SchedulerTools.calculate_itinerary_date(start_date, day_plan.day)
+            for slot, activity in enumerate(day_plan.activities):
+                requests.append({
+                    "activity": activity,
+                    "date": date,
+                    "idempotency_key": self.idempotency_key(activity, date, slot, namespace),
+                })
+        return requests
+
+    def _new_http(self) -> "httpx.AsyncClient":
+        import httpx
+
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        return httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits)
+
+    async def open(self) -> None:
+        """Keep one pooled HTTP client open for the following dispatches (on the current event loop)."""
+        if self.base_url and self._http is None:
+            self._http = self._new_http()
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            http, self._http = self._http, None
+            await http.aclose()
+
+    def dispatch(self, itinerary: List[DailyPlan], start_date: str, namespace: str) -> List[BookingOutcome]:
+        """
+        Blocking wrapper around dispatch_async, for callers without an event loop.
+
+        It runs its own event loop, so it must not be called from a running one (await
+        dispatch_async there). The pooled client of `open()` belongs to the service's loop, so
+        a fresh HTTP client is used for the dispatch.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._dispatch(itinerary, start_date, namespace, pooled=False))
+        raise RuntimeError("BookingDispatcher.dispatch was called from a running event loop; await dispatch_async instead.")
+
+    async def dispatch_async(self, itinerary: List[DailyPlan], start_date: str, namespace: str) -> List[BookingOutcome]:
+        """
+        Book every activity of the itinerary.
+
+        :param itinerary: The DailyPlan list to book.
+        :param start_date: Trip start date ('YYYY-MM-DD').
+        :param namespace: Scopes the idempotency keys to one trip (its trip id), so that two trips never share a booking.
+        :returns: One BookingOutcome per activity, in itinerary order; failures are reported per activity.
+        """
+        return await self._dispatch(itinerary, start_date, namespace, pooled=True)
+
+    async def _dispatch(self, itinerary: List[DailyPlan], start_date: str, namespace: str, pooled: bool) -> List[BookingOutcome]:
+        """dispatch_async; `pooled` sends over the client kept open by `open()`, if any."""
+        requests = self.plan_requests(itinerary, start_date, namespace)
+        if not requests:
+            return []
+
+        if not self.base_url:
+            return [
+                BookingOutcome(activity_name=r["activity"], date=r["date"], idempotency_key=r["idempotency_key"],
+                               success=SchedulerTools.send_to_booking_api(activity=r["activity"], date=r["date"]), attempts=1)
+                for r in requests
+            ]
+
+        if pooled and self._http is not None:
+            return await self._dispatch_over(self._http, requests)
+        async with self._new_http() as http:
+            return await self._dispatch_over(http, requests)
+
+    async def _dispatch_over(self, http: "httpx.AsyncClient", requests: List[Dict[str, str]]) -> List[BookingOutcome]:
+        if self.batch_supported is not False:
+            chunks = [requests[i:i + self.batch_size] for i in range(0, len(requests), self.batch_size)]
+            batches = await asyncio.gather(*(self._send_batch(http, chunk) for chunk in chunks))
+            if all(batch is not None for batch in batches):
+                return [outcome for batch in batches for outcome in batch]
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _bounded(request: Dict[str, str]) -> BookingOutcome:
+            async with semaphore:
+                return await self._send_one(http, request)
+
+        return list(await asyncio.gather(*(_bounded(r) for r in requests)))
+
+    async def _sleep_before_retry(self, attempt: int) -> None:
+        # Exponential backoff with jitter so retried bookings do not arrive in lockstep.
+        await asyncio.sleep(self.backoff * (2 ** (attempt - 1)) * (0.5 + random.random()))
+
+    async def _send_one(self, http: "httpx.AsyncClient", request: Dict[str, str]) -> BookingOutcome:
+        import httpx
+
+        error = None
+        attempts = 0
+        while attempts <= self.max_retries:
+            attempts += 1
+            try:
+                response = await http.post(
+                    "/bookings",
+                    json={"activity": request["activity"], "date": request["date"]},
+                    headers={"Idempotency-Key": request["idempotency_key"]},
+                )
+                if response.status_code == 200:
+                    return BookingOutcome(activity_name=request["activity"], date=request["date"],
+                                          idempotency_key=request["idempotency_key"], success=True, attempts=attempts,
+                                          confirmation_code=response.json().get("confirmation_code"))
+                error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRYABLE_STATUSES:
+                    break
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+            if attempts <= self.max_retries:
+                await self._sleep_before_retry(attempts)
+
+        return BookingOutcome(activity_name=request["activity"], date=request["date"],
+                              idempotency_key=request["idempotency_key"], success=False, attempts=attempts, error=error)
+
+    async def _send_batch(self, http: "httpx.AsyncClient", requests: List[Dict[str, str]]) -> Optional[List[BookingOutcome]]:
+        """Book a chunk through the batch endpoint; None when the service has no batch endpoint."""
+        import httpx
+
+        pending = {r["idempotency_key"]: r for r in requests}
+        outcomes: Dict[str, BookingOutcome] = {}
+        errors: Dict[str, str] = {}
+        attempts = 0
+
+        while pending and attempts <= self.max_retries:
+            attempts += 1
+            try:
+                response = await http.post("/bookings/batch", json={"bookings": list(pending.values())})
+                if response.status_code in (404, 405) and self.batch_supported is not True:
+                    self.batch_supported = False
+                    return None
+                if response.status_code == 200:
+                    self.batch_supported = True
+                    for item in response.json().get("results", []):
+                        key = item.get("idempotency_key")
+                        request = pending.get(key)
+                        if request is None:
+                            continue
+                        if item.get("confirmation_code"):
+                            outcomes[key] = BookingOutcome(activity_name=request["activity"], date=request["date"],
+                                                           idempotency_key=key, success=True, attempts=attempts,
+                                                           confirmation_code=item["confirmation_code"])
+                            del pending[key]
+                        else:
+                            errors[key] = item.get("error", "rejected")
+                            if not item.get("retryable", True):
+                                outcomes[key] = BookingOutcome(activity_name=request["activity"], date=request["date"],
+                                                               idempotency_key=key, success=False, attempts=attempts,
+                                                               error=errors[key])
+                                del pending[key]
+                else:
+                    errors.update({key: f"HTTP {response.status_code}" for key in pending})
+                    if response.status_code not in RETRYABLE_STATUSES:
+                        break
+            except httpx.TransportError as e:
+                errors.update({key: f"{type(e).__name__}: {e}" for key in pending})
+            if pending and attempts <= self.max_retries:
+                await self._sleep_before_retry(attempts)
+
+        for key, request in pending.items():
+            outcomes[key] = BookingOutcome(activity_name=request["activity"], date=request["date"], idempotency_key=key,
+                                           success=False, attempts=attempts, error=errors.get(key))
+        return [outcomes[r["idempotency_key"]] for r in requests]
+
+class StubBookingServer:
+    """
+    Local booking service for offline tests and benchmarks.
+
+    Implements POST /bookings (Idempotency-Key header) and, optionally, POST /bookings/batch.
+    Repeated idempotency keys return the original confirmation instead of booking again.
+    `latency` and `failure_rate` simulate a slow or flaky service (failures are 503s).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 failure_rate: float = 0.0, batch_endpoint: bool = True, seed: Optional[int] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.batch_endpoint = batch_endpoint
+        self.bookings: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"requests": 0, "bookings": 0, "duplicates": 0, "failures": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubBookingServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _book(self, key: str, activity: str, date: str) -> Optional[Dict[str, Any]]:
+        """Book once per key; None when the simulated failure hits."""
+        with self._lock:
+            if key in self.bookings:
+                self.stats["duplicates"] += 1
+                return self.bookings[key]
+            if self._random.random() < self.failure_rate:
+                self.stats["failures"] += 1
+                return None
+            record = {"idempotency_key": key, "activity": activity, "date": date,
+                      "status": "Confirmed", "confirmation_code": f"BK-{key[:8].upper()}"}
+            self.bookings[key] = record
+            self.stats["bookings"] += 1
+            return record
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, payload: Dict[str, Any]) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                data = json.loads(self.rfile.read(length) or b"{}")
+                with stub._lock:
+                    stub.stats["requests"] += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                if self.path == "/bookings":
+                    key = self.headers.get("Idempotency-Key")
+                    if not key:
+                        return self._reply(400, {"error": "Missing Idempotency-Key header."})
+                    record = stub._book(key, data.get("activity", ""), data.get("date", ""))
+                    if record is None:
+                        return self._reply(503, {"error": "Booking service unavailable."})
+                    return self._reply(200, record)
+
+                if self.path == "/bookings/batch" and stub.batch_endpoint:
+                    results = []
+                    for item in data.get("bookings", []):
+                        record = stub._book(item.get("idempotency_key", ""), item.get("activity", ""), item.get("date", ""))
+                        results.append(record or {"idempotency_key": item.get("idempotency_key"),
+                                                  "error": "Booking service unavailable.", "retryable": True})
+                    return self._reply(200, {"results": results})
+
+                return self._reply(404, {"error": f"Unknown endpoint {self.path}."})
+
+        return Handler
+
+def _bench(args: argparse.Namespace) -> None:
+    """Book a synthetic itinerary against a local stub and report throughput and retries."""
+    itinerary = [
+        DailyPlan(day=day, date="", theme="bench", activities=[f"Activity {day}-{i}" for i in range(args.per_day)], total_daily_cost=0)
+        for day in range(1, args.days + 1)
+    ]
+    with StubBookingServer(latency=args.latency, failure_rate=args.failure_rate,
+                           batch_endpoint=not args.no_batch, seed=0) as stub:
+        dispatcher = BookingDispatcher(stub.base_url, max_concurrency=args.concurrency, backoff=0.01)
+        started = time.perf_counter()
+        outcomes = dispatcher.dispatch(itinerary, "2025-12-01", "bench")
+        elapsed = time.perf_counter() - started
+    failed = [o for o in outcomes if not o.success]
+    print(f"📊 {len(outcomes)} bookings in {elapsed:.3f}s ({len(outcomes) / elapsed:.1f}/s), "
+          f"{sum(o.attempts for o in outcomes)} attempts, {len(failed)} failed, stub stats: {stub.stats}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stub booking service and dispatcher benchmark.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="Run the stub booking service.")
+    serve.add_argument("--port", type=int, default=8099)
+    serve.add_argument("--latency", type=float, default=0.0)
+    serve.add_argument("--failure-rate", type=float, default=0.0)
+    serve.add_argument("--no-batch", action="store_true", help="Disable the /bookings/batch endpoint.")
+
+    bench = sub.add_parser("bench", help="Dispatch a synthetic itinerary against a stub service.")
+    bench.add_argument("--days", type=int, default=7)
+    bench.add_argument("--per-day", type=int, default=4)
+    bench.add_argument("--concurrency", type=int, default=8)
+    bench.add_argument("--latency", type=float, default=0.05)
+    bench.add_argument("--failure-rate", type=float, default=0.1)
+    bench.add_argument("--no-batch", action="store_true", help="Disable the /bookings/batch endpoint.")
+
+    args = parser.parse_args()
+    if args.command == "bench":
+        _bench(args)
+        return
+
+    stub = StubBookingServer(port=args.port, latency=args.latency, failure_rate=args.failure_rate, batch_endpoint=not args.no_batch)
+    print(f"📞 Stub booking service listening on {stub.base_url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+if __name__ == "__main__":
+    main()
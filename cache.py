@@ -0,0 +1,150 @@
+# Response cache for generate_content calls
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+# Default time-to-live (seconds) per agent. Search results go stale quickly, the memory
+# analysis only changes when the user's history does. A TTL of 0 disables caching: the
+# scheduler must issue fresh confirmation codes for every booking.
+DEFAULT_TTLS: Dict[str, float] = {
+    "memory": 24 * 3600,
+    "search": 1 * 3600,
+    "investigate": 6 * 3600,
+    "investigate_fused": 1 * 3600,
+    "plan": 6 * 3600,
+    "theme": 6 * 3600,
+    "schedule": 0,
+}
+
+def _jsonable(value: Any) -> Any:
+    """Convert prompt contents / request configs into a stable JSON-serializable structure."""
+    if isinstance(value, type) and issubclass(value, BaseModel):
+        return value.model_json_schema()
+    if isinstance(value, BaseModel):
+        return {
+            name: _jsonable(getattr(value, name))
+            for name in type(value).model_fields
+            if getattr(value, name) is not None
+        }
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+class ResponseCache:
+    """
+    Two-level cache for model responses: an in-memory LRU in front of a local SQLite file.
+
+    Entries are keyed on a hash of (model, contents, config) and expire after the TTL
+    configured for the agent that produced them.
+    """
+
+    def __init__(self, path: Optional[str] = ".travel_cache.sqlite", max_entries: int = 1024, ttls: Optional[Dict[str, float]] = None):
+        """
+        :param path: SQLite file backing the cache, or None/"" for a memory-only cache.
+        :param max_entries: Maximum number of entries kept in the in-memory LRU.
+        :param ttls: Per-agent TTLs in seconds (merged over DEFAULT_TTLS).
+        """
+        self.max_entries = max_entries
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, agent TEXT, value TEXT, created_at REAL, expires_at REAL)"
+            )
+            self._db.commit()
+            self.purge_expired()
+
+    @staticmethod
+    def make_key(model: str, contents: Any, config: Any = None) -> str:
+        """Hash the model name, prompt contents and request config into a cache key."""
+        payload = json.dumps(
+            {"model": model, "contents": _jsonable(contents), "config": _jsonable(config)},
+            sort_keys=True, ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, agent: str) -> float:
+        return self.ttls.get(agent, 0)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response text, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, agent: str, value: str) -> None:
+        """Store a response text under the TTL of `agent` (no-op when that TTL is 0)."""
+        ttl = self.ttl_for(agent)
+        if ttl <= 0 or not value:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now + ttl)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, agent, value, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, agent, value, now, now + ttl),
+                )
+                self._db.commit()
+
+    def invalidate(self, key: str) -> None:
+        """Drop an entry, e.g. when a cached response no longer validates."""
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+
+    def purge_expired(self) -> int:
+        """Delete expired rows from the SQLite file. :returns: The number of rows removed."""
+        if self._db is None:
+            return 0
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self._memory)}
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        # Caller holds the lock.
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
@@ -0,0 +1,95 @@
+# Stage checkpoints for the four-agent sequence
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from schemas import (
+    ActivityProposalsList, BookingConfirmation, DestinationProposalsList, ItineraryList, TripRequest,
+)
+
+# Validated output container of each stage, with the list field the stage returns (None: the container itself).
+STAGE_OUTPUTS: Dict[str, Tuple[type[BaseModel], Optional[str]]] = {
+    "memory": (DestinationProposalsList, "proposals"),
+    "investigate": (ActivityProposalsList, "proposals"),
+    "plan": (ItineraryList, "itinerary"),
+    "schedule": (BookingConfirmation, None),
+}
+
+def checkpoint_key(trip: TripRequest, destination_index: int = 0) -> str:
+    """Key of a trip request's checkpoints: a hash of the request and the selected destination."""
+    return hashlib.sha256(f"{trip.model_dump_json()}|{destination_index}".encode("utf-8")).hexdigest()
+
+class CheckpointStore:
+    """
+    Stores the validated output of every completed stage of a request in SQLite, so that a
+    rerun of the same request resumes from its first incomplete stage.
+
+    Checkpoints are for resuming after a failure, not a cache of finished runs: the sequences
+    clear a request's checkpoints once it is booked, and checkpoints older than `max_age` are
+    ignored, so that an abandoned run is not resumed days later from stale results.
+    """
+
+    def __init__(self, path: str = ".travel_checkpoints.sqlite", max_age: float = 24 * 3600):
+        """
+        :param path: SQLite file of the store (":memory:" keeps checkpoints for this process only).
+        :param max_age: Seconds a checkpoint can be resumed from; 0 keeps them indefinitely.
+        """
+        self.max_age = max_age
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "request_key TEXT, stage TEXT, payload TEXT, saved_at REAL, PRIMARY KEY (request_key, stage))"
+        )
+        self._db.commit()
+
+    def _oldest(self) -> float:
+        """Save time of the oldest checkpoint still resumable."""
+        return time.time() - self.max_age if self.max_age > 0 else float("-inf")
+
+    def save(self, request_key: str, stage: str, output: Any) -> None:
+        """Checkpoint a stage's output (the list returned by the agent, or the BookingConfirmation)."""
+        container, field = STAGE_OUTPUTS[stage]
+        payload = (output if field is None else container(**{field: output})).model_dump_json()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints (request_key, stage, payload, saved_at) VALUES (?, ?, ?, ?)",
+                (request_key, stage, payload, time.time()),
+            )
+            self._db.commit()
+
+    def load(self, request_key: str, stage: str) -> Any:
+        """:returns: The checkpointed output of `stage`, or None when the stage has not completed."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT payload FROM checkpoints WHERE request_key = ? AND stage = ? AND saved_at > ?",
+                (request_key, stage, self._oldest()),
+            ).fetchone()
+        if row is None:
+            return None
+        container, field = STAGE_OUTPUTS[stage]
+        try:
+            validated = container.model_validate_json(row[0])
+        except ValidationError:
+            return None
+        return validated if field is None else getattr(validated, field)
+
+    def completed_stages(self, request_key: str) -> Dict[str, float]:
+        """:returns: Stage name -> checkpoint time of every completed stage of the request."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT stage, saved_at FROM checkpoints WHERE request_key = ? AND saved_at > ?",
+                (request_key, self._oldest()),
+            ).fetchall()
+        return dict(rows)
+
+    def clear(self, request_key: str) -> None:
+        """Forget every checkpoint of the request (the next run starts from scratch)."""
+        with self._lock:
+            # Expired checkpoints of other requests go too, so that the file does not grow forever.
+            self._db.execute("DELETE FROM checkpoints WHERE request_key = ? OR saved_at <= ?", (request_key, self._oldest()))
+            self._db.commit()
@@ -0,0 +1,85 @@
+# In-flight request coalescing: concurrent identical calls share one upstream call
+import asyncio
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class Coalescer:
+    """
+    Runs at most one call per key at a time on each event loop; callers arriving while a call
+    for their key is in flight await that call and receive its result (or exception).
+
+    The shared call runs in its own task, so a caller that is cancelled does not cancel it for
+    the others; once the last caller has left, the call is cancelled. Nothing is kept once the
+    call finishes: repeated calls are the cache's job.
+    """
+
+    def __init__(self):
+        self._inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, _Call]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Await the call for `key`, starting it with `factory()` unless one is already in flight.
+
+        :returns: (result, shared); `shared` is True when the result came from another caller's call.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            inflight = self._inflight.setdefault(loop, {})
+            call = inflight.get(key)
+            shared = call is not None
+            if shared:
+                self.coalesced += 1
+            else:
+                self.calls += 1
+                call = _Call(loop.create_task(factory()))
+                inflight[key] = call
+                call.task.add_done_callback(_retrieve)
+                call.task.add_done_callback(lambda _: self._forget(loop, key, call))
+            call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            self._leave(loop, key, call)
+
+    def _leave(self, loop: asyncio.AbstractEventLoop, key: Hashable, call: "_Call") -> None:
+        """A caller is done with the call; the last one to leave before it finishes cancels it."""
+        with self._lock:
+            call.waiters -= 1
+            abandoned = call.waiters == 0 and not call.task.done()
+            if abandoned:
+                self.abandoned += 1
+                # Later callers start a new call instead of joining the cancelled one.
+                inflight = self._inflight.get(loop)
+                if inflight is not None and inflight.get(key) is call:
+                    del inflight[key]
+        if abandoned:
+            call.task.cancel()
+
+    def _forget(self, loop: asyncio.AbstractEventLoop, key: Hashable, call: "_Call") -> None:
+        with self._lock:
+            inflight = self._inflight.get(loop)
+            if inflight is not None and inflight.get(key) is call:
+                del inflight[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return sum(len(inflight) for inflight in self._inflight.values())
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "abandoned": self.abandoned, "in_flight": self.in_flight()}
+
+class _Call:
+    """A shared call in flight and the number of callers awaiting it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+def _retrieve(task: asyncio.Task) -> None:
+    # Mark the outcome as seen: a call whose callers have all left would otherwise log "exception was never retrieved".
+    task.cancelled() or task.exception()
@@ -0,0 +1,99 @@
+# Local booking confirmations: exact totals, unique codes and booking times, merged with the booking outcomes
+import unicodedata
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from booking import BookingDispatcher
+from schemas import BookingConfirmation, BookingOutcome, ConfirmationDetails, DailyPlan
+from TravelTools import SchedulerTools, TravelTools
+from instrumentation import traced_tool
+
+def code_prefix(destination: Optional[str]) -> str:
+    """Three-letter code of the destination's city: "Cairo, Egypt" -> "CAI", "São Paulo" -> "SAO" ("TRP" without one)."""
+    city = unicodedata.normalize("NFKD", (destination or "").partition(",")[0])
+    return "".join(c for c in city if c.isascii() and c.isalpha())[:3].upper() or "TRP"
+
+def format_time(minute: int) -> str:
+    """Minutes after midnight as a booking time, e.g. 570 -> "09:30 AM"."""
+    hours, minutes = divmod(int(minute) % (24 * 60), 60)
+    return f"{hours % 12 or 12:02d}:{minutes:02d} {'AM' if hours < 12 else 'PM'}"
+
+def parse_time(text: str) -> Optional[int]:
+    """A booking time such as "02:15 PM" (or "14:15") in minutes after midnight; None when it is not a time."""
+    for layout in ("%I:%M %p", "%H:%M"):
+        try:
+            parsed = datetime.strptime(text.strip(), layout)
+            return parsed.hour * 60 + parsed.minute
+        except ValueError:
+            continue
+    return None
+
+def confirmation_code(prefix: str, key: str, taken: Set[str]) -> str:
+    """
+    Code of a booking derived from its idempotency key, e.g. "CAI-3F9A1C", lengthened until it is not in `taken`
+    (the same booking always gets the same code).
+    """
+    for length in range(6, len(key) + 1):
+        code = f"{prefix}-{key[:length].upper()}"
+        if code not in taken:
+            return code
+    repeat = 2
+    while f"{prefix}-{key.upper()}-{repeat}" in taken:
+        repeat += 1
+    return f"{prefix}-{key.upper()}-{repeat}"
+
+def confirmation_total(itinerary: List[DailyPlan]) -> float:
+    """Sum of the days' costs, added in decimal so that it matches the itinerary to the cent."""
+    return float(sum((Decimal(str(plan.total_daily_cost)) for plan in itinerary), Decimal(0)).quantize(Decimal("0.01")))
+
+@traced_tool("confirmations.build_confirmation")
+def build_confirmation(itinerary: List[DailyPlan], start_date: Optional[str], namespace: str, outcomes: Sequence[BookingOutcome] = (),
+                       destination: Optional[str] = None, kept: Sequence[ConfirmationDetails] = ()) -> BookingConfirmation:
+    """
+    Build the BookingConfirmation of an itinerary without a model call.
+
+    The total is the exact sum of the days' costs. Each activity is "Confirmed" when its booking
+    outcome succeeded and "Pending" otherwise, with the booking service's code or one derived
+    from the booking's idempotency key, which is scoped by the trip's `namespace`, so two trips
+    booking the same activity on the same date get different codes (and codes are unique
+    within the confirmation). Booking times follow
+    the day's visit order, travel times and opening hours (LogisticsEngine.timetable).
+
+    :param itinerary: The DailyPlan list that was booked.
+    :param start_date: Trip start date ('YYYY-MM-DD'), used to match the outcomes' dates (the plans' dates without it).
+    :param namespace: The trip's booking namespace (see BookingDispatcher.idempotency_key), e.g. its trip id.
+    :param outcomes: The BookingOutcomes of the dispatch.
+    :param destination: The trip's destination (code prefix, POIs for the timetable).
+    :param kept: Earlier confirmations that stay as they are (e.g. after a re-plan); new bookings are timed around them.
+    :returns: The confirmations, day by day in booking-time order.
+    """
+    by_booking: Dict[Tuple[str, str], BookingOutcome] = {(o.activity_name, o.date): o for o in outcomes}
+    kept_by_name = {c.activity_name: c for c in kept}
+    taken = {c.confirmation_code for c in kept}
+    prefix = code_prefix(destination)
+    logistics = TravelTools.logistics()
+
+    details = []
+    for plan in itinerary:
+        date = SchedulerTools.calculate_itinerary_date(start_date, plan.day) if start_date else plan.date
+        slots = {name: slot for slot, name in reversed(list(enumerate(plan.activities)))}
+        fixed = {name: start for name in plan.activities
+                 if name in kept_by_name and (start := parse_time(kept_by_name[name].booking_time)) is not None}
+        for name, start in logistics.timetable(plan.activities, destination, fixed=fixed):
+            if name in kept_by_name:
+                details.append(kept_by_name[name])
+                continue
+            outcome = by_booking.get((name, date))
+            code = outcome.confirmation_code if outcome is not None else None
+            if not code or code in taken:
+                key = outcome.idempotency_key if outcome is not None else BookingDispatcher.idempotency_key(name, date, slots[name], namespace)
+                code = confirmation_code(prefix, key, taken)
+            taken.add(code)
+            details.append(ConfirmationDetails(
+                activity_name=name,
+                status="Confirmed" if outcome is not None and outcome.success else "Pending",
+                confirmation_code=code,
+                booking_time=format_time(start),
+            ))
+    return BookingConfirmation(total_cost_booked=confirmation_total(itinerary), confirmation_list=details)
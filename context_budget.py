@@ -0,0 +1,192 @@
+# Compact encoding of inter-agent context and per-stage input token budgets
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+from rate_limit import estimate_tokens
+
+# Input token budget of each agent's prompt (system + user), estimated at ~4 characters per token.
+DEFAULT_INPUT_BUDGETS: Dict[str, int] = {
+    "memory": 500,
+    "search": 150,
+    "investigate": 500,
+    "investigate_fused": 300,
+    "plan": 500,
+    "theme": 400,
+    "schedule": 800,
+}
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+_JSON_TYPES = {"string": "str", "number": "num", "integer": "int", "boolean": "bool", "null": "null"}
+
+def count_tokens(contents: Any) -> int:
+    """Estimated input tokens of a prompt (the same estimate the rate limiter reserves)."""
+    return estimate_tokens(contents)
+
+def parse_budgets(spec: str) -> Dict[str, int]:
+    """Parse "investigate=500,schedule=1200" into per-stage budgets."""
+    budgets = {}
+    for item in spec.split(","):
+        stage, _, value = item.partition("=")
+        if stage.strip() and value.strip():
+            budgets[stage.strip()] = int(value)
+    return budgets
+
+def compact_number(value: Any) -> str:
+    """45.0 -> "45", 12.499 -> "12.5"; anything else unchanged."""
+    return f"{round(value, 2):g}" if isinstance(value, float) else str(value)
+
+def encode_table(columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> str:
+    """
+    Encode records as a header line plus one "|"-separated line per record, e.g.
+    "name|cost|category\\nGiza Pyramids|45|History"; list cells are joined with "; ".
+    """
+    def cell(value: Any) -> str:
+        if isinstance(value, (list, tuple)):
+            return "; ".join(cell(item) for item in value)
+        return compact_number(value).replace("|", "/").replace("\n", " ")
+
+    return "\n".join(["|".join(columns), *("|".join(cell(value) for value in row) for row in rows)])
+
+def compact_schema(container: type[BaseModel]) -> str:
+    """
+    Type signature of a model's JSON shape, without titles and descriptions, e.g.
+    {proposals:[{activity_name:str,estimated_cost:num,category:str}]}.
+    """
+    schema = container.model_json_schema()
+    definitions = schema.get("$defs", {})
+
+    def render(node: Dict[str, Any]) -> str:
+        if "$ref" in node:
+            return render(definitions[node["$ref"].rsplit("/", 1)[-1]])
+        if "anyOf" in node:
+            return "|".join(render(option) for option in node["anyOf"])
+        if "enum" in node:
+            return "|".join(repr(value) for value in node["enum"])
+        if node.get("type") == "array":
+            return f"[{render(node.get('items', {}))}]"
+        if node.get("type") == "object" or "properties" in node:
+            return "{" + ",".join(f"{name}:{render(field)}" for name, field in node.get("properties", {}).items()) + "}"
+        return _JSON_TYPES.get(node.get("type"), "any")
+
+    return render(schema)
+
+def summarize_text(text: str, max_tokens: int, keywords: Sequence[str] = ()) -> str:
+    """
+    Extractive summary of free text within `max_tokens`: the sentences with prices or numbers and
+    with the most `keywords` are kept first, and the kept sentences stay in their original order.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    sentences = [sentence.strip() for sentence in _SENTENCE_BREAK.split(text) if sentence.strip()]
+    keys = [keyword.lower() for keyword in keywords if keyword]
+
+    def score(index: int) -> Tuple[int, int]:
+        sentence = sentences[index].lower()
+        return (-(2 * bool(re.search(r"[\d$€£]", sentence)) + sum(key in sentence for key in keys)), index)
+
+    kept, used = [], 0
+    for index in sorted(range(len(sentences)), key=score):
+        cost = count_tokens(sentences[index]) + 1
+        if used + cost <= max_tokens:
+            kept.append(index)
+            used += cost
+    if not kept:
+        return truncate_text(sentences[min(range(len(sentences)), key=score)] if sentences else text, max_tokens)
+    return " ".join(sentences[index] for index in sorted(kept))
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """Cut text at a word boundary to about `max_tokens`."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    return text[:max(0, max_tokens) * 4].rsplit(" ", 1)[0] + " …"
+
+class ContextBudget:
+    """
+    Per-stage input token budgets for the agents' prompts.
+
+    Prompt builders ask the budget to fit their variable payload (search summaries, memory
+    reports, activity and itinerary tables) into what the stage's budget leaves after the
+    fixed instructions: free text is summarized extractively, tables lose their last rows
+    unless every row is required (e.g. the itinerary to book). Every prompt is counted before
+    its call, so the statistics show the input tokens per stage and how often they were cut.
+    """
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None, enabled: bool = True):
+        """
+        :param budgets: Per-stage input token budgets (merged over DEFAULT_INPUT_BUDGETS); a stage without one is unbounded.
+        :param enabled: False leaves every payload whole (prompts are still counted).
+        """
+        self.budgets = {**DEFAULT_INPUT_BUDGETS, **(budgets or {})}
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _stage_stats(self, stage: str) -> Dict[str, int]:
+        # Caller holds the lock.
+        return self._stats.setdefault(stage, {"prompts": 0, "tokens": 0, "max_tokens": 0, "over_budget": 0,
+                                              "compacted": 0, "tokens_saved": 0})
+
+    def available(self, stage: str, used: Any = 0) -> Optional[int]:
+        """
+        Tokens left for the payload of a `stage` prompt, or None when there is no limit.
+
+        :param used: The rest of the prompt (contents or a token count), e.g. the system instructions.
+        """
+        budget = self.budgets.get(stage)
+        if budget is None or not self.enabled:
+            return None
+        return max(0, budget - (used if isinstance(used, int) else count_tokens(used)))
+
+    def _compacted(self, stage: str, before: str, after: str) -> str:
+        if after != before:
+            with self._lock:
+                stats = self._stage_stats(stage)
+                stats["compacted"] += 1
+                stats["tokens_saved"] += count_tokens(before) - count_tokens(after)
+        return after
+
+    def fit_text(self, stage: str, text: str, used: Any = 0, keywords: Sequence[str] = ()) -> str:
+        """Free-text payload, summarized when it does not fit the stage's budget."""
+        available = self.available(stage, used)
+        if available is None:
+            return text
+        return self._compacted(stage, text, summarize_text(text, available, keywords))
+
+    def fit_table(self, stage: str, columns: Sequence[str], rows: List[Sequence[Any]], used: Any = 0,
+                  required: bool = False) -> Tuple[str, int]:
+        """
+        Tabular payload (see encode_table), without the rows that do not fit unless `required`.
+
+        :returns: (table, number of rows kept).
+        """
+        table = encode_table(columns, rows)
+        available = self.available(stage, used)
+        if available is None or required or count_tokens(table) <= available:
+            return table, len(rows)
+        kept = len(rows)
+        while kept > 1 and count_tokens(encode_table(columns, rows[:kept])) > available:
+            kept -= 1
+        return self._compacted(stage, table, encode_table(columns, rows[:kept])), kept
+
+    def record(self, stage: str, contents: Any) -> int:
+        """Count a prompt about to be sent. :returns: Its estimated input tokens."""
+        tokens = count_tokens(contents)
+        budget = self.budgets.get(stage)
+        with self._lock:
+            stats = self._stage_stats(stage)
+            stats["prompts"] += 1
+            stats["tokens"] += tokens
+            stats["max_tokens"] = max(stats["max_tokens"], tokens)
+            if budget is not None and tokens > budget:
+                stats["over_budget"] += 1
+        return tokens
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per stage: prompts, total/mean/max input tokens, prompts over budget, payloads compacted and tokens saved."""
+        with self._lock:
+            return {stage: {**stats, "budget": self.budgets.get(stage),
+                            "mean_tokens": round(stats["tokens"] / stats["prompts"], 1) if stats["prompts"] else 0.0}
+                    for stage, stats in self._stats.items()}
@@ -0,0 +1,57 @@
+# Per-stage and end-to-end deadlines for the agent sequences
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Optional
+
+# Absolute deadline (time.monotonic()) of the work in the current task/thread, if any.
+current_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("current_deadline", default=None)
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Bound the enclosed block to `seconds` from now; an enclosing, earlier deadline still wins.
+    None leaves the current deadline unchanged.
+    """
+    if seconds is None:
+        yield
+        return
+    outer = current_deadline.get()
+    token = current_deadline.set(min(outer, time.monotonic() + seconds) if outer is not None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline (never negative), or None without a deadline."""
+    at = current_deadline.get()
+    return None if at is None else max(0.0, at - time.monotonic())
+
+def parse_deadlines(spec: str) -> Dict[str, float]:
+    """Parse "memory=30,investigate=90" into {"memory": 30.0, "investigate": 90.0}."""
+    deadlines = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            deadlines[name.strip()] = float(value)
+    return deadlines
+
+@dataclass
+class DeadlinePolicy:
+    """Deadlines in seconds of each stage (by name) and of a whole trip; missing entries mean no deadline."""
+    stages: Dict[str, float] = field(default_factory=dict)
+    trip: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "DeadlinePolicy":
+        """Read TRAVEL_STAGE_DEADLINES ("memory=30,investigate=90,...") and TRAVEL_TRIP_DEADLINE."""
+        return cls(
+            stages=parse_deadlines(os.environ.get("TRAVEL_STAGE_DEADLINES", "")),
+            trip=float(os.environ.get("TRAVEL_TRIP_DEADLINE") or 0) or None,
+        )
+
+    def for_stage(self, stage: str) -> Optional[float]:
+        return self.stages.get(stage)
@@ -0,0 +1,183 @@
+# Offline stand-in for genai.Client that replays recorded agent responses
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from google.genai import errors
+
+RECORDINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings", "gemini_responses.json")
+
+# Median latency (seconds) of a live call per agent; calls are drawn from a log-normal around it.
+DEFAULT_LATENCIES: Dict[str, float] = {
+    "memory": 2.0,
+    "search": 4.0,
+    "investigate": 3.0,
+    # One grounded request: the search plus a little extra generation, without a second round trip.
+    "investigate_fused": 4.5,
+    "plan": 3.0,
+    "theme": 1.0,
+    "schedule": 2.5,
+}
+
+# Streamed responses: the first chunk arrives after this share of the call's latency (the rest is
+# generation, spread evenly over the chunks), and each chunk carries about this many characters.
+FIRST_CHUNK_SHARE = 0.3
+STREAM_CHUNK_CHARS = 64
+
+def classify_prompt(contents: Any) -> str:
+    """Tell which agent sent a prompt, from the role line of its system prompt."""
+    text = " ".join(c if isinstance(c, str) else str(c) for c in (contents if isinstance(contents, list) else [contents]))
+    if "Memory Analyst Agent" in text:
+        return "memory"
+    if "Investigator Agent" in text:
+        return "investigate_fused" if "You have access to Google Search" in text else "investigate"
+    if "Logistics Planner Agent" in text:
+        return "theme" if "catchy theme" in text else "plan"
+    if "Scheduler Agent" in text:
+        return "schedule"
+    return "search"
+
+class FakeUsage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+class FakeResponse:
+    """The subset of GenerateContentResponse used by the agents."""
+
+    def __init__(self, text: str, prompt_tokens: int):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt_tokens, len(text) // 4)
+
+def _stream_chunks(text: str, prompt_tokens: int) -> List[FakeResponse]:
+    """Split a response into stream chunks; like the API, the last chunk carries the usage of the whole response."""
+    chunks = [FakeResponse(text[start:start + STREAM_CHUNK_CHARS], prompt_tokens)
+              for start in range(0, max(1, len(text)), STREAM_CHUNK_CHARS)]
+    for chunk in chunks[:-1]:
+        chunk.usage_metadata = None
+    chunks[-1].usage_metadata = FakeUsage(prompt_tokens, len(text) // 4)
+    return chunks
+
+class FakeModels:
+    """Replays recorded responses with simulated latency, server errors, throttling and malformed JSON."""
+
+    def __init__(self, recordings: Dict[str, List[str]], latencies: Dict[str, float], latency_sigma: float,
+                 time_scale: float, failure_rate: float, malformed_rate: float, seed: Optional[int],
+                 throttle_rate: float = 0.0, stall_rate: float = 0.0, stall_factor: float = 20.0):
+        self.recordings = recordings
+        self.latencies = latencies
+        self.latency_sigma = latency_sigma
+        self.time_scale = time_scale
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.throttle_rate = throttle_rate
+        self.stall_rate = stall_rate
+        self.stall_factor = stall_factor
+        self.calls: Dict[str, int] = {agent: 0 for agent in latencies}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self, contents: Any) -> tuple:
+        """Pick the agent's latency, outcome and response for one call."""
+        agent = classify_prompt(contents)
+        with self._lock:
+            self.calls[agent] = self.calls.get(agent, 0) + 1
+            latency = self.latencies.get(agent, 1.0) * self._random.lognormvariate(0.0, self.latency_sigma) * self.time_scale
+            if self.stall_rate and self._random.random() < self.stall_rate:
+                # A stuck call: the tail that hedging and deadlines are meant to cut.
+                latency *= self.stall_factor
+            roll = self._random.random()
+            options = self.recordings.get(agent) or ["{}"]
+            text = options[self._random.randrange(len(options))]
+        prompt_tokens = sum(len(str(c)) for c in (contents if isinstance(contents, list) else [contents])) // 4
+        if roll < self.failure_rate:
+            return latency, errors.ServerError(503, {"error": {"code": 503, "message": "Simulated overload.", "status": "UNAVAILABLE"}}), prompt_tokens
+        if roll < self.failure_rate + self.throttle_rate:
+            return latency, errors.ClientError(429, {"error": {"code": 429, "message": "Simulated quota exhaustion.", "status": "RESOURCE_EXHAUSTED"}}), prompt_tokens
+        if roll < self.failure_rate + self.throttle_rate + self.malformed_rate:
+            # Truncated output: the classic malformed-JSON failure.
+            text = text[: max(1, len(text) // 2)]
+        return latency, text, prompt_tokens
+
+    def generate_content(self, model: str = None, contents: Any = None, config: Any = None) -> FakeResponse:
+        latency, outcome, prompt_tokens = self._draw(contents)
+        time.sleep(latency)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome, prompt_tokens)
+
+    def generate_content_stream(self, model: str = None, contents: Any = None, config: Any = None) -> Iterator[FakeResponse]:
+        latency, outcome, prompt_tokens = self._draw(contents)
+        time.sleep(latency * FIRST_CHUNK_SHARE)
+        if isinstance(outcome, Exception):
+            raise outcome
+        chunks = _stream_chunks(outcome, prompt_tokens)
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep(latency * (1 - FIRST_CHUNK_SHARE) / (len(chunks) - 1))
+            yield chunk
+
+class FakeAsyncModels:
+    def __init__(self, models: FakeModels):
+        self._models = models
+
+    async def generate_content(self, model: str = None, contents: Any = None, config: Any = None) -> FakeResponse:
+        latency, outcome, prompt_tokens = self._models._draw(contents)
+        await asyncio.sleep(latency)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome, prompt_tokens)
+
+    async def generate_content_stream(self, model: str = None, contents: Any = None, config: Any = None) -> AsyncIterator[FakeResponse]:
+        latency, outcome, prompt_tokens = self._models._draw(contents)
+        await asyncio.sleep(latency * FIRST_CHUNK_SHARE)
+        if isinstance(outcome, Exception):
+            raise outcome
+        chunks = _stream_chunks(outcome, prompt_tokens)
+
+        async def _chunks() -> AsyncIterator[FakeResponse]:
+            for index, chunk in enumerate(chunks):
+                if index:
+                    await asyncio.sleep(latency * (1 - FIRST_CHUNK_SHARE) / (len(chunks) - 1))
+                yield chunk
+
+        return _chunks()
+
+class FakeAio:
+    def __init__(self, models: FakeModels):
+        self.models = FakeAsyncModels(models)
+
+class FakeGeminiClient:
+    """
+    Drop-in replacement for genai.Client (models and aio.models) that needs no API key or network.
+    Streamed calls (generate_content_stream) deliver the same response in chunks over the same latency.
+
+    :param recordings: Agent -> list of recorded response texts (defaults to recordings/gemini_responses.json).
+    :param latencies: Agent -> median latency in seconds (merged over DEFAULT_LATENCIES).
+    :param latency_sigma: Log-normal sigma of the latency distribution (0 for a fixed latency).
+    :param time_scale: Multiplier applied to every latency (e.g. 0.01 for quick runs).
+    :param failure_rate: Probability of a 503 ServerError per call.
+    :param malformed_rate: Probability of a truncated (invalid JSON) response per call.
+    :param seed: Seed of the random generator, for reproducible runs.
+    :param throttle_rate: Probability of a 429 ClientError (quota exhausted) per call.
+    :param stall_rate: Probability that a call is stuck for `stall_factor` times its usual latency.
+    :param stall_factor: Latency multiplier of a stuck call.
+    """
+
+    def __init__(self, recordings: Optional[Dict[str, List[str]]] = None, latencies: Optional[Dict[str, float]] = None,
+                 latency_sigma: float = 0.35, time_scale: float = 1.0, failure_rate: float = 0.0,
+                 malformed_rate: float = 0.0, seed: Optional[int] = 0, throttle_rate: float = 0.0,
+                 stall_rate: float = 0.0, stall_factor: float = 20.0):
+        if recordings is None:
+            with open(RECORDINGS_PATH, encoding="utf-8") as f:
+                recordings = json.load(f)
+        # The fused investigator answers with the same proposals JSON as the structuring call.
+        recordings = {**recordings, "investigate_fused": recordings.get("investigate_fused") or recordings.get("investigate", [])}
+        self.models = FakeModels(recordings, {**DEFAULT_LATENCIES, **(latencies or {})}, latency_sigma,
+                                 time_scale, failure_rate, malformed_rate, seed, throttle_rate, stall_rate, stall_factor)
+        self.aio = FakeAio(self.models)
@@ -0,0 +1,175 @@
+# Hedged model calls: a duplicate request once a call runs past the agent's observed p95
+import asyncio
+import contextvars
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+class Hedger:
+    """
+    Sends a second, identical request when a call is still running after the agent's observed
+    latency quantile (p95 by default) and returns whichever answers first.
+
+    Hedges are capped at `max_extra` of all calls (e.g. 0.1 = at most 10% extra load, about twice what a p95 trigger needs), and no
+    agent is hedged before `min_samples` latencies have been observed. Sync calls run on a
+    small thread pool, which also lets them honour a timeout; the losing request of a sync
+    hedge cannot be interrupted and finishes in the background.
+    """
+
+    def __init__(self, enabled: bool = False, quantile: float = 0.95, max_extra: float = 0.1, min_samples: int = 20,
+                 window: int = 200, min_delay: float = 0.05, max_workers: int = 32):
+        """
+        :param enabled: Send hedges at all (timeouts of sync calls apply either way).
+        :param quantile: Latency quantile after which a call is hedged.
+        :param max_extra: Maximum ratio of hedges to calls.
+        :param min_samples: Observed latencies an agent needs before its calls are hedged.
+        :param window: Number of recent latencies kept per agent.
+        :param min_delay: Lower bound of the hedging delay in seconds.
+        :param max_workers: Threads running sync calls that need a timeout or a hedge.
+        """
+        self.enabled = enabled
+        self.quantile = quantile
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_workers = max_workers
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def observe(self, agent: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies[agent].append(seconds)
+
+    def delay(self, agent: str) -> Optional[float]:
+        """Seconds after which a call of `agent` is hedged, or None when it is not hedged."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies[agent])
+        if len(samples) < self.min_samples:
+            return None
+        return max(self.min_delay, samples[int(self.quantile * (len(samples) - 1))])
+
+    def _claim_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.max_extra * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def _count_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def _won(self, span: Any) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+        if span is not None:
+            span.attributes["hedge_won"] = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"calls": self.calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                    "p95_s": {agent: round(sorted(s)[int(self.quantile * (len(s) - 1))], 4)
+                              for agent, s in self._latencies.items() if s}}
+
+    # ---- async -------------------------------------------------------------
+
+    async def _atimed(self, agent: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.perf_counter()
+        result = await factory()
+        self.observe(agent, time.perf_counter() - started)
+        return result
+
+    async def arun(self, agent: str, factory: Callable[[], Awaitable[Any]], span: Any = None) -> Any:
+        """Await `factory()`, hedged with a second `factory()` when it runs past the agent's delay."""
+        self._count_call()
+        delay = self.delay(agent)
+        if delay is None:
+            return await self._atimed(agent, factory)
+
+        tasks = [asyncio.ensure_future(self._atimed(agent, factory))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._claim_hedge():
+                if span is not None:
+                    span.attributes["hedged"] = True
+                tasks.append(asyncio.ensure_future(self._atimed(agent, factory)))
+
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self._won(span)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    # ---- sync --------------------------------------------------------------
+
+    def _submit(self, agent: str, fn: Callable[[], Any]) -> Future:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="model-call")
+            executor = self._executor
+
+        def _timed() -> Any:
+            started = time.perf_counter()
+            result = fn()
+            self.observe(agent, time.perf_counter() - started)
+            return result
+
+        # Each request runs in a copy of the caller's context (trip id, priority, deadline).
+        return executor.submit(contextvars.copy_context().run, _timed)
+
+    def call(self, agent: str, fn: Callable[[], Any], timeout: Optional[float] = None, span: Any = None) -> Any:
+        """
+        Blocking version of arun.
+
+        :param timeout: Seconds to wait for an answer before raising TimeoutError (None waits indefinitely).
+        """
+        self._count_call()
+        delay = self.delay(agent)
+        if delay is None and timeout is None:
+            started = time.perf_counter()
+            result = fn()
+            self.observe(agent, time.perf_counter() - started)
+            return result
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def _left() -> Optional[float]:
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        futures = [self._submit(agent, fn)]
+        if delay is not None:
+            done, _ = wait(futures, timeout=delay if deadline is None else min(delay, _left()))
+            if not done and (deadline is None or _left() > 0) and self._claim_hedge():
+                if span is not None:
+                    span.attributes["hedged"] = True
+                futures.append(self._submit(agent, fn))
+
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, timeout=_left(), return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"The {agent} model call did not answer within its deadline.")
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self._won(span)
+                    return future.result()
+                error = future.exception()
+        raise error
@@ -0,0 +1,233 @@
+# Spans, metrics and structured logging for the agents and tools
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+# Trip request the current task/thread is working on (set by the sequence runners).
+current_trip: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_trip", default=None)
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_logger = logging.getLogger("travel")
+
+@dataclass
+class Span:
+    """One timed unit of work: a model call ("model"), a tool call ("tool") or a sequence stage ("stage")."""
+    kind: str
+    name: str
+    trip_id: Optional[str] = None
+    start: float = 0.0
+    duration_s: float = 0.0
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    retries: int = 0
+    validation_failures: int = 0
+    cache_hit: bool = False
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def record_usage(self, response: Any) -> None:
+        """Add the token counts of a generate_content response (usage_metadata) to the span."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.prompt_tokens += getattr(usage, "prompt_token_count", None) or 0
+            self.response_tokens += getattr(usage, "candidates_token_count", None) or 0
+
+class Tracer:
+    """
+    Collects spans per trip request and keeps running aggregates for a Prometheus-style snapshot.
+
+    Finished spans are kept in a bounded buffer (for export_jsonl) and, when `sink_path` is set,
+    appended to that JSONL file as they finish.
+    """
+
+    def __init__(self, max_spans: int = 100_000, sink_path: Optional[str] = None, sink_env: Optional[str] = None):
+        """
+        :param max_spans: Finished spans kept in memory.
+        :param sink_path: JSONL file the finished spans are appended to.
+        :param sink_env: Environment variable holding the sink path when `sink_path` is not given; it is read
+            when the first span finishes, after the .env file is loaded.
+        """
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+        self.sink_path = sink_path
+        self._sink_env = sink_env
+        self._lock = threading.Lock()
+        self._span_counts: Dict[tuple, int] = defaultdict(int)
+        self._counters: Dict[tuple, int] = defaultdict(int)
+        self._durations: Dict[tuple, float] = defaultdict(float)
+        self._buckets: Dict[tuple, List[int]] = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+
+    @contextmanager
+    def span(self, kind: str, name: str, **attributes: Any) -> Iterator[Span]:
+        """Time the enclosed block as a span; exceptions are recorded on the span and re-raised."""
+        span = Span(kind=kind, name=name, trip_id=current_trip.get(), start=time.time(), attributes=attributes)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration_s = time.perf_counter() - started
+            self.finish(span)
+
+    def finish(self, span: Span) -> None:
+        if self._sink_env is not None:
+            if self.sink_path is None:
+                self.sink_path = _environment(self._sink_env) or None
+            self._sink_env = None
+        with self._lock:
+            self.spans.append(span)
+            labels = (span.kind, span.name)
+            self._span_counts[(*labels, "error" if span.error else "ok")] += 1
+            self._durations[labels] += span.duration_s
+            self._counters[("prompt_tokens", *labels)] += span.prompt_tokens
+            self._counters[("response_tokens", *labels)] += span.response_tokens
+            self._counters[("retries", *labels)] += span.retries
+            self._counters[("validation_failures", *labels)] += span.validation_failures
+            self._counters[("cache_hits", *labels)] += int(span.cache_hit)
+            buckets = self._buckets[labels]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if span.duration_s <= bound:
+                    buckets[i] += 1
+            if self.sink_path:
+                with open(self.sink_path, "a", encoding="utf-8") as sink:
+                    sink.write(json.dumps(asdict(span), ensure_ascii=False, default=str) + "\n")
+        if _structured_logging():
+            _logger.info(json.dumps({"event": "span", **asdict(span)}, ensure_ascii=False, default=str))
+
+    def reset(self) -> None:
+        """Forget every span and aggregate (e.g. between benchmark runs)."""
+        with self._lock:
+            self.spans.clear()
+            self._span_counts.clear()
+            self._counters.clear()
+            self._durations.clear()
+            self._buckets.clear()
+
+    def trip_spans(self, trip_id: str) -> List[Span]:
+        with self._lock:
+            return [span for span in self.spans if span.trip_id == trip_id]
+
+    def export_jsonl(self, path: str) -> int:
+        """Write the buffered spans to a JSONL file. :returns: The number of spans written."""
+        with self._lock:
+            spans = list(self.spans)
+        with open(path, "w", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(asdict(span), ensure_ascii=False, default=str) + "\n")
+        return len(spans)
+
+    def prometheus_text(self) -> str:
+        """Snapshot of the aggregates in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            span_counts = dict(self._span_counts)
+            counters = dict(self._counters)
+            durations = dict(self._durations)
+            buckets = {labels: list(values) for labels, values in self._buckets.items()}
+
+        lines += ["# HELP travel_span_duration_seconds Wall time of model calls, tool calls and stages.",
+                  "# TYPE travel_span_duration_seconds histogram"]
+        for (kind, name), values in sorted(buckets.items()):
+            label = f'kind="{kind}",name="{name}"'
+            total = span_counts.get((kind, name, "ok"), 0) + span_counts.get((kind, name, "error"), 0)
+            for bound, count in zip(LATENCY_BUCKETS, values):
+                lines.append(f'travel_span_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'travel_span_duration_seconds_bucket{{{label},le="+Inf"}} {total}')
+            lines.append(f"travel_span_duration_seconds_sum{{{label}}} {durations.get((kind, name), 0.0):.6f}")
+            lines.append(f"travel_span_duration_seconds_count{{{label}}} {total}")
+
+        lines += ["# HELP travel_spans_total Finished spans by status.", "# TYPE travel_spans_total counter"]
+        for (kind, name, status), count in sorted(span_counts.items()):
+            lines.append(f'travel_spans_total{{kind="{kind}",name="{name}",status="{status}"}} {count}')
+
+        for metric, help_text in (
+            ("prompt_tokens", "Prompt tokens reported in usage metadata."),
+            ("response_tokens", "Response tokens reported in usage metadata."),
+            ("retries", "Retried model calls."),
+            ("validation_failures", "Responses that failed schema validation."),
+            ("cache_hits", "Model calls answered from a cache."),
+        ):
+            lines += [f"# HELP travel_{metric}_total {help_text}", f"# TYPE travel_{metric}_total counter"]
+            for (_, kind, name), count in sorted((k, v) for k, v in counters.items() if k[0] == metric):
+                lines.append(f'travel_{metric}_total{{kind="{kind}",name="{name}"}} {count}')
+
+        return "\n".join(lines) + "\n"
+
+def traced_tool(name: str) -> Callable:
+    """Decorator recording every call of a tool function as a "tool" span."""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span("tool", name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span("tool", name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def trip_context(trip_id: str) -> Iterator[None]:
+    """Attribute the spans and log lines of the enclosed block to `trip_id`."""
+    token = current_trip.set(trip_id)
+    try:
+        yield
+    finally:
+        current_trip.reset(token)
+
+def _environment(name: str) -> Optional[str]:
+    """A setting read from the environment once the .env file is loaded (see providers.load_environment)."""
+    from providers import load_environment
+
+    load_environment()
+    return os.environ.get(name)
+
+# Structured logging: None reads TRAVEL_LOG_FORMAT on first use, unless configure_logging is called first.
+_structured: Optional[bool] = None
+
+def _structured_logging() -> bool:
+    if _structured is None:
+        structured = _environment("TRAVEL_LOG_FORMAT") == "json"
+        # Loading the environment may already have logged (and so resolved the format).
+        if _structured is None:
+            configure_logging(structured)
+    return _structured
+
+def configure_logging(structured: bool) -> None:
+    """
+    Switch between the console progress messages (default) and structured logging, where every
+    message and finished span is logged as one JSON object through the "travel" logger.
+    """
+    global _structured
+    _structured = structured
+    if structured and not _logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+
+def emit(message: str) -> None:
+    """Report a progress message: printed to the console, or logged as JSON in structured mode."""
+    if _structured_logging():
+        _logger.info(json.dumps({"event": "message", "trip_id": current_trip.get(), "ts": time.time(), "message": message}, ensure_ascii=False))
+    else:
+        print(message)
+
+tracer = Tracer(sink_env="TRAVEL_TRACE_PATH")
@@ -0,0 +1,163 @@
+# Deterministic itinerary solver used by the Logistics Planner Agent
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from schemas import ActivityProposal, DailyPlan
+from TravelTools import SchedulerTools
+from instrumentation import traced_tool, emit
+
+# Matches the logistics guidance of 4 activities/day to keep travel time reasonable.
+DEFAULT_MAX_ACTIVITIES_PER_DAY = 4
+
+def label_theme(activities: List[ActivityProposal]) -> str:
+    """Build a short day theme from the dominant categories of its activities."""
+    if not activities:
+        return "Free day"
+    categories = [c for c, _ in Counter(a.category for a in activities).most_common(2)]
+    return f"{' & '.join(categories)} day"
+
+@traced_tool("itinerary_solver.solve_itinerary")
+def solve_itinerary(
+    proposals: List[ActivityProposal],
+    duration: int,
+    daily_budget: float,
+    start_date: Optional[str] = None,
+    max_activities_per_day: int = DEFAULT_MAX_ACTIVITIES_PER_DAY,
+    group_key: Callable[[ActivityProposal], str] = lambda p: p.category,
+) -> List[DailyPlan]:
+    """
+    Pack activity proposals into `duration` days without exceeding the daily budget.
+
+    First-fit decreasing with group affinity: activities are taken group by group (largest
+    groups first, most expensive first inside a group) and each goes to the day that already
+    holds its group, otherwise to the cheapest day it still fits in. Budget and per-day
+    activity limits are hard constraints; activities that fit nowhere are left out.
+
+    :param proposals: The activity proposals to schedule.
+    :param duration: Number of days of the trip.
+    :param daily_budget: Maximum total cost of a single day.
+    :param start_date: Trip start date ('YYYY-MM-DD'); used to fill DailyPlan.date.
+    :param max_activities_per_day: Maximum number of activities in a single day.
+    :param group_key: Groups activities that should share a day (category by default).
+    :returns: One DailyPlan per day (days without activities are "Free day").
+    """
+    groups: Dict[str, List[ActivityProposal]] = defaultdict(list)
+    for proposal in proposals:
+        groups[group_key(proposal)].append(proposal)
+
+    ordered = [
+        proposal
+        for key in sorted(groups, key=lambda k: (-len(groups[k]), -sum(p.estimated_cost for p in groups[k]), k))
+        for proposal in sorted(groups[key], key=lambda p: -p.estimated_cost)
+    ]
+
+    days: List[List[ActivityProposal]] = [[] for _ in range(max(0, duration))]
+    costs = [0.0] * len(days)
+    skipped = []
+
+    for proposal in ordered:
+        key = group_key(proposal)
+        candidates = [
+            i for i in range(len(days))
+            if len(days[i]) < max_activities_per_day and costs[i] + proposal.estimated_cost <= daily_budget
+        ]
+        if not candidates:
+            skipped.append(proposal.activity_name)
+            continue
+        # Prefer a day that already holds this group, then the cheapest day (spreads the load).
+        best = min(candidates, key=lambda i: (not any(group_key(p) == key for p in days[i]), costs[i], i))
+        days[best].append(proposal)
+        costs[best] += proposal.estimated_cost
+
+    if skipped:
+        emit(f"⚠️ Solver: {len(skipped)} activities did not fit the ${daily_budget} daily budget: {', '.join(skipped)}")
+
+    plans = []
+    for index, activities in enumerate(days):
+        day = index + 1
+        plans.append(DailyPlan(
+            day=day,
+            date=SchedulerTools.calculate_itinerary_date(start_date, day) if start_date else f"Day {day}",
+            theme=label_theme(activities),
+            activities=[a.activity_name for a in activities],
+            total_daily_cost=round(costs[index], 2),
+        ))
+    return plans
+
+@traced_tool("itinerary_solver.repair_itinerary")
+def repair_itinerary(
+    itinerary: List[DailyPlan],
+    proposals: List[ActivityProposal],
+    duration: int,
+    daily_budget: float,
+    start_date: Optional[str] = None,
+    removed: Iterable[str] = (),
+    max_activities_per_day: int = DEFAULT_MAX_ACTIVITIES_PER_DAY,
+    group_key: Callable[[ActivityProposal], str] = lambda p: p.category,
+) -> Tuple[List[DailyPlan], List[int]]:
+    """
+    Adapt an existing itinerary to changed constraints with as few changes as possible.
+
+    Days beyond `duration` are dropped (or empty days appended), the `removed` activities are
+    taken out, and a day over `daily_budget` loses its most expensive activities until it fits.
+    The proposals then left unscheduled (including those taken out) are placed like
+    solve_itinerary does, into days where they still fit. Days whose activities and date did
+    not change are returned as the same DailyPlan objects.
+
+    :param itinerary: The current itinerary.
+    :param proposals: Every activity that may be scheduled, with its cost (activities of the itinerary
+                      missing from it keep their share of their day's cost).
+    :param duration: The new number of days.
+    :param daily_budget: The new maximum total cost of a single day.
+    :param start_date: The new start date ('YYYY-MM-DD'); used to fill DailyPlan.date.
+    :param removed: Names of activities that must no longer be scheduled.
+    :returns: (the new itinerary, the numbers of the days that changed).
+    """
+    removed = set(removed)
+    by_name = {p.activity_name: p for p in proposals}
+    days: List[List[ActivityProposal]] = []
+    for index in range(max(0, duration)):
+        plan = itinerary[index] if index < len(itinerary) else None
+        names = [name for name in plan.activities if name not in removed] if plan else []
+        share = plan.total_daily_cost / len(plan.activities) if plan and plan.activities else 0.0
+        days.append([by_name.get(name) or ActivityProposal(activity_name=name, estimated_cost=share, category="Other")
+                     for name in names])
+
+    for activities in days:
+        while activities and sum(a.estimated_cost for a in activities) > daily_budget:
+            activities.remove(max(activities, key=lambda a: a.estimated_cost))
+
+    scheduled = {a.activity_name for activities in days for a in activities}
+    for proposal in sorted(proposals, key=lambda p: -p.estimated_cost):
+        if proposal.activity_name in scheduled or proposal.activity_name in removed:
+            continue
+        costs = [sum(a.estimated_cost for a in activities) for activities in days]
+        candidates = [
+            i for i in range(len(days))
+            if len(days[i]) < max_activities_per_day and costs[i] + proposal.estimated_cost <= daily_budget
+        ]
+        if not candidates:
+            continue
+        key = group_key(proposal)
+        best = min(candidates, key=lambda i: (not any(group_key(a) == key for a in days[i]), costs[i], i))
+        days[best].append(proposal)
+        scheduled.add(proposal.activity_name)
+
+    plans, changed = [], []
+    for index, activities in enumerate(days):
+        day = index + 1
+        date = SchedulerTools.calculate_itinerary_date(start_date, day) if start_date else f"Day {day}"
+        names = [a.activity_name for a in activities]
+        old = itinerary[index] if index < len(itinerary) else None
+        if old is not None and old.activities == names and old.date == date:
+            plans.append(old)
+            continue
+        plans.append(DailyPlan(
+            day=day,
+            date=date,
+            theme=old.theme if old is not None and old.activities == names else label_theme(activities),
+            activities=names,
+            total_daily_cost=round(sum(a.estimated_cost for a in activities), 2),
+        ))
+        changed.append(day)
+    return plans, changed
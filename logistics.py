@@ -0,0 +1,374 @@
+# Local logistics engine: POI coordinates, vectorized travel-time matrices, visit orders and areas
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from activity_catalog import normalize_key
+from context_budget import compact_number, encode_table
+from itinerary_solver import DEFAULT_MAX_ACTIVITIES_PER_DAY
+from schemas import ActivityProposal, DailyPlan
+
+DEFAULT_POI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "pois.json")
+EARTH_RADIUS_KM = 6371.0088
+
+# Booking timetable of a day (minutes after midnight): first start, evening openers and early closers,
+# slot rounding, and the visit and travel time assumed for activities without coordinates.
+DAY_START_MINUTES = 9 * 60
+EVENING_MINUTES = 17 * 60
+EARLY_CLOSING_MINUTES = 16 * 60
+SLOT_MINUTES = 15
+UNLOCATED_VISIT_MINUTES = 90
+UNLOCATED_LEG_MINUTES = 30
+
+def parse_hours(spec: Optional[str]) -> Tuple[int, int]:
+    """Opening hours "09:30-18:00" as (570, 1080) minutes after midnight; no hours means open all day."""
+    if not spec:
+        return 0, 24 * 60
+    opens, _, closes = spec.partition("-")
+
+    def minutes(clock: str) -> int:
+        hours, _, mins = clock.strip().partition(":")
+        return int(hours) * 60 + int(mins or 0)
+
+    return minutes(opens), minutes(closes)
+
+def haversine_matrix(coords: np.ndarray) -> np.ndarray:
+    """Great-circle distances (km) between every pair of (lat, lon) rows, computed in one vectorized pass."""
+    radians = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+    lat, lon = radians[:, 0], radians[:, 1]
+    half_dlat = (lat[None, :] - lat[:, None]) / 2
+    half_dlon = (lon[None, :] - lon[:, None]) / 2
+    a = np.sin(half_dlat) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(half_dlon) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def shortest_path_order(cost: np.ndarray, max_passes: int = 50) -> List[int]:
+    """
+    Visit order of an open path through every point (free start and end): nearest neighbour
+    from the most outlying point, then 2-opt until no segment reversal shortens the path.
+
+    Each 2-opt step scores every reversal of a start position in one vectorized pass, so a
+    few hundred points are ordered in milliseconds.
+    """
+    n = len(cost)
+    if n <= 2:
+        return list(range(n))
+    # A dummy node at distance 0 from every point turns the open path into a closed tour.
+    size = n + 1
+    padded = np.zeros((size, size))
+    padded[:n, :n] = cost
+
+    start = int(np.argmax(cost.sum(axis=1)))
+    tour, visited = [n, start], np.zeros(size, dtype=bool)
+    visited[[n, start]] = True
+    for _ in range(n - 1):
+        following = int(np.argmin(np.where(visited, np.inf, padded[tour[-1]])))
+        tour.append(following)
+        visited[following] = True
+
+    path = np.array(tour)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, size - 1):
+            js = np.arange(i + 1, size)
+            a, b, c, d = path[i - 1], path[i], path[js], path[(js + 1) % size]
+            delta = padded[a, c] + padded[b, d] - padded[a, b] - padded[c, d]
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                j = js[best]
+                path[i:j + 1] = path[i:j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return [int(point) for point in path[1:]]
+
+def path_cost(cost: np.ndarray, order: Sequence[int]) -> float:
+    """Total cost of visiting `order` (positions in `cost`) in sequence."""
+    return float(sum(cost[a, b] for a, b in zip(order, order[1:])))
+
+def cluster_points(km: np.ndarray, radius_km: float) -> Tuple[np.ndarray, List[int]]:
+    """
+    Leader clustering: points are taken densest first (most neighbours within `radius_km`), and
+    each joins the nearest area center within `radius_km` or becomes a new center.
+
+    :returns: (area label of each point, the center point of each area).
+    """
+    n = len(km)
+    density = (km <= radius_km).sum(axis=1)
+    labels = np.full(n, -1)
+    centers: List[int] = []
+    for point in np.lexsort((np.arange(n), -density)):
+        if centers:
+            distances = km[point, centers]
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= radius_km:
+                labels[point] = nearest
+                continue
+        labels[point] = len(centers)
+        centers.append(int(point))
+    return labels, centers
+
+class _Destination:
+    """The POIs of one destination and the lookups that map activity names onto them."""
+
+    def __init__(self, name: str, pois: List[Dict[str, Any]]):
+        self.name = name
+        self.names = [poi["name"] for poi in pois]
+        self.coords = np.array([(poi["lat"], poi["lon"]) for poi in pois], dtype=np.float64).reshape(-1, 2)
+        self.visit_minutes = np.array([float(poi.get("visit_minutes", 60)) for poi in pois])
+        self.hours = [parse_hours(poi.get("hours")) for poi in pois]
+        self.keys: Dict[str, int] = {}
+        self.word_sets: List[Tuple[frozenset, int]] = []
+        for index, poi in enumerate(pois):
+            for label in [poi["name"], *poi.get("aliases", [])]:
+                key = normalize_key(label)
+                if key:
+                    self.keys.setdefault(key, index)
+                    self.word_sets.append((frozenset(key.split()), index))
+        # Most specific labels first, so "Grand Egyptian Museum" wins over "Egyptian Museum".
+        self.word_sets.sort(key=lambda item: -len(item[0]))
+
+    def match(self, activity_name: str) -> Optional[int]:
+        """The POI an activity name refers to: an exact name or alias, else the longest one whose words it contains."""
+        key = normalize_key(activity_name)
+        if key in self.keys:
+            return self.keys[key]
+        words = set(key.split())
+        return next((index for label_words, index in self.word_sets if label_words <= words), None)
+
+class LogisticsEngine:
+    """
+    Travel logistics computed locally from POI coordinates instead of asked of the model.
+
+    Activity names are matched to the destination's POIs (by name, alias or contained words).
+    Each destination's full travel-time matrix is built once with a vectorized haversine pass
+    (road distance = great-circle distance x `detour`, at `speed_kmh`, plus `leg_minutes` per
+    leg) and kept in an LRU cache; requests only index into it. On top of the matrix the engine
+    orders each day's visits (nearest neighbour + 2-opt), splits activities into areas a short
+    hop apart, times a day's bookings against the opening hours, and writes the compact report
+    the LLM planner reads.
+    """
+
+    def __init__(self, pois: Optional[Dict[str, List[Dict[str, Any]]]] = None, speed_kmh: float = 18.0,
+                 detour: float = 1.3, leg_minutes: float = 10.0, area_radius_km: float = 1.5, max_cached: int = 32):
+        """
+        :param pois: Destination name ("Cairo, Egypt") -> its POIs ({name, lat, lon, visit_minutes, hours, aliases}).
+        :param speed_kmh: Average door-to-door city travel speed.
+        :param detour: Ratio of road to great-circle distance.
+        :param leg_minutes: Fixed minutes per leg (waiting, parking, walking in).
+        :param area_radius_km: Maximum distance of an activity from its area's center.
+        :param max_cached: Destination matrices kept in memory.
+        """
+        self.speed_kmh = speed_kmh
+        self.detour = detour
+        self.leg_minutes = leg_minutes
+        self.area_radius_km = area_radius_km
+        self.max_cached = max_cached
+        self._destinations: Dict[str, _Destination] = {}
+        self._matrices: "OrderedDict[str, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        for destination, destination_pois in (pois or {}).items():
+            self.add_destination(destination, destination_pois)
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_POI_PATH, **kwargs: Any) -> "LogisticsEngine":
+        """Engine over the POIs of a JSON file ({destination: [poi, ...]}); a missing file gives an empty engine."""
+        pois = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                pois = json.load(f)
+        return cls(pois, **kwargs)
+
+    @staticmethod
+    def _key(destination: str) -> str:
+        return normalize_key(destination.partition(",")[0])
+
+    def add_destination(self, destination: str, pois: List[Dict[str, Any]]) -> None:
+        """Add (or replace) the POIs of a destination; its cached matrix is dropped."""
+        key = self._key(destination)
+        with self._lock:
+            self._destinations[key] = _Destination(destination, pois)
+            self._matrices.pop(key, None)
+
+    def matrix(self, destination: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(km, travel minutes) between every pair of the destination's POIs, built on first use and cached."""
+        key = self._key(destination)
+        with self._lock:
+            if key in self._matrices:
+                self._matrices.move_to_end(key)
+                self.hits += 1
+                return self._matrices[key]
+            self.misses += 1
+            place = self._destinations[key]
+        km = haversine_matrix(place.coords)
+        minutes = km * (self.detour / self.speed_kmh * 60.0) + self.leg_minutes
+        np.fill_diagonal(minutes, 0.0)
+        with self._lock:
+            self._matrices[key] = (km, minutes)
+            while len(self._matrices) > self.max_cached:
+                self._matrices.popitem(last=False)
+        return km, minutes
+
+    def locate(self, names: Sequence[str], destination: Optional[str] = None) -> Tuple[Optional[str], Dict[str, int]]:
+        """
+        Match activity names to POIs. Without a destination, the one matching the most names is used; a
+        destination without POI data locates nothing rather than borrowing another city's POIs.
+
+        :returns: (destination key or None, activity name -> POI index) for the located names.
+        """
+        if destination:
+            key = self._key(destination)
+            candidates = [key] if key in self._destinations else []
+        else:
+            candidates = list(self._destinations)
+        best_key, best = None, {}
+        for candidate in candidates:
+            place = self._destinations[candidate]
+            located = {name: index for name in dict.fromkeys(names) if (index := place.match(name)) is not None}
+            if len(located) > len(best):
+                best_key, best = candidate, located
+        return best_key, best
+
+    def _located(self, names: Sequence[str], destination: Optional[str]) -> Tuple[Optional[str], List[str], List[int]]:
+        key, located = self.locate(names, destination)
+        ordered = [name for name in dict.fromkeys(names) if name in located]
+        return key, ordered, [located[name] for name in ordered]
+
+    def route(self, names: Sequence[str], destination: Optional[str] = None) -> Tuple[List[str], float]:
+        """
+        Shortest visit order of a day's activities.
+
+        :returns: (the names in visit order, unlocated ones last in their given order; travel minutes of the located legs).
+        """
+        key, located, indices = self._located(names, destination)
+        unlocated = [name for name in dict.fromkeys(names) if name not in set(located)]
+        if len(located) < 2:
+            return located + unlocated, 0.0
+        minutes = self.matrix(key)[1][np.ix_(indices, indices)]
+        order = shortest_path_order(minutes)
+        return [located[i] for i in order] + unlocated, path_cost(minutes, order)
+
+    def areas(self, names: Sequence[str], destination: Optional[str] = None) -> List[Tuple[str, List[str]]]:
+        """Located activities split into areas: (name of the area's center activity, its activities), largest area first."""
+        key, located, indices = self._located(names, destination)
+        if not located:
+            return []
+        km = self.matrix(key)[0][np.ix_(indices, indices)]
+        labels, centers = cluster_points(km, self.area_radius_km)
+        groups = [(located[center], [name for name, label in zip(located, labels) if label == area])
+                  for area, center in enumerate(centers)]
+        return sorted(groups, key=lambda group: -len(group[1]))
+
+    def group_key(self, destination: Optional[str], proposals: Sequence[ActivityProposal]) -> Callable[[ActivityProposal], str]:
+        """A group_key for the itinerary solver: the proposal's area when it is located, else its category."""
+        area_of = {name: f"area:{center}" for center, members in self.areas([p.activity_name for p in proposals], destination)
+                   for name in members}
+        return lambda proposal: area_of.get(proposal.activity_name, proposal.category)
+
+    def order_itinerary(self, destination: Optional[str], itinerary: List[DailyPlan]) -> List[DailyPlan]:
+        """The itinerary with each day's activities in visit order (days already in order are kept as they are)."""
+        ordered = []
+        for plan in itinerary:
+            activities = self.route(plan.activities, destination)[0] if len(plan.activities) > 2 else plan.activities
+            ordered.append(plan if activities == plan.activities else plan.model_copy(update={"activities": activities}))
+        return ordered
+
+    def timetable(self, names: Sequence[str], destination: Optional[str] = None, day_start: int = DAY_START_MINUTES,
+                  fixed: Optional[Dict[str, int]] = None) -> List[Tuple[str, int]]:
+        """
+        Start time (minutes after midnight) of each activity of a day.
+
+        Activities keep their visit order, except that those closing by 4 PM go first and those
+        opening at 5 PM or later go last. Each starts once the previous visit and the travel to it
+        are over, not before it opens, rounded up to the quarter hour. Activities in `fixed` keep
+        their start time, and the others are fitted into the gaps around them.
+
+        :returns: (activity name, start minute) in the order of the day.
+        """
+        key, located = self.locate(names, destination)
+        place = self._destinations[key] if key else None
+        minutes = self.matrix(key)[1] if place is not None and len(located) > 1 else None
+
+        def hours(name: str) -> Tuple[int, int]:
+            return place.hours[located[name]] if name in located else (0, 24 * 60)
+
+        def visit(name: str) -> float:
+            return float(place.visit_minutes[located[name]]) if name in located else UNLOCATED_VISIT_MINUTES
+
+        def leg(origin: Optional[str], name: str) -> float:
+            if origin is None:
+                return 0.0
+            if origin in located and name in located:
+                return float(minutes[located[origin], located[name]])
+            return UNLOCATED_LEG_MINUTES
+
+        fixed = {name: start for name, start in (fixed or {}).items() if name in names}
+        pinned = sorted((start, name) for name, start in fixed.items())
+        free = sorted((name for name in names if name not in fixed),
+                      key=lambda name: (hours(name)[0] >= EVENING_MINUTES) - (hours(name)[1] <= EARLY_CLOSING_MINUTES))
+
+        schedule, clock, previous = [], day_start, None
+        while free or pinned:
+            if free:
+                name = free[0]
+                start = -(-max(clock + leg(previous, name), hours(name)[0]) // SLOT_MINUTES) * SLOT_MINUTES
+                if not pinned or start + visit(name) + leg(name, pinned[0][1]) <= pinned[0][0]:
+                    schedule.append((name, int(start)))
+                    clock, previous = start + visit(name), free.pop(0)
+                    continue
+            start, name = pinned.pop(0)
+            schedule.append((name, start))
+            clock, previous = max(clock, start + visit(name)), name
+        return schedule
+
+    def report(self, names: Sequence[str], destination: Optional[str] = None,
+               max_per_day: int = DEFAULT_MAX_ACTIVITIES_PER_DAY) -> str:
+        """
+        Compact logistics report for the planner: one row per area with its activities in visit
+        order, their visit and travel minutes and the nearest other area, then the unlocated activities.
+        """
+        names = list(dict.fromkeys(names))
+        key, located, indices = self._located(names, destination)
+        if not located:
+            return (f"Logistics Report: no coordinates for these activities. Group them by category, "
+                    f"at most {max_per_day} activities/day.")
+
+        km, minutes = (matrix[np.ix_(indices, indices)] for matrix in self.matrix(key))
+        position = {name: i for i, name in enumerate(located)}
+        visit = self._destinations[key].visit_minutes[indices]
+        labels, centers = cluster_points(km, self.area_radius_km)
+
+        rows = []
+        for area, center in enumerate(centers):
+            members = [i for i in range(len(located)) if labels[i] == area]
+            order = [members[i] for i in shortest_path_order(minutes[np.ix_(members, members)])]
+            others = [c for c in centers if c != center]
+            nearest = min(others, key=lambda c: minutes[center, c]) if others else None
+            rows.append((
+                located[center],
+                [located[i] for i in order],
+                compact_number(float(visit[members].sum())),
+                compact_number(round(path_cost(minutes, order))),
+                f"{located[nearest]} {compact_number(round(float(minutes[center, nearest])))}" if nearest is not None else "-",
+            ))
+        rows.sort(key=lambda row: -len(row[1]))
+
+        unlocated = [name for name in names if name not in position]
+        lines = [
+            f"Logistics Report ({self._destinations[key].name}; minutes by road at {compact_number(self.speed_kmh)} km/h "
+            f"+{compact_number(self.leg_minutes)} min per leg). Keep each area on one day, at most {max_per_day} activities/day:",
+            encode_table(("area", "activities_in_order", "visit_min", "travel_min", "nearest_area_min"), rows),
+        ]
+        if unlocated:
+            lines.append(f"No coordinates (group by category): {'; '.join(unlocated)}")
+        return "\n".join(lines)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"destinations": len(self._destinations), "pois": sum(len(d.names) for d in self._destinations.values()),
+                    "matrices_cached": len(self._matrices), "matrix_hits": self.hits, "matrix_misses": self.misses}
@@ -0,0 +1,214 @@
+# Long-term trip memory: per-user trip history in SQLite with incremental aggregates and a similarity index
+import json
+import math
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SEASONS = ("Winter", "Spring", "Summer", "Autumn")
+
+# Soft buckets (Gaussian bumps) for trip length in days and spend per day in USD, so that
+# cosine similarity rewards trips of a *similar* length/spend rather than a larger one.
+_DURATION_CENTERS = np.array([2, 4, 7, 10, 14, 21], dtype=np.float32)
+_SPEND_CENTERS = np.log(np.array([50, 100, 200, 400, 800], dtype=np.float32))
+_INTEREST_DIMS = 32
+
+# Weights of the feature groups in the similarity score.
+_WEIGHTS = {"interests": 1.0, "season": 0.5, "duration": 0.6, "spend": 0.6}
+
+FEATURE_DIMS = _INTEREST_DIMS + len(SEASONS) + len(_DURATION_CENTERS) + len(_SPEND_CENTERS)
+
+def season_of(date_str: str) -> Optional[str]:
+    """Season (northern hemisphere) of a 'YYYY-MM-DD' date, or None if it cannot be parsed."""
+    try:
+        month = int(date_str.split("-")[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+    return SEASONS[(month % 12) // 3]
+
+def _soft_bucket(value: float, centers: np.ndarray, width: float) -> np.ndarray:
+    return np.exp(-((centers - value) / width) ** 2)
+
+def encode_trip(duration: Optional[float], interests: List[str], season: Optional[str] = None, daily_spend: Optional[float] = None) -> np.ndarray:
+    """
+    Encode a trip (or a new request) as a unit-length feature vector.
+
+    Unknown fields are left as zeros, so they do not influence the similarity.
+    """
+    vector = np.zeros(FEATURE_DIMS, dtype=np.float32)
+    offset = 0
+
+    for interest in interests:
+        vector[zlib.crc32(interest.strip().lower().encode("utf-8")) % _INTEREST_DIMS] += 1.0
+    if interests:
+        vector[:_INTEREST_DIMS] *= _WEIGHTS["interests"] / math.sqrt(len(interests))
+    offset += _INTEREST_DIMS
+
+    if season in SEASONS:
+        vector[offset + SEASONS.index(season)] = _WEIGHTS["season"]
+    offset += len(SEASONS)
+
+    if duration:
+        vector[offset:offset + len(_DURATION_CENTERS)] = _WEIGHTS["duration"] * _soft_bucket(duration, _DURATION_CENTERS, 2.5)
+    offset += len(_DURATION_CENTERS)
+
+    if daily_spend and daily_spend > 0:
+        vector[offset:] = _WEIGHTS["spend"] * _soft_bucket(math.log(daily_spend), _SPEND_CENTERS, 0.5)
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class _UserIndex:
+    """Growable matrix of the unit feature vectors of one user's trips."""
+
+    def __init__(self, capacity: int = 64):
+        self.vectors = np.zeros((capacity, FEATURE_DIMS), dtype=np.float32)
+        self.trip_ids = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+
+    def add(self, trip_id: int, vector: np.ndarray) -> None:
+        if self.size == len(self.trip_ids):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+            self.trip_ids = np.concatenate([self.trip_ids, np.zeros_like(self.trip_ids)])
+        self.vectors[self.size] = vector
+        self.trip_ids[self.size] = trip_id
+        self.size += 1
+
+    def top_k(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        if self.size == 0 or k <= 0:
+            return []
+        scores = self.vectors[:self.size] @ query
+        k = min(k, self.size)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(self.trip_ids[i]), float(scores[i])) for i in best]
+
+class TripMemoryStore:
+    """
+    Per-user trip history backed by SQLite.
+
+    Aggregates (spend count/sum/sum of squares/min/max, interest and season frequencies) are
+    updated incrementally on every insert, so reports never scan the history. Similar trips
+    are retrieved from an in-memory vector index built once per user and extended on insert.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        """:param path: SQLite file of the store (":memory:" for a throwaway store)."""
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, _UserIndex] = {}
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS trips (
+                trip_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, destination TEXT,
+                duration INTEGER, budget_spent REAL, interests TEXT, season TEXT);
+            CREATE INDEX IF NOT EXISTS trips_by_user ON trips (user_id);
+            CREATE TABLE IF NOT EXISTS spend_stats (
+                user_id TEXT PRIMARY KEY, trip_count INTEGER, total REAL, total_sq REAL, min_spent REAL, max_spent REAL);
+            CREATE TABLE IF NOT EXISTS interest_counts (
+                user_id TEXT, interest TEXT, count INTEGER, PRIMARY KEY (user_id, interest));
+            CREATE TABLE IF NOT EXISTS season_counts (
+                user_id TEXT, season TEXT, count INTEGER, PRIMARY KEY (user_id, season));
+            """
+        )
+        self._db.commit()
+
+    def add_trip(self, user_id: str, destination: str, duration: int, budget_spent: float, interests: List[str], season: Optional[str]) -> int:
+        """Record a past trip and update the user's aggregates and index. :returns: The new trip id."""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO trips (user_id, destination, duration, budget_spent, interests, season) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, destination, duration, budget_spent, json.dumps(interests, ensure_ascii=False), season),
+            )
+            trip_id = cursor.lastrowid
+            self._db.execute(
+                "INSERT INTO spend_stats VALUES (?, 1, ?, ?, ?, ?) ON CONFLICT (user_id) DO UPDATE SET "
+                "trip_count = trip_count + 1, total = total + excluded.total, total_sq = total_sq + excluded.total_sq, "
+                "min_spent = MIN(min_spent, excluded.min_spent), max_spent = MAX(max_spent, excluded.max_spent)",
+                (user_id, budget_spent, budget_spent * budget_spent, budget_spent, budget_spent),
+            )
+            self._db.executemany(
+                "INSERT INTO interest_counts VALUES (?, ?, 1) ON CONFLICT (user_id, interest) DO UPDATE SET count = count + 1",
+                [(user_id, interest) for interest in dict.fromkeys(interests)],
+            )
+            if season:
+                self._db.execute(
+                    "INSERT INTO season_counts VALUES (?, ?, 1) ON CONFLICT (user_id, season) DO UPDATE SET count = count + 1",
+                    (user_id, season),
+                )
+            self._db.commit()
+
+            if user_id in self._indexes:
+                self._indexes[user_id].add(trip_id, encode_trip(duration, interests, season, budget_spent / max(duration, 1)))
+            return trip_id
+
+    def trip_count(self, user_id: str) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT trip_count FROM spend_stats WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def aggregates(self, user_id: str, top_n: int = 3) -> Dict[str, Any]:
+        """Spend statistics and the `top_n` interests/seasons of a user, read from the aggregate tables."""
+        with self._lock:
+            stats = self._db.execute(
+                "SELECT trip_count, total, total_sq, min_spent, max_spent FROM spend_stats WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            interests = self._db.execute(
+                "SELECT interest, count FROM interest_counts WHERE user_id = ? ORDER BY count DESC, interest LIMIT ?", (user_id, top_n)
+            ).fetchall()
+            seasons = self._db.execute(
+                "SELECT season, count FROM season_counts WHERE user_id = ? ORDER BY count DESC, season LIMIT ?", (user_id, top_n)
+            ).fetchall()
+
+        if not stats:
+            return {"trip_count": 0, "avg_spent": 0.0, "std_spent": 0.0, "min_spent": 0.0, "max_spent": 0.0,
+                    "top_interests": [], "top_seasons": []}
+        count, total, total_sq, min_spent, max_spent = stats
+        mean = total / count
+        return {
+            "trip_count": count,
+            "avg_spent": mean,
+            "std_spent": math.sqrt(max(total_sq / count - mean * mean, 0.0)),
+            "min_spent": min_spent,
+            "max_spent": max_spent,
+            "top_interests": interests,
+            "top_seasons": seasons,
+        }
+
+    def similar_trips(self, user_id: str, duration: Optional[int], interests: List[str], season: Optional[str] = None,
+                      daily_spend: Optional[float] = None, top_k: int = 3) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Retrieve the user's `top_k` past trips most similar to a new request.
+
+        :returns: (trip, similarity) pairs, most similar first; `trip` has the stored trip fields.
+        """
+        with self._lock:
+            index = self._indexes.get(user_id) or self._build_index(user_id)
+            matches = index.top_k(encode_trip(duration, interests, season, daily_spend), top_k)
+            if not matches:
+                return []
+            ids = [trip_id for trip_id, _ in matches]
+            rows = self._db.execute(
+                f"SELECT trip_id, destination, duration, budget_spent, interests, season FROM trips "
+                f"WHERE trip_id IN ({', '.join('?' * len(ids))})", ids,
+            ).fetchall()
+
+        trips = {
+            row[0]: {"trip_id": row[0], "destination": row[1], "duration": row[2], "budget_spent": row[3],
+                     "interests": json.loads(row[4]), "season": row[5]}
+            for row in rows
+        }
+        return [(trips[trip_id], score) for trip_id, score in matches if trip_id in trips]
+
+    def _build_index(self, user_id: str) -> _UserIndex:
+        # Caller holds the lock.
+        index = _UserIndex()
+        for trip_id, duration, budget_spent, interests, season in self._db.execute(
+            "SELECT trip_id, duration, budget_spent, interests, season FROM trips WHERE user_id = ? ORDER BY trip_id", (user_id,)
+        ):
+            index.add(trip_id, encode_trip(duration, json.loads(interests), season, budget_spent / max(duration or 1, 1)))
+        self._indexes[user_id] = index
+        return index
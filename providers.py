@@ -0,0 +1,77 @@
+# Lazily built, shared dependencies of the agents (Gemini client, caches, stores)
+import os
+import threading
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+from instrumentation import emit
+
+T = TypeVar("T")
+
+_env_lock = threading.Lock()
+_env_loaded = False
+
+def load_environment() -> None:
+    """Load the .env file and check the API key, once per process (on first use, not at import)."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if _env_loaded:
+            return
+        try:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            os.environ["GOOGLE_API_KEY"] = os.environ.get("GOOGLE_API_KEY")
+            message = "✅ Gemini API key setup complete."
+        except Exception as e:
+            message = f"🔑 Authentication Error: Please make sure you have added 'GOOGLE_API_KEY' to your Kaggle secrets. Details: {e}"
+        _env_loaded = True
+    # Outside the lock: the first message reads the log format, which loads the environment.
+    emit(message)
+
+class Provider(Generic[T]):
+    """
+    A shared dependency built by `factory` on first use, then reused by every caller and thread.
+
+    `set` replaces the value (e.g. with a fake client in benchmarks) and `reset` drops it, so the
+    next `get` builds it again.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._value: Optional[T] = None
+        self._built = False
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    load_environment()
+                    self._value = self._factory()
+                    self._built = True
+        return self._value
+
+    def set(self, value: T) -> None:
+        with self._lock:
+            self._value = value
+            self._built = True
+
+    def reset(self) -> None:
+        with self._lock:
+            self._value = None
+            self._built = False
+
+def build_gemini_client() -> Any:
+    """Create the genai.Client (the google-genai import is deferred to here); None when it cannot be created."""
+    try:
+        from google import genai
+
+        return genai.Client()
+    except Exception:
+        emit("⚠️ WARNING: Google GenAI Client not initialized. Check your API Key.")
+        return None
+
+# The Gemini client shared by all agents; pass `client=` to an agent to use another one.
+client_provider: Provider[Any] = Provider(build_gemini_client)
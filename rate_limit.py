@@ -0,0 +1,293 @@
+# Shared rate limiter and retry policy for the Gemini calls
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from deadlines import remaining
+
+# Priorities of queued calls: interactive requests are served before batch ones.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# Error codes worth retrying: throttling and transient server errors.
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+# Priority of the calls made by the current task/thread (set with request_priority).
+current_priority: contextvars.ContextVar[int] = contextvars.ContextVar("current_priority", default=PRIORITY_INTERACTIVE)
+
+@contextmanager
+def request_priority(priority: int) -> Iterator[None]:
+    """Queue the model calls of the enclosed block (and the tasks it starts) at `priority`."""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+def is_retryable(error: BaseException) -> bool:
+    """Throttling (429), transient server errors (5xx, 408) and dropped connections are retried."""
+    return getattr(error, "code", None) in RETRYABLE_CODES or isinstance(error, (ConnectionError, TimeoutError))
+
+def estimate_tokens(contents: Any) -> int:
+    """Rough token count of a prompt (~4 characters per token), used to reserve tokens-per-minute quota."""
+    parts = contents if isinstance(contents, list) else [contents]
+    return max(1, sum(len(part if isinstance(part, str) else str(part)) for part in parts) // 4)
+
+class _Bucket:
+    """Token bucket refilled continuously at `per_minute / 60` per second, holding at most one minute of quota."""
+
+    def __init__(self, per_minute: Optional[float]):
+        self.capacity = float(per_minute) if per_minute else None
+        self.level = self.capacity or 0.0
+        self.rate = (self.capacity or 0.0) / 60.0
+
+    def refill(self, elapsed: float) -> None:
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + elapsed * self.rate)
+
+    def clamp(self, amount: float) -> float:
+        return amount if self.capacity is None else min(amount, self.capacity)
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 when it already is)."""
+        if self.capacity is None or self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "queued_at")
+
+    def __init__(self, priority: int, seq: int, tokens: float):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.queued_at = time.perf_counter()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets shared by every model call, sync or async.
+
+    Calls wait in one priority queue (interactive before batch, FIFO within a priority) and only
+    the head of the queue may take quota, so batch traffic cannot starve interactive requests.
+    Throttled or transiently failing calls are retried with exponential backoff and jitter; a
+    429 also pauses the whole queue for a cooldown that grows with consecutive throttles and
+    resets on the next success, so all callers back off together instead of hammering the quota.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_retries: int = 4, backoff: float = 1.0, max_backoff: float = 30.0):
+        """
+        :param requests_per_minute: Request quota (None for no limit).
+        :param tokens_per_minute: Token quota, prompt plus response (None for no limit).
+        :param max_retries: Retries per call on throttling or transient errors.
+        :param backoff: Base delay in seconds of the exponential backoff.
+        :param max_backoff: Upper bound of a single backoff delay.
+        """
+        self.requests = _Bucket(requests_per_minute)
+        self.tokens = _Bucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._throttle_level = 0
+        self._stats = {"granted": 0, "retries": 0, "throttled": 0, "failed": 0, "wait_s": 0.0, "max_wait_s": 0.0}
+
+    # ---- queue -------------------------------------------------------------
+
+    def _enqueue(self, tokens: float, priority: Optional[int]) -> _Waiter:
+        waiter = _Waiter(current_priority.get() if priority is None else priority, next(self._seq),
+                         self.tokens.clamp(tokens))
+        with self._lock:
+            heapq.heappush(self._queue, waiter)
+        return waiter
+
+    def _poll(self, waiter: _Waiter) -> float:
+        """Grant the quota to `waiter` if it heads the queue and the buckets allow; otherwise the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now - self._refilled_at)
+            self.tokens.refill(now - self._refilled_at)
+            self._refilled_at = now
+
+            head = self._queue[0]
+            delay = max(self._paused_until - now, self.requests.wait_for(1), self.tokens.wait_for(head.tokens))
+            if head is not waiter or delay > 0:
+                # Waiters behind the head re-check shortly after it can go.
+                return max(delay, 0.001)
+
+            heapq.heappop(self._queue)
+            if self.requests.capacity is not None:
+                self.requests.level -= 1
+            if self.tokens.capacity is not None:
+                self.tokens.level -= waiter.tokens
+            waited = time.perf_counter() - waiter.queued_at
+            self._stats["granted"] += 1
+            self._stats["wait_s"] += waited
+            self._stats["max_wait_s"] = max(self._stats["max_wait_s"], waited)
+            return 0.0
+
+    def _leave(self, waiter: _Waiter) -> None:
+        """Remove a waiter that gave up (e.g. a cancelled task)."""
+        with self._lock:
+            if waiter in self._queue:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+
+    def acquire(self, tokens: float = 1, priority: Optional[int] = None) -> float:
+        """Block until the call may go. :returns: The seconds spent waiting."""
+        waiter = self._enqueue(tokens, priority)
+        try:
+            while (delay := self._poll(waiter)) > 0:
+                time.sleep(delay)
+        except BaseException:
+            self._leave(waiter)
+            raise
+        return time.perf_counter() - waiter.queued_at
+
+    async def aacquire(self, tokens: float = 1, priority: Optional[int] = None) -> float:
+        """Async version of acquire."""
+        waiter = self._enqueue(tokens, priority)
+        try:
+            while (delay := self._poll(waiter)) > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._leave(waiter)
+            raise
+        return time.perf_counter() - waiter.queued_at
+
+    def settle(self, reserved: float, response: Any) -> None:
+        """Correct the token bucket with the usage the response actually reported."""
+        usage = getattr(response, "usage_metadata", None)
+        used = (getattr(usage, "prompt_token_count", None) or 0) + (getattr(usage, "candidates_token_count", None) or 0)
+        if used and self.tokens.capacity is not None:
+            with self._lock:
+                self.tokens.level -= used - self.tokens.clamp(reserved)
+
+    # ---- retries -----------------------------------------------------------
+
+    def _on_success(self) -> None:
+        with self._lock:
+            self._throttle_level = 0
+
+    def _retry_delay(self, attempt: int, error: BaseException) -> float:
+        """Backoff before retry `attempt`; a 429 also pauses the whole queue for the same cooldown."""
+        delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1))) * (0.5 + random.random())
+        with self._lock:
+            self._stats["retries"] += 1
+            if getattr(error, "code", None) == 429:
+                self._stats["throttled"] += 1
+                self._throttle_level += 1
+                cooldown = min(self.max_backoff, self.backoff * (2 ** (self._throttle_level - 1))) * (0.5 + random.random())
+                self._paused_until = max(self._paused_until, time.monotonic() + cooldown)
+                delay = max(delay, cooldown)
+        return delay
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        """The delay before retry `attempt`, cut short at the caller's deadline (where the retry then gives up)."""
+        delay = self._retry_delay(attempt, error)
+        left = remaining()
+        return delay if left is None else min(delay, left)
+
+    def _give_up(self, error: BaseException, attempt: int) -> bool:
+        # No retry once the caller's deadline (see deadlines.deadline) has passed.
+        left = remaining()
+        if not is_retryable(error) or attempt > self.max_retries or left == 0:
+            with self._lock:
+                self._stats["failed"] += 1
+            return True
+        return False
+
+    def call(self, fn: Callable[[], Any], tokens: float = 1, priority: Optional[int] = None, span: Any = None) -> Any:
+        """
+        Run `fn` (one model request) under the limits, retrying throttling and transient errors.
+
+        :param fn: The request to send.
+        :param tokens: Estimated tokens of the request, reserved from the tokens-per-minute quota.
+        :param priority: Queue priority (defaults to the current request_priority).
+        :param span: Optional instrumentation span; receives the retries and the queue wait.
+        :returns: The response of `fn`; the last error is raised once the retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            waited = self.acquire(tokens, priority)
+            if span is not None:
+                span.attributes["queue_wait_s"] = span.attributes.get("queue_wait_s", 0.0) + waited
+            try:
+                response = fn()
+            except Exception as e:
+                if self._give_up(e, attempt):
+                    raise
+                if span is not None:
+                    span.retries += 1
+                time.sleep(self._backoff(attempt, e))
+                continue
+            self.settle(tokens, response)
+            self._on_success()
+            return response
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], tokens: float = 1, priority: Optional[int] = None, span: Any = None) -> Any:
+        """Async version of call; `fn` returns an awaitable."""
+        attempt = 0
+        while True:
+            attempt += 1
+            waited = await self.aacquire(tokens, priority)
+            if span is not None:
+                span.attributes["queue_wait_s"] = span.attributes.get("queue_wait_s", 0.0) + waited
+            try:
+                response = await fn()
+            except Exception as e:
+                if self._give_up(e, attempt):
+                    raise
+                if span is not None:
+                    span.retries += 1
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            self.settle(tokens, response)
+            self._on_success()
+            return response
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth (total and per priority), wait times and retry counters."""
+        with self._lock:
+            by_priority: Dict[int, int] = {}
+            for waiter in self._queue:
+                by_priority[waiter.priority] = by_priority.get(waiter.priority, 0) + 1
+            stats = dict(self._stats)
+            granted = stats["granted"]
+            return {
+                **stats,
+                "queue_depth": len(self._queue),
+                "queue_depth_by_priority": by_priority,
+                "mean_wait_s": round(stats["wait_s"] / granted, 4) if granted else 0.0,
+                "paused_for_s": round(max(0.0, self._paused_until - time.monotonic()), 3),
+            }
+
+    def prometheus_text(self) -> str:
+        """The queue gauges and counters in the Prometheus text exposition format."""
+        stats = self.stats()
+        lines = ["# HELP travel_model_queue_depth Model calls waiting for quota.", "# TYPE travel_model_queue_depth gauge"]
+        for priority in (PRIORITY_INTERACTIVE, PRIORITY_BATCH):
+            lines.append(f'travel_model_queue_depth{{priority="{priority}"}} {stats["queue_depth_by_priority"].get(priority, 0)}')
+        for metric, key, help_text in (
+            ("queue_wait_seconds_total", "wait_s", "Time model calls spent waiting for quota."),
+            ("queue_granted_total", "granted", "Model calls let through by the rate limiter."),
+            ("retries_total", "retries", "Model calls retried after throttling or a transient error."),
+            ("throttled_total", "throttled", "Model calls rejected with a 429."),
+        ):
+            lines += [f"# HELP travel_model_{metric} {help_text}", f"# TYPE travel_model_{metric} counter",
+                      f"travel_model_{metric} {stats[key]}"]
+        return "\n".join(lines) + "\n"
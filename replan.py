@@ -0,0 +1,131 @@
+# Incremental re-planning: apply an edit to a planned trip, redoing only the affected days and bookings
+from typing import Any, Dict, List, Tuple
+
+import travel
+from checkpoints import checkpoint_key
+from confirmations import build_confirmation
+from instrumentation import tracer, emit
+from itinerary_solver import repair_itinerary
+from TravelTools import TravelTools
+from schemas import (
+    ActivityProposal, BookingOutcome, ConfirmationDetails, DailyPlan, ReplanResult, TripChange, TripPlanResult, TripRequest,
+)
+
+def apply_change(request: TripRequest, change: TripChange) -> TripRequest:
+    """The trip request with the change's new duration, budget, start date and interests."""
+    return request.model_copy(update=change.model_dump(include={"daily_budget", "duration", "start_date", "interests"},
+                                                       exclude_none=True))
+
+def _merge_activities(*groups: List[ActivityProposal]) -> List[ActivityProposal]:
+    merged: Dict[str, ActivityProposal] = {}
+    for group in groups:
+        for proposal in group:
+            merged.setdefault(proposal.activity_name, proposal)
+    return list(merged.values())
+
+def _prepare(result: TripPlanResult, change: TripChange) -> Tuple[TripRequest, List[ActivityProposal], List[str]]:
+    """:returns: (the new request, the activities that may be scheduled, the interests still to research)."""
+    if not result.itinerary:
+        raise ValueError("The trip has no itinerary to re-plan; run the full sequence instead.")
+    request = apply_change(result.request, change)
+    removed = set(change.remove_activities)
+    activities = _merge_activities([p for p in result.activities if p.activity_name not in removed], change.add_activities)
+    new_interests = [interest for interest in request.interests if interest not in result.request.interests]
+    if new_interests and not result.selected_destination:
+        raise ValueError("New interests need the trip's destination, which the result does not have.")
+    return request, activities, new_interests
+
+def _repair(result: TripPlanResult, request: TripRequest, activities: List[ActivityProposal],
+            change: TripChange) -> Tuple[List[DailyPlan], List[int]]:
+    """Repair the itinerary with the local solver, grouped by area like the planner; changed days are put in visit order."""
+    logistics = TravelTools.logistics()
+    itinerary, changed_days = repair_itinerary(result.itinerary, activities, request.duration, request.daily_budget,
+                                               request.start_date, removed=change.remove_activities,
+                                               group_key=logistics.group_key(result.selected_destination, activities))
+    changed = set(changed_days)
+    return [logistics.order_itinerary(result.selected_destination, [plan])[0] if plan.day in changed else plan
+            for plan in itinerary], changed_days
+
+def _bookings_to_change(result: TripPlanResult, itinerary: List[DailyPlan]) -> Tuple[List[ConfirmationDetails], List[DailyPlan], List[str]]:
+    """
+    Split the bookings: a confirmation is kept when its activity is still scheduled on the same date.
+
+    :returns: (kept confirmations, the days with only the activities to book, codes of the cancelled bookings).
+    """
+    confirmations = {c.activity_name: c for c in (result.confirmation.confirmation_list if result.confirmation else [])}
+    old_dates = {name: plan.date for plan in result.itinerary for name in plan.activities}
+    kept = [confirmations[name] for plan in itinerary for name in plan.activities
+            if name in confirmations and old_dates.get(name) == plan.date]
+    kept_names = {c.activity_name for c in kept}
+    cancelled = [c.confirmation_code for name, c in confirmations.items() if name not in kept_names]
+    to_book = [plan.model_copy(update={"activities": [name for name in plan.activities if name not in kept_names]})
+               for plan in itinerary]
+    return kept, [plan for plan in to_book if plan.activities], cancelled
+
+def trip_namespace(result: TripPlanResult) -> str:
+    """The booking namespace of a planned trip (its trip id), so that edits book under the trip's own keys."""
+    return result.trip_id or checkpoint_key(result.request)[:16]
+
+def _finish(result: TripPlanResult, request: TripRequest, activities: List[ActivityProposal], researched: bool,
+            itinerary: List[DailyPlan], changed_days: List[int], kept: List[ConfirmationDetails],
+            outcomes: List[BookingOutcome], cancelled: List[str]) -> ReplanResult:
+    confirmation = build_confirmation(itinerary, request.start_date, trip_namespace(result), outcomes,
+                                      result.selected_destination, kept)
+    updated = result.model_copy(update={"request": request, "activities": activities, "itinerary": itinerary,
+                                        "confirmation": confirmation, "failed_stage": None, "error": None})
+
+    stages = ["investigate"] if researched else []
+    if changed_days or len(itinerary) != len(result.itinerary):
+        stages.append("plan")
+    if outcomes or cancelled:
+        stages.append("schedule")
+    emit(f"✏️ Re-plan: {len(changed_days)} day(s) changed, {len(kept)} booking(s) kept, "
+         f"{len(outcomes)} new, {len(cancelled)} cancelled.")
+    return ReplanResult(result=updated, recomputed_stages=stages, changed_days=changed_days, kept_bookings=len(kept),
+                        new_bookings=[o.activity_name for o in outcomes], cancelled_bookings=cancelled)
+
+def replan_trip(result: TripPlanResult, change: TripChange, client: Any = None) -> ReplanResult:
+    """
+    Apply `change` to a planned trip without rerunning the whole sequence.
+
+    The memory analyst is never rerun. New interests are researched (through the activity
+    catalog, so usually without a model call). The itinerary is repaired with the local solver,
+    keeping untouched days as they are. Only activities that are new or moved to another date are
+    booked; the other confirmations keep their codes, and the bookings no longer needed are
+    reported as cancelled. The bookings are dispatched on an event loop of their own, so from
+    async code await replan_trip_async instead.
+
+    :param result: A completed TripPlanResult (itinerary and, usually, confirmation).
+    :param change: The edit to apply.
+    :param client: The genai.Client used if new interests need research (defaults to the shared client).
+    :returns: The updated trip and what was recomputed.
+    """
+    with tracer.span("stage", "replan"):
+        request, activities, new_interests = _prepare(result, change)
+        if new_interests:
+            found = travel.run_investigator_agent(result.selected_destination, new_interests, client=client) or []
+            activities = _merge_activities(activities, found)
+
+        itinerary, changed_days = _repair(result, request, activities, change)
+        kept, to_book, cancelled = _bookings_to_change(result, itinerary)
+        outcomes = []
+        if to_book:
+            with tracer.span("tool", "BookingDispatcher.dispatch"):
+                outcomes = travel.booking_provider.get().dispatch(to_book, request.start_date, trip_namespace(result))
+        return _finish(result, request, activities, bool(new_interests), itinerary, changed_days, kept, outcomes, cancelled)
+
+async def replan_trip_async(result: TripPlanResult, change: TripChange, client: Any = None) -> ReplanResult:
+    """Async version of replan_trip."""
+    with tracer.span("stage", "replan"):
+        request, activities, new_interests = _prepare(result, change)
+        if new_interests:
+            found = await travel.run_investigator_agent_async(result.selected_destination, new_interests, client=client) or []
+            activities = _merge_activities(activities, found)
+
+        itinerary, changed_days = _repair(result, request, activities, change)
+        kept, to_book, cancelled = _bookings_to_change(result, itinerary)
+        outcomes = []
+        if to_book:
+            with tracer.span("tool", "BookingDispatcher.dispatch"):
+                outcomes = await travel.booking_provider.get().dispatch_async(to_book, request.start_date, trip_namespace(result))
+        return _finish(result, request, activities, bool(new_interests), itinerary, changed_days, kept, outcomes, cancelled)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 # Model for data reception between agents
 
 class ActivityProposal(BaseModel):
@@ -40,3 +40,78 @@ class BookingConfirmation(BaseModel):
     total_cost_booked: float = Field(description="The total confirmed cost of reservations.")
     confirmation_list: List[ConfirmationDetails] = Field(description="A list of all activities and hotels that have been confirmed.")
 
+class TripRequest(BaseModel):
+    """A single trip planning request (the inputs of the full agent sequence)."""
+    duration: int = Field(description="Total duration of the trip in days.")
+    start_date: str = Field(description="The actual start date of the trip ('YYYY-MM-DD').")
+    interests: List[str] = Field(description="A list of the user's key interests for the trip.")
+    budget_range: str = Field(description="The general budget level (e.g., 'Mid-range').")
+    daily_budget: float = Field(description="The maximum spending limit per day (in USD).")
+
+class TripPlanResult(BaseModel):
+    """The outcome of one run of the full agent sequence, including the stage that failed (if any)."""
+    request: TripRequest = Field(description="The trip request that produced this result.")
+    trip_id: Optional[str] = Field(default=None, description="Identifier of the run in traces and metrics.")
+    destinations: List[DestinationProposal] = Field(default_factory=list, description="Destinations proposed by the memory analyst.")
+    selected_destination: Optional[str] = Field(default=None, description="The destination that was planned.")
+    activities: List[ActivityProposal] = Field(default_factory=list, description="Activities found by the investigator.")
+    itinerary: List[DailyPlan] = Field(default_factory=list, description="The daily plans produced by the planner.")
+    confirmation: Optional[BookingConfirmation] = Field(default=None, description="The scheduler's booking confirmation.")
+    failed_stage: Optional[str] = Field(default=None, description="Name of the stage that failed ('memory', 'investigate', 'plan' or 'schedule').")
+    error: Optional[str] = Field(default=None, description="Description of the failure, if any.")
+
+    @property
+    def ok(self) -> bool:
+        return self.failed_stage is None
+
+class DestinationOption(BaseModel):
+    """One proposed destination, investigated and planned side by side with the others."""
+    destination: DestinationProposal = Field(description="The memory analyst's proposal.")
+    rank: Optional[int] = Field(default=None, description="Position in the comparison (1 = best).")
+    activities: List[ActivityProposal] = Field(default_factory=list, description="Activities found by the investigator.")
+    itinerary: List[DailyPlan] = Field(default_factory=list, description="The daily plans produced by the planner.")
+    planned_total_cost: float = Field(default=0.0, description="Sum of the itinerary's daily costs.")
+    cost_vs_estimate: float = Field(default=0.0, description="planned_total_cost minus the proposal's estimated_total_cost.")
+    within_budget: bool = Field(default=False, description="Whether every day of the itinerary respects the daily budget.")
+    activity_count: int = Field(default=0, description="Number of activities scheduled in the itinerary.")
+    failed_stage: Optional[str] = Field(default=None, description="Name of the stage that failed ('investigate' or 'plan'), if any.")
+    error: Optional[str] = Field(default=None, description="Description of the failure (or cancellation), if any.")
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+class DestinationComparison(BaseModel):
+    """Every proposed destination of a trip request, planned concurrently and ranked."""
+    request: TripRequest = Field(description="The trip request that was compared.")
+    trip_id: Optional[str] = Field(default=None, description="Identifier of the run in traces and metrics.")
+    options: List[DestinationOption] = Field(default_factory=list, description="The destinations, best first.")
+    selected_destination: Optional[str] = Field(default=None, description="The destination the user picked, if any.")
+
+class BookingOutcome(BaseModel):
+    """The result of sending one activity to the booking service."""
+    activity_name: str = Field(description="Name of the booked activity.")
+    date: str = Field(description="Date of the booking ('YYYY-MM-DD').")
+    idempotency_key: str = Field(description="Key that makes retries of this booking safe.")
+    success: bool = Field(description="Whether the booking service accepted the booking.")
+    attempts: int = Field(description="Number of requests sent for this booking.")
+    confirmation_code: Optional[str] = Field(default=None, description="Code returned by the booking service, if any.")
+    error: Optional[str] = Field(default=None, description="Last error when the booking failed.")
+
+class TripChange(BaseModel):
+    """An edit of a planned trip; unset fields keep their current value."""
+    daily_budget: Optional[float] = Field(default=None, description="New maximum spending limit per day (in USD).")
+    duration: Optional[int] = Field(default=None, description="New total duration of the trip in days.")
+    start_date: Optional[str] = Field(default=None, description="New start date of the trip ('YYYY-MM-DD').")
+    interests: Optional[List[str]] = Field(default=None, description="New list of interests (new ones are researched).")
+    remove_activities: List[str] = Field(default_factory=list, description="Activities to take out of the itinerary.")
+    add_activities: List[ActivityProposal] = Field(default_factory=list, description="Activities to schedule in addition.")
+
+class ReplanResult(BaseModel):
+    """The outcome of an incremental re-plan: the updated trip and what had to be redone."""
+    result: TripPlanResult = Field(description="The trip with its updated request, itinerary and confirmation.")
+    recomputed_stages: List[str] = Field(default_factory=list, description="Stages that were rerun ('investigate', 'plan', 'schedule').")
+    changed_days: List[int] = Field(default_factory=list, description="Numbers of the days whose plan changed.")
+    kept_bookings: int = Field(default=0, description="Confirmations carried over unchanged.")
+    new_bookings: List[str] = Field(default_factory=list, description="Activities booked by this re-plan.")
+    cancelled_bookings: List[str] = Field(default_factory=list, description="Confirmation codes of bookings no longer needed.")
@@ -0,0 +1,286 @@
+# Semantic cache: stage results reused for near-duplicate requests, matched on local embeddings
+import math
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Minimum cosine similarity for a hit, per stage. Calibrated on the default feature weights:
+# "Cairo" vs "Cairo, Egypt" or reordered interests still hit, "Paris, France" vs "Paris, Texas"
+# (0.93) and one more trip day (0.89) do not.
+DEFAULT_THRESHOLDS: Dict[str, float] = {"memory": 0.95, "investigate": 0.95}
+
+# Log-spaced centers of the soft buckets encoding numbers (durations, budgets) from 1 to 10,000.
+_NUMBER_CENTERS = np.linspace(0.0, math.log(10_000), 24, dtype=np.float32)
+_NUMBER_WIDTH = 0.25
+
+def normalize_text(text: str) -> str:
+    return " ".join(re.findall(r"\w+", str(text).lower()))
+
+def split_place(destination: str) -> Tuple[str, str]:
+    """("city", "rest") of a destination: "Cairo, Egypt" -> ("cairo", "egypt"), "Cairo" -> ("cairo", "")."""
+    city, _, region = destination.partition(",")
+    return normalize_text(city), normalize_text(region)
+
+def parse_thresholds(spec: str) -> Dict[str, float]:
+    """Parse "0.9" (every stage) or "memory=0.97,investigate=0.93" into per-stage thresholds."""
+    spec = spec.strip()
+    if not spec:
+        return {}
+    if "=" not in spec:
+        return {stage: float(spec) for stage in DEFAULT_THRESHOLDS}
+    thresholds = {}
+    for item in spec.split(","):
+        stage, _, value = item.partition("=")
+        if stage.strip() and value.strip():
+            thresholds[stage.strip()] = float(value)
+    return thresholds
+
+class RequestVectorizer:
+    """
+    Offline request embedding: every feature is hashed into a fixed number of dimensions.
+
+    Strings contribute character trigrams (so "Cairo" and "Kairo" stay close), lists contribute
+    their normalized items as an unordered set, and numbers contribute Gaussian bumps on a log
+    scale (so 180 and 185 are near-identical while 4 and 5 days are not). Each feature block is
+    unit-length and scaled by its weight, so the cosine similarity of two requests is the
+    weighted mean of the per-feature similarities.
+    """
+
+    def __init__(self, dims: int = 1024):
+        self.dims = dims
+
+    def _slot(self, name: str, token: str) -> int:
+        return zlib.crc32(f"{name}\x1f{token}".encode("utf-8")) % self.dims
+
+    def _block(self, name: str, value: Any) -> Dict[int, float]:
+        block: Dict[int, float] = {}
+        if isinstance(value, bool) or value is None:
+            return block
+        if isinstance(value, (int, float)):
+            if value > 0:
+                bumps = np.exp(-((_NUMBER_CENTERS - math.log(value)) / _NUMBER_WIDTH) ** 2)
+                for k, bump in enumerate(bumps):
+                    if bump > 1e-4:
+                        slot = self._slot(name, f"#{k}")
+                        block[slot] = block.get(slot, 0.0) + float(bump)
+            return block
+        if isinstance(value, (list, tuple, set, frozenset)):
+            for item in {normalize_text(item) for item in value} - {""}:
+                slot = self._slot(name, item)
+                block[slot] = block.get(slot, 0.0) + 1.0
+            return block
+        text = f" {normalize_text(value)} "
+        if text.strip():
+            for i in range(len(text) - 2):
+                slot = self._slot(name, text[i:i + 3])
+                block[slot] = block.get(slot, 0.0) + 1.0
+        return block
+
+    def encode(self, features: Dict[str, Tuple[Any, float]]) -> np.ndarray:
+        """Unit vector of {feature name: (value, weight)}; empty values are left out."""
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for name, (value, weight) in features.items():
+            block = self._block(name, value)
+            norm = math.sqrt(sum(v * v for v in block.values()))
+            for slot, v in block.items():
+                vector[slot] += weight * v / norm
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+class _Entry:
+    __slots__ = ("value", "created_at", "last_used", "key", "position")
+
+    def __init__(self, value: Any, key: Tuple[str, str]):
+        self.value = value
+        self.created_at = self.last_used = time.time()
+        self.key = key
+        # Row of the entry in its index's matrix; None once removed.
+        self.position: Optional[int] = None
+
+class _Index:
+    """
+    Growable matrix of the request vectors of one (stage, partition), with their entries.
+
+    Adding a vector is amortized O(dims) (the matrix doubles when full), and so is removing one:
+    the last row takes its place. Entries are also kept in creation order, so expired ones are
+    found at the front without scanning the index.
+    """
+
+    def __init__(self, dims: int, capacity: int = 16):
+        self.vectors = np.zeros((capacity, dims), dtype=np.float32)
+        self.entries: List[_Entry] = []
+        self._by_age: Deque[_Entry] = deque()
+
+    def add(self, vector: np.ndarray, entry: _Entry) -> None:
+        size = len(self.entries)
+        if size == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+        self.vectors[size] = vector
+        entry.position = size
+        self.entries.append(entry)
+        self._by_age.append(entry)
+
+    def remove(self, entry: _Entry) -> None:
+        position, last = entry.position, self.entries.pop()
+        if last is not entry:
+            self.vectors[position] = self.vectors[len(self.entries)]
+            self.entries[position] = last
+            last.position = position
+        entry.position = None
+        if len(self._by_age) > 2 * len(self.entries) + 16:
+            # Drop the removed entries that are not at the front yet.
+            self._by_age = deque(e for e in self._by_age if e.position is not None)
+
+    def expired(self, before: float) -> List[_Entry]:
+        """The entries created before `before`, oldest first."""
+        expired = []
+        while self._by_age and (self._by_age[0].position is None or self._by_age[0].created_at <= before):
+            entry = self._by_age.popleft()
+            if entry.position is not None:
+                expired.append(entry)
+        return expired
+
+    def best(self, query: np.ndarray) -> Tuple[int, float]:
+        if not self.entries:
+            return -1, 0.0
+        scores = self.vectors[:len(self.entries)] @ query
+        position = int(np.argmax(scores))
+        return position, float(scores[position])
+
+class SemanticCache:
+    """
+    In-memory cache of stage results matched by request similarity rather than exact keys.
+
+    Requests are described as feature dicts, embedded by a RequestVectorizer and compared by
+    cosine similarity with the earlier requests of the same stage and partition (e.g. the user
+    and the size of their trip history, so new history is never answered with stale results).
+    The best match is returned when it reaches the stage's threshold. Entries expire after
+    `ttl` seconds, and the least recently used entry is evicted beyond `max_entries`.
+    """
+
+    def __init__(self, thresholds: Optional[Dict[str, float]] = None, max_entries: int = 2048, ttl: float = 6 * 3600,
+                 vectorizer: Optional[RequestVectorizer] = None, enabled: bool = True, window: int = 1000):
+        """
+        :param thresholds: Per-stage similarity thresholds (merged over DEFAULT_THRESHOLDS); a stage without one is not cached.
+        :param max_entries: Entries kept over all stages before the least recently used are evicted.
+        :param ttl: Seconds an entry is served for.
+        :param vectorizer: The request embedding (defaults to a RequestVectorizer).
+        :param enabled: False turns every lookup into a miss and every put into a no-op.
+        :param window: Number of recent best-match similarities kept per stage for the statistics.
+        """
+        self.thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.vectorizer = vectorizer or RequestVectorizer()
+        self.enabled = enabled
+        self._indexes: Dict[Tuple[str, str], _Index] = {}
+        # Every entry, least recently used first.
+        self._lru: "OrderedDict[_Entry, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._scores: Dict[str, Deque[float]] = {}
+        self._window = window
+
+    def _count(self, stage: str, counter: str, score: Optional[float] = None) -> None:
+        # Caller holds the lock.
+        counters = self._counters.setdefault(stage, {"hits": 0, "exact_hits": 0, "misses": 0, "near_misses": 0, "evictions": 0})
+        counters[counter] += 1
+        if score is not None:
+            self._scores.setdefault(stage, deque(maxlen=self._window)).append(score)
+
+    def lookup(self, stage: str, features: Dict[str, Tuple[Any, float]], partition: str = "") -> Tuple[Any, float]:
+        """
+        Find the cached result of the most similar earlier request.
+
+        :returns: (result, similarity); result is None on a miss, similarity is the best match's (0.0 when there is none).
+        """
+        threshold = self.thresholds.get(stage)
+        if not self.enabled or threshold is None:
+            return None, 0.0
+        query = self.vectorizer.encode(features)
+        now = time.time()
+        with self._lock:
+            index = self._indexes.get((stage, partition))
+            if index is not None:
+                for entry in index.expired(now - self.ttl):
+                    self._remove(index, entry)
+            position, score = index.best(query) if index is not None else (-1, 0.0)
+            if position < 0 or score < threshold:
+                self._count(stage, "misses", score if position >= 0 else None)
+                if position >= 0 and score >= threshold - 0.05:
+                    self._count(stage, "near_misses")
+                return None, score
+            entry = index.entries[position]
+            entry.last_used = now
+            self._lru.move_to_end(entry)
+            self._count(stage, "hits", score)
+            if score >= 0.9999:
+                self._count(stage, "exact_hits")
+            return entry.value, score
+
+    def put(self, stage: str, features: Dict[str, Tuple[Any, float]], value: Any, partition: str = "") -> None:
+        """Remember a stage result for its request (no-op for empty results and uncached stages)."""
+        if not self.enabled or not value or stage not in self.thresholds:
+            return
+        vector = self.vectorizer.encode(features)
+        with self._lock:
+            key = (stage, partition)
+            index = self._indexes.setdefault(key, _Index(self.vectorizer.dims))
+            position, score = index.best(vector)
+            if position >= 0 and score >= 0.9999:
+                # Same request again: refresh the entry instead of adding a duplicate.
+                self._remove(index, index.entries[position])
+            entry = _Entry(value, key)
+            index.add(vector, entry)
+            self._lru[entry] = None
+            while len(self._lru) > self.max_entries:
+                evicted = next(iter(self._lru))
+                self._remove(self._indexes[evicted.key], evicted)
+                self._count(evicted.key[0], "evictions")
+
+    def _remove(self, index: _Index, entry: _Entry) -> None:
+        # Caller holds the lock.
+        index.remove(entry)
+        del self._lru[entry]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+            self._lru.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Per stage: hits (and exact ones), misses (and near misses within 0.05 of the threshold), evictions and similarity quantiles."""
+        with self._lock:
+            stages = {}
+            for stage, counters in self._counters.items():
+                scores = np.array(self._scores.get(stage) or [0.0])
+                lookups = counters["hits"] + counters["misses"]
+                stages[stage] = {
+                    **counters,
+                    "threshold": self.thresholds.get(stage),
+                    "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+                    "similarity_p10": round(float(np.percentile(scores, 10)), 4),
+                    "similarity_p50": round(float(np.percentile(scores, 50)), 4),
+                }
+            return {"entries": len(self._lru), "stages": stages}
+
+def memory_features(duration_days: int, start_date: str, budget_range: str, interests: Optional[List[str]]) -> Dict[str, Tuple[Any, float]]:
+    """Features of a memory analyst request: the start date only matters through its season."""
+    from memory_store import season_of
+
+    return {
+        "budget_range": (budget_range, 1.0),
+        "interests": (interests or [], 0.8),
+        "season": ([season_of(start_date) or ""], 0.6),
+        "duration_days": (duration_days, 1.0),
+    }
+
+def investigate_features(destination: str, interests: List[str]) -> Dict[str, Tuple[Any, float]]:
+    """Features of an investigator request: the city weighs more than the country or region after it."""
+    city, region = split_place(destination)
+    return {"city": (city, 1.0), "region": (region, 0.4), "interests": (interests, 1.0)}
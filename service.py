@@ -0,0 +1,316 @@
+# Long-running planning service: the agent stages and the full sequence as local HTTP endpoints
+import argparse
+import asyncio
+import hashlib
+import json
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+import travel
+from coalescing import Coalescer
+from replan import replan_trip_async
+from instrumentation import tracer, emit
+from providers import client_provider
+from schemas import ActivityProposal, DailyPlan, TripChange, TripPlanResult, TripRequest
+from stream_json import RESET
+
+class MemoryStageRequest(BaseModel):
+    duration_days: int
+    start_date: str
+    budget_range: str
+    interests: List[str] = []
+
+class InvestigateStageRequest(BaseModel):
+    destination: str
+    interests: List[str]
+
+class PlanStageRequest(BaseModel):
+    destination: str
+    duration: int
+    proposals: List[ActivityProposal]
+    daily_budget: float
+    start_date: Optional[str] = None
+    llm_themes: bool = False
+
+class ScheduleStageRequest(BaseModel):
+    itinerary: List[DailyPlan]
+    start_date: str
+    destination: Optional[str] = None
+    # Scopes the bookings (idempotency keys, confirmation codes); a fresh id per request without it.
+    trip_id: Optional[str] = None
+
+class TripServiceRequest(TripRequest):
+    destination_index: int = 0
+
+class ReplanServiceRequest(BaseModel):
+    result: TripPlanResult
+    change: TripChange
+
+def _chunk(payload: Any) -> bytes:
+    """One NDJSON line as an HTTP/1.1 chunk."""
+    data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+    return f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n"
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, list):
+        return [_jsonable(item) for item in value]
+    return value
+
+class PlanningService:
+    """
+    Serves the agents over HTTP/1.1 (keep-alive, JSON bodies) from one asyncio event loop.
+
+    One warm Gemini client, response cache, checkpoint store and booking connection pool are
+    shared by every request. Identical requests to the read-only stages in flight at the same
+    time are coalesced: the first runs, the others await its result. Requests that book (/schedule,
+    /trips, /replan) always run on their own, except /schedule calls for the same explicit trip_id,
+    whose bookings are the same anyway. Underneath, travel._agenerate also coalesces identical
+    model calls, e.g. the same destination searched by different endpoints.
+
+    Endpoints (POST bodies are JSON):
+      POST /memory, /investigate, /plan, /schedule   one agent stage (see the *StageRequest models)
+      POST /trips                                    the full sequence (TripRequest + destination_index)
+      POST /compare                                  every proposed destination planned and ranked (TripRequest)
+      POST /replan                                   a planned trip edited incrementally (TripPlanResult + TripChange)
+      POST /investigate/stream, /plan/stream, /schedule/stream
+                                                     the stage as NDJSON: one {"item": ...} line per activity, day or
+                                                     confirmation as soon as it is available ({"reset": true} withdraws
+                                                     the items so far), then {"result": ...} or {"error": ...}
+      GET  /health, /stats, /metrics                 liveness, coalescing/cache/catalog/queue/logistics counters, Prometheus text
+    """
+
+    # Endpoints without side effects, whose identical requests can share one run.
+    COALESCED_ROUTES = frozenset({"/memory", "/investigate", "/plan", "/compare"})
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080, client: Any = None):
+        """
+        :param host: Interface to listen on.
+        :param port: Port to listen on (0 picks a free one).
+        :param client: The genai.Client to serve with (defaults to the shared client of client_provider).
+        """
+        self.host = host
+        self.port = port
+        self.client = client
+        self.requests = Coalescer()
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._routes: Dict[str, Tuple[type[BaseModel], Callable[[Any], Awaitable[Any]]]] = {
+            "/memory": (MemoryStageRequest, self._memory),
+            "/investigate": (InvestigateStageRequest, self._investigate),
+            "/plan": (PlanStageRequest, self._plan),
+            "/schedule": (ScheduleStageRequest, self._schedule),
+            "/trips": (TripServiceRequest, self._trip),
+            "/compare": (TripRequest, self._compare),
+            "/replan": (ReplanServiceRequest, self._replan),
+        }
+        # Streamed stages are not coalesced: every caller needs its own items as they arrive.
+        self._stream_routes: Dict[str, Tuple[type[BaseModel], Callable[[Any, Callable[[Any], None]], Awaitable[Any]]]] = {
+            "/investigate/stream": (InvestigateStageRequest, self._investigate),
+            "/plan/stream": (PlanStageRequest, self._plan),
+            "/schedule/stream": (ScheduleStageRequest, self._schedule),
+        }
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def _memory(self, request: MemoryStageRequest) -> Any:
+        return await travel.run_memory_analyst_agent_async(request.duration_days, request.start_date, request.budget_range,
+                                                           request.interests, client=self.client)
+
+    async def _investigate(self, request: InvestigateStageRequest, on_item: Optional[Callable[[Any], None]] = None) -> Any:
+        return await travel.run_investigator_agent_async(request.destination, request.interests, client=self.client,
+                                                         on_activity=on_item)
+
+    async def _plan(self, request: PlanStageRequest, on_item: Optional[Callable[[Any], None]] = None) -> Any:
+        return await travel.run_planner_agent_async(request.destination, request.duration, request.proposals, request.daily_budget,
+                                                    request.start_date, llm_themes=request.llm_themes, client=self.client,
+                                                    on_day=on_item)
+
+    async def _schedule(self, request: ScheduleStageRequest, on_item: Optional[Callable[[Any], None]] = None) -> Any:
+        return await travel.run_scheduler_agent_async(request.itinerary, request.start_date, client=self.client,
+                                                      destination=request.destination, on_confirmation=on_item,
+                                                      trip_id=request.trip_id)
+
+    async def _trip(self, request: TripServiceRequest) -> Any:
+        trip = TripRequest(**request.model_dump(exclude={"destination_index"}))
+        return await travel.run_full_sequence_async(trip, request.destination_index, client=self.client)
+
+    async def _compare(self, request: TripRequest) -> Any:
+        return await travel.compare_destinations_async(request, client=self.client)
+
+    async def _replan(self, request: ReplanServiceRequest) -> Any:
+        return await replan_trip_async(request.result, request.change, client=self.client)
+
+    def _coalescing_key(self, path: str, request: BaseModel) -> Optional[str]:
+        """Key shared by the identical requests that can share one run, or None when the request must run on its own."""
+        if path not in self.COALESCED_ROUTES and not (isinstance(request, ScheduleStageRequest) and request.trip_id):
+            return None
+        return hashlib.sha256(f"{path}|{request.model_dump_json()}".encode("utf-8")).hexdigest()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests.stats(),
+            "model_calls": travel.upstream_calls.stats(),
+            "rate_limiter": travel.rate_limiter.get().stats(),
+            "cache": travel.cache_provider.get().stats(),
+            "catalog": travel.catalog_provider.get().stats(),
+            "semantic_cache": travel.semantic_cache_provider.get().stats(),
+            "input_tokens": travel.context_budget.get().stats(),
+            "logistics": travel.TravelTools.logistics().stats(),
+        }
+
+    async def handle(self, method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        """
+        Route one request.
+
+        :returns: (HTTP status, payload); the payload is a JSON-able object, or a str sent as text/plain.
+        """
+        if method == "GET":
+            if path == "/health":
+                return 200, {"status": "ok"}
+            if path == "/stats":
+                return 200, self.stats()
+            if path == "/metrics":
+                return 200, tracer.prometheus_text() + travel.rate_limiter.get().prometheus_text()
+
+        route = self._routes.get(path)
+        if route is None:
+            return 404, {"error": f"Unknown endpoint {method} {path}."}
+        if method != "POST":
+            return 405, {"error": f"{method} is not allowed on {path}."}
+
+        model, run = route
+        try:
+            request = model.model_validate_json(body or b"{}")
+        except ValidationError as e:
+            return 400, {"error": "Invalid request.", "details": json.loads(e.json(include_url=False))}
+
+        key = self._coalescing_key(path, request)
+        try:
+            if key is None:
+                result = await run(request)
+            else:
+                result, _ = await self.requests.run(key, lambda: run(request))
+        except Exception as e:
+            emit(f"❌ Service: {path} failed: {e}")
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+        if result is None:
+            return 502, {"error": f"The {path.strip('/')} stage produced no result."}
+        return 200, _jsonable(result)
+
+    async def stream(self, path: str, body: bytes, writer: asyncio.StreamWriter, keep_alive: bool) -> None:
+        """
+        Serve a streamed stage: a chunked NDJSON response whose {"item": ...} lines are written as
+        the agent hands over each item, followed by the {"result": ...} or {"error": ...} line. A
+        {"reset": true} line withdraws the items before it (their model response failed); the
+        items of the retry follow from the first one.
+        """
+        model, run = self._stream_routes[path]
+        try:
+            request = model.model_validate_json(body or b"{}")
+        except ValidationError as e:
+            await self._respond(writer, 400, {"error": "Invalid request.", "details": json.loads(e.json(include_url=False))}, keep_alive)
+            return
+
+        writer.write(
+            "HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+        )
+        try:
+            result = await run(request, lambda item: writer.write(_chunk({"reset": True} if item is RESET else {"item": _jsonable(item)})))
+            final = {"result": _jsonable(result)} if result is not None else {"error": f"The {path.split('/')[1]} stage produced no result."}
+        except Exception as e:
+            emit(f"❌ Service: {path} failed: {e}")
+            final = {"error": f"{type(e).__name__}: {e}"}
+        writer.write(_chunk(final) + b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool) -> None:
+        if isinstance(payload, str):
+            data, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            data, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+        writer.write(
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+
+                path = target.split("?", 1)[0]
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                if method.upper() == "POST" and path in self._stream_routes:
+                    await self.stream(path, body, writer, keep_alive)
+                else:
+                    status, payload = await self.handle(method.upper(), path, body)
+                    await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            # Malformed request or the client went away: drop the connection.
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> str:
+        """Warm up the shared dependencies and start listening. :returns: The service's base URL."""
+        if self.client is None:
+            self.client = client_provider.get()
+        travel.cache_provider.get()
+        travel.checkpoint_provider.get()
+        travel.catalog_provider.get()
+        travel.semantic_cache_provider.get()
+        travel.TravelTools.logistics()
+        await travel.booking_provider.get().open()
+
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        emit(f"🛰️ Planning service listening on {self.base_url}")
+        return self.base_url
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await travel.booking_provider.get().aclose()
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the travel agents over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(PlanningService(args.host, args.port).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+# Incremental JSON parsing of streamed model responses: validated list items as soon as each one is complete
+import asyncio
+import contextvars
+import threading
+import time
+import typing
+from contextlib import contextmanager
+from queue import Empty, Queue
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional
+
+from pydantic import BaseModel, ValidationError
+
+from instrumentation import emit
+
+# Passed to a stream consumer in place of an item when the items handed over so far are withdrawn: their
+# response failed, and the items that follow (of a retry or a fallback) replace them, from the first one.
+RESET = object()
+
+_END = object()
+
+class JSONArrayScanner:
+    """
+    Finds the elements of one JSON array in text that arrives in pieces, without parsing the rest.
+
+    The array is the top-level value when the text is a list, or the value of `key` in the
+    top-level object. Anything before the first bracket (e.g. a markdown fence) is skipped.
+    Each element is returned as its JSON text once its closing bracket (or, for a scalar, the
+    following comma) has arrived.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.done = False
+        self._text = ""
+        self._position = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._element_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[str]:
+        """Add the next piece of text. :returns: The elements completed by it, in order."""
+        self._text += chunk
+        elements: List[str] = []
+        text = self._text
+        while self._position < len(text) and not self.done:
+            index, char = self._position, text[self._position]
+            self._position += 1
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._stack == ["{"]:
+                        self._last_string = text[self._string_start + 1:index]
+                continue
+
+            in_array = self._array_depth is not None and len(self._stack) == self._array_depth
+            if in_array and self._element_start is None and char not in " \t\r\n,]":
+                self._element_start = index
+
+            if char == '"':
+                if self._stack:
+                    self._in_string, self._string_start = True, index
+            elif char in "{[":
+                if char == "[" and self._array_depth is None and (
+                        not self._stack or (self._stack == ["{"] and self._pending_key == self.key)):
+                    self._array_depth = len(self._stack) + 1
+                self._stack.append(char)
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if in_array:
+                    # The target array closed: a pending scalar element ends with it.
+                    if self._element_start is not None:
+                        elements.append(text[self._element_start:index].strip())
+                    self.done = True
+                elif self._array_depth is not None and len(self._stack) == self._array_depth and self._element_start is not None:
+                    elements.append(text[self._element_start:index + 1])
+                    self._element_start = None
+            elif char == ":" and self._stack == ["{"]:
+                self._pending_key = self._last_string
+            elif char == ",":
+                if self._stack == ["{"]:
+                    self._pending_key = None
+                elif in_array and self._element_start is not None:
+                    elements.append(text[self._element_start:index].strip())
+                    self._element_start = None
+        return elements
+
+def deliver(on_item: Callable[[Any], None], item: Any) -> None:
+    """Pass one item to a stream consumer; a failing consumer is reported, so that it cannot fail (or retry) the model call."""
+    try:
+        on_item(item)
+    except Exception as e:
+        emit(f"⚠️ Stream consumer failed on {type(item).__name__}: {e}")
+
+def list_item_type(container: type[BaseModel], key: str) -> type[BaseModel]:
+    """The item model of a container's list field, e.g. ActivityProposal for ActivityProposalsList.proposals."""
+    return typing.get_args(container.model_fields[key].annotation)[0]
+
+class ItemStream:
+    """
+    Hands the items of an agent's result to a consumer as early as possible.
+
+    In streaming mode the response text is fed in as it arrives, and every list element is
+    validated against the item model and passed to `on_item` as soon as it is complete. Once
+    the whole response has been parsed, `finish` passes the items not streamed yet, so the
+    consumer sees each item of the result exactly once, whether it was streamed, served from a
+    cache or returned in one piece. When a response fails after some of its items were handed
+    over (and the request is retried, or the agent falls back), the consumer receives RESET,
+    and then the items of the next response from the first one.
+    """
+
+    def __init__(self, container: type[BaseModel], key: str, on_item: Callable[[Any], None]):
+        """
+        :param container: The agent's output container (e.g. ActivityProposalsList).
+        :param key: The container's list field (e.g. "proposals").
+        :param on_item: Called with each validated item, or with RESET when the items so far are withdrawn.
+        """
+        self.key = key
+        self.item_type = list_item_type(container, key)
+        self.on_item = on_item
+        self.emitted = 0
+        self.invalid = 0
+        self.first_item_s: Optional[float] = None
+        self._started = time.perf_counter()
+        self._scanner = JSONArrayScanner(key)
+        self._broken = False
+
+    def reset(self) -> None:
+        """Withdraw the items handed over so far (their response failed)."""
+        if self.emitted:
+            self.emitted = 0
+            deliver(self.on_item, RESET)
+
+    def restart(self) -> None:
+        """A new attempt of the request starts: withdraw the last attempt's items and scan the new text from the beginning."""
+        self.reset()
+        self._scanner = JSONArrayScanner(self.key)
+        self._broken = False
+
+    def feed(self, text: str) -> None:
+        """Scan the next piece of the response and pass on the items it completes."""
+        if self._broken or not text:
+            return
+        for element in self._scanner.feed(text):
+            try:
+                item = self.item_type.model_validate_json(element)
+            except ValidationError:
+                # Left to the full parse: the items from here on are passed by finish, if the response validates.
+                self.invalid += 1
+                self._broken = True
+                return
+            self._emit(item)
+
+    def finish(self, result: BaseModel) -> None:
+        """Pass the items of the parsed result that were not streamed."""
+        for item in getattr(result, self.key)[self.emitted:]:
+            self._emit(item)
+
+    def _emit(self, item: Any) -> None:
+        if self.first_item_s is None:
+            self.first_item_s = time.perf_counter() - self._started
+        self.emitted += 1
+        deliver(self.on_item, item)
+
+@contextmanager
+def withdrawn_on_error(stream: Optional[ItemStream]) -> Iterator[None]:
+    """Withdraw the items `stream` handed over if the enclosed model call fails."""
+    try:
+        yield
+    except BaseException:
+        if stream is not None:
+            stream.reset()
+        raise
+
+def timed_chunks(chunks: Iterable[Any], timeout: Callable[[], Optional[float]]) -> Iterator[Any]:
+    """
+    The chunks of a blocking stream, each waited for at most `timeout()` seconds (None waits
+    indefinitely), so that a stalled stream raises TimeoutError instead of hanging.
+
+    The stream is read on a daemon thread; a stalled read cannot be interrupted, so the thread
+    lingers until the stream ends, and the chunks it reads after the timeout are dropped.
+    """
+    queue: "Queue[tuple]" = Queue()
+    abandoned = threading.Event()
+
+    def _pump() -> None:
+        try:
+            for chunk in chunks:
+                if abandoned.is_set():
+                    return
+                queue.put((chunk, None))
+        except BaseException as e:
+            queue.put((None, e))
+        else:
+            queue.put((_END, None))
+
+    threading.Thread(target=contextvars.copy_context().run, args=(_pump,), name="model-stream", daemon=True).start()
+    try:
+        while True:
+            try:
+                chunk, error = queue.get(timeout=timeout())
+            except Empty:
+                raise TimeoutError("The streamed response stalled.") from None
+            if error is not None:
+                raise error
+            if chunk is _END:
+                return
+            yield chunk
+    finally:
+        abandoned.set()
+
+async def within(awaitable: Awaitable[Any], seconds: Optional[float]) -> Any:
+    """Await with a timeout; an expired one raises the builtin TimeoutError (asyncio's differs before Python 3.11)."""
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except asyncio.TimeoutError:
+        raise TimeoutError("The streamed response stalled.") from None
+
+async def atimed_chunks(chunks: AsyncIterator[Any], timeout: Callable[[], Optional[float]]) -> AsyncIterator[Any]:
+    """Async version of timed_chunks; the pending read is cancelled when it times out."""
+    iterator = chunks.__aiter__()
+    while True:
+        try:
+            chunk = await within(iterator.__anext__(), timeout())
+        except StopAsyncIteration:
+            return
+        yield chunk
+
+class StreamedResponse:
+    """The chunks of a streamed response joined into the subset of GenerateContentResponse the agents use."""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.usage_metadata: Any = None
+
+    def add(self, chunk: Any) -> str:
+        """Add a chunk. :returns: Its text."""
+        text = chunk.text or ""
+        self.parts.append(text)
+        # Every chunk's usage is cumulative, so the last one reported holds the totals.
+        self.usage_metadata = getattr(chunk, "usage_metadata", None) or self.usage_metadata
+        return text
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
@@ -0,0 +1,9 @@
+# Test setup: the modules live at the repository root, and every store runs in memory
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name, value in {"TRAVEL_CACHE_PATH": "", "TRAVEL_CHECKPOINT_PATH": "", "TRAVEL_CATALOG_PATH": "",
+                    "TRAVEL_MEMORY_PATH": ":memory:", "AGENT_MODEL": "fake-model"}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,70 @@
+import time
+
+from activity_catalog import ActivityCatalog, matches_interest, merge_activities, normalize_key
+from schemas import ActivityProposal
+
+def proposals(category: str, count: int, prefix: str = "") -> list:
+    return [ActivityProposal(activity_name=f"{prefix or category} {i}", estimated_cost=10.0 + i, category=category,
+                             description="d") for i in range(count)]
+
+def names(activities) -> list:
+    return [activity.activity_name for activity in activities]
+
+def test_keys_and_interest_matching():
+    assert normalize_key("  Ancient-History! ") == "ancient history"
+    assert matches_interest("History", "Ancient History")
+    assert not matches_interest("Food", "History")
+    assert not matches_interest("", "History")
+
+def test_merge_takes_interests_in_turn_without_duplicates():
+    history, food = proposals("History", 3), proposals("Food", 3)
+    merged = merge_activities([history, food + history[:1]], limit=5)
+    assert names(merged) == ["History 0", "Food 0", "History 1", "Food 1", "History 2"]
+
+def test_a_researched_interest_is_served_in_full():
+    catalog = ActivityCatalog(":memory:")
+    catalog.add("Cairo, Egypt", ["History"], proposals("History", 5))
+    covered, missing = catalog.lookup("cairo egypt", ["history"])
+    assert missing == [] and names(covered["history"]) == names(proposals("History", 5))
+    assert catalog.stats()["hits"] == 1
+
+def test_an_interest_needs_its_share_of_a_request():
+    catalog = ActivityCatalog(":memory:")
+    catalog.add("Cairo, Egypt", ["History", "Food"], proposals("History", 3) + proposals("Food", 1))
+    # One of two interests needs 3 activities, a single interest all 5.
+    covered, missing = catalog.lookup("Cairo, Egypt", ["History", "Food"])
+    assert list(covered) == ["History"] and missing == ["Food"]
+    covered, missing = catalog.lookup("Cairo, Egypt", ["History"])
+    assert covered == {} and missing == ["History"]
+    assert catalog.stats()["partial_hits"] == 1 and catalog.stats()["misses"] == 1
+
+def test_interests_sharing_activities_must_still_fill_a_request():
+    catalog = ActivityCatalog(":memory:")
+    shared = proposals("Ancient History", 3)
+    catalog.add("Cairo, Egypt", ["Ancient History"], shared)
+    catalog.add("Cairo, Egypt", ["History"], shared)
+    covered, missing = catalog.lookup("Cairo, Egypt", ["Ancient History", "History"])
+    assert covered == {} and missing == ["Ancient History", "History"]
+
+def test_empty_interests_are_a_miss():
+    catalog = ActivityCatalog(":memory:")
+    catalog.add("Paris, France", [], proposals("Art", 5))
+    assert catalog.lookup("Paris, France", []) == ({}, [])
+    assert catalog.stats()["misses"] == 1 and catalog.stats()["hits"] == 0
+
+def test_expired_and_invalidated_entries_are_not_served():
+    catalog = ActivityCatalog(":memory:", ttl=0.05)
+    catalog.add("Cairo, Egypt", ["History"], proposals("History", 5))
+    time.sleep(0.06)
+    assert catalog.lookup("Cairo, Egypt", ["History"])[1] == ["History"]
+    assert catalog.purge_expired() == 5
+
+    catalog = ActivityCatalog(":memory:")
+    catalog.add("Cairo, Egypt", ["History"], proposals("History", 5))
+    catalog.invalidate("Cairo, Egypt")
+    assert catalog.stats()["activities"] == 0
+
+def test_disabled_catalog():
+    catalog = ActivityCatalog(":memory:", ttl=0)
+    catalog.add("Cairo, Egypt", ["History"], proposals("History", 5))
+    assert catalog.lookup("Cairo, Egypt", ["History"]) == ({}, ["History"])
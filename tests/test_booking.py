@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from booking import BookingDispatcher, StubBookingServer
+from schemas import DailyPlan
+
+ITINERARY = [
+    DailyPlan(day=1, date="", theme="t", activities=["Louvre", "Louvre", "Seine cruise"], total_daily_cost=0),
+    DailyPlan(day=2, date="", theme="t", activities=["Louvre"], total_daily_cost=0),
+]
+
+def test_idempotency_key_is_deterministic_and_scoped():
+    key = BookingDispatcher.idempotency_key("Louvre", "2025-12-01", 0, "trip-a")
+    assert key == BookingDispatcher.idempotency_key("Louvre", "2025-12-01", 0, "trip-a")
+    assert len(key) == 32
+    assert key != BookingDispatcher.idempotency_key("Louvre", "2025-12-01", 0, "trip-b")
+    assert key != BookingDispatcher.idempotency_key("Louvre", "2025-12-01", 1, "trip-a")
+    assert key != BookingDispatcher.idempotency_key("Louvre", "2025-12-02", 0, "trip-a")
+
+def test_namespace_is_required():
+    with pytest.raises(TypeError):
+        BookingDispatcher.idempotency_key("Louvre", "2025-12-01", 0)
+    with pytest.raises(TypeError):
+        BookingDispatcher().dispatch(ITINERARY, "2025-12-01")
+
+def test_plan_requests_tells_repeats_apart():
+    requests = BookingDispatcher().plan_requests(ITINERARY, "2025-12-01", "trip-a")
+    assert [(r["activity"], r["date"]) for r in requests] == [
+        ("Louvre", "2025-12-01"), ("Louvre", "2025-12-01"), ("Seine cruise", "2025-12-01"), ("Louvre", "2025-12-02")]
+    assert len({r["idempotency_key"] for r in requests}) == len(requests)
+
+@pytest.mark.parametrize("batch_endpoint", [True, False])
+def test_dispatch_books_once_per_trip(batch_endpoint):
+    with StubBookingServer(batch_endpoint=batch_endpoint, seed=0) as stub:
+        dispatcher = BookingDispatcher(stub.base_url, backoff=0.001)
+        first = dispatcher.dispatch(ITINERARY, "2025-12-01", "trip-a")
+        again = dispatcher.dispatch(ITINERARY, "2025-12-01", "trip-a")
+        other = dispatcher.dispatch(ITINERARY, "2025-12-01", "trip-b")
+    assert all(o.success for o in first + again + other)
+    assert [o.confirmation_code for o in first] == [o.confirmation_code for o in again]
+    assert not {o.confirmation_code for o in first} & {o.confirmation_code for o in other}
+    assert stub.stats["bookings"] == 2 * len(first)
+    assert stub.stats["duplicates"] == len(first)
+
+def test_dispatch_retries_failures():
+    with StubBookingServer(failure_rate=0.5, batch_endpoint=False, seed=1) as stub:
+        outcomes = BookingDispatcher(stub.base_url, max_retries=10, backoff=0.001).dispatch(ITINERARY, "2025-12-01", "trip-a")
+    assert all(o.success for o in outcomes)
+    assert stub.stats["failures"] > 0
+    assert sum(o.attempts for o in outcomes) == len(outcomes) + stub.stats["failures"]
+
+def test_blocking_dispatch_refuses_a_running_loop():
+    async def main():
+        with pytest.raises(RuntimeError, match="dispatch_async"):
+            BookingDispatcher().dispatch(ITINERARY, "2025-12-01", "trip-a")
+
+    asyncio.run(main())
+
+def test_blocking_dispatch_does_not_use_the_pooled_client():
+    with StubBookingServer(seed=0) as stub:
+        dispatcher = BookingDispatcher(stub.base_url, backoff=0.001)
+
+        async def warm_up():
+            await dispatcher.open()
+            await dispatcher.dispatch_async(ITINERARY, "2025-12-01", "trip-b")
+
+        asyncio.run(warm_up())
+        # The pooled client and its kept-alive connection belong to a closed loop: reusing them fails.
+        outcomes = dispatcher.dispatch(ITINERARY, "2025-12-01", "trip-a")
+        assert dispatcher._http is not None
+    assert all(o.success for o in outcomes)
+    assert stub.stats["bookings"] == 2 * len(outcomes)
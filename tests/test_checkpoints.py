@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import pytest
+
+import travel
+from cache import DEFAULT_TTLS, ResponseCache
+from checkpoints import CheckpointStore, checkpoint_key
+from fake_client import FakeGeminiClient
+from schemas import DestinationProposal, TripRequest
+
+TRIP = TripRequest(duration=2, start_date="2025-12-01", interests=["History", "Food"], budget_range="Mid-range", daily_budget=150.0)
+PROPOSALS = [DestinationProposal(destination_name="Cairo, Egypt", reasoning="History.", estimated_total_cost=900.0)]
+
+@pytest.fixture
+def stores():
+    travel.checkpoint_provider.set(CheckpointStore(":memory:"))
+    travel.cache_provider.set(ResponseCache(None, ttls={agent: 0 for agent in DEFAULT_TTLS}))
+    yield travel.checkpoint_provider.get()
+    travel.checkpoint_provider.reset()
+    travel.cache_provider.reset()
+
+def test_checkpoints_expire():
+    store = CheckpointStore(":memory:", max_age=0.05)
+    store.save("key", "memory", PROPOSALS)
+    assert store.load("key", "memory") == PROPOSALS
+    assert list(store.completed_stages("key")) == ["memory"]
+    time.sleep(0.06)
+    assert store.load("key", "memory") is None
+    assert store.completed_stages("key") == {}
+    unbounded = CheckpointStore(":memory:", max_age=0)
+    unbounded.save("key", "memory", PROPOSALS)
+    assert unbounded.load("key", "memory") == PROPOSALS
+
+def test_clear_drops_the_request_and_expired_checkpoints():
+    store = CheckpointStore(":memory:", max_age=0.05)
+    store.save("old", "memory", PROPOSALS)
+    time.sleep(0.06)
+    store.save("key", "memory", PROPOSALS)
+    store.save("other", "memory", PROPOSALS)
+    store.clear("key")
+    assert store._db.execute("SELECT request_key FROM checkpoints").fetchall() == [("other",)]
+
+def test_a_failed_run_resumes(stores):
+    request_key = checkpoint_key(TRIP)
+    stores.save(request_key, "memory", PROPOSALS)
+    client = FakeGeminiClient(time_scale=0.001, latency_sigma=0)
+    result = asyncio.run(travel.run_full_sequence_async(TRIP, client=client))
+    assert result.failed_stage is None and result.destinations == PROPOSALS
+    assert client.models.calls["memory"] == 0
+
+def test_a_booked_run_is_not_replayed(stores):
+    client = FakeGeminiClient(time_scale=0.001, latency_sigma=0)
+    first = asyncio.run(travel.run_full_sequence_async(TRIP, client=client))
+    assert first.failed_stage is None
+    assert stores.completed_stages(checkpoint_key(TRIP)) == {}
+    second = asyncio.run(travel.run_full_sequence_async(TRIP, client=client))
+    assert second.failed_stage is None
+    assert client.models.calls["memory"] == 2
@@ -0,0 +1,102 @@
+import asyncio
+import gc
+
+import pytest
+
+from coalescing import Coalescer
+
+def test_concurrent_calls_share_one_result():
+    coalescer, started = Coalescer(), []
+
+    async def call():
+        started.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(coalescer.run("key", call) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert [result for result, _ in results] == ["result"] * 5
+    assert [shared for _, shared in results] == [False] + [True] * 4
+    assert len(started) == 1
+    assert coalescer.stats() == {"calls": 1, "coalesced": 4, "abandoned": 0, "in_flight": 0}
+
+def test_exceptions_fan_out_and_later_calls_start_afresh():
+    coalescer, calls = Coalescer(), []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(*(coalescer.run("key", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        with pytest.raises(ValueError):
+            await coalescer.run("key", failing)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+def test_a_cancelled_waiter_leaves_the_call_to_the_others():
+    coalescer = Coalescer()
+
+    async def call():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    async def main():
+        first = asyncio.create_task(coalescer.run("key", call))
+        second = asyncio.create_task(coalescer.run("key", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == ("result", True)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
+    assert coalescer.abandoned == 0
+
+def test_the_call_is_cancelled_when_every_waiter_has_left():
+    coalescer, finished, cancelled = Coalescer(), [], []
+
+    async def call():
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        finished.append(1)
+        return "result"
+
+    async def main():
+        waiters = [asyncio.create_task(coalescer.run("key", call)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        assert coalescer.in_flight() == 0
+        # A new caller starts a new call rather than joining the cancelled one.
+        assert await coalescer.run("key", call) == ("result", False)
+
+    asyncio.run(main())
+    assert cancelled == [1] and finished == [1]
+    assert coalescer.stats()["abandoned"] == 1
+
+def test_failures_of_abandoned_calls_are_retrieved():
+    coalescer, unhandled = Coalescer(), []
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("503")
+
+    async def main():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unhandled.append(context))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(coalescer.run("key", failing), 0.001)
+        await asyncio.sleep(0.02)
+        gc.collect()
+
+    asyncio.run(main())
+    assert unhandled == []
@@ -0,0 +1,43 @@
+from confirmations import build_confirmation, code_prefix, confirmation_code, confirmation_total, format_time, parse_time
+from schemas import BookingOutcome, DailyPlan
+
+ITINERARY = [
+    DailyPlan(day=1, date="2025-12-01", theme="Ancient wonders", activities=["Giza Pyramids and Sphinx", "Egyptian Museum"],
+              total_daily_cost=60.1),
+    DailyPlan(day=2, date="2025-12-02", theme="Islamic Cairo", activities=["Khan el-Khalili"], total_daily_cost=20.2),
+]
+
+def test_code_prefix_and_times():
+    assert code_prefix("Cairo, Egypt") == "CAI"
+    assert code_prefix("São Paulo, Brazil") == "SAO"
+    assert code_prefix(None) == "TRP"
+    assert format_time(570) == "09:30 AM"
+    assert parse_time("02:15 PM") == 14 * 60 + 15
+    assert parse_time("soon") is None
+
+def test_confirmation_code_is_lengthened_on_collision():
+    key = "abcdef123456"
+    assert confirmation_code("CAI", key, set()) == "CAI-ABCDEF"
+    assert confirmation_code("CAI", key, {"CAI-ABCDEF"}) == "CAI-ABCDEF1"
+
+def test_total_is_exact():
+    assert confirmation_total(ITINERARY) == 80.3
+
+def test_codes_are_unique_within_and_across_trips():
+    first = build_confirmation(ITINERARY, "2025-12-01", "trip-a", destination="Cairo, Egypt")
+    again = build_confirmation(ITINERARY, "2025-12-01", "trip-a", destination="Cairo, Egypt")
+    other = build_confirmation(ITINERARY, "2025-12-01", "trip-b", destination="Cairo, Egypt")
+    codes = [c.confirmation_code for c in first.confirmation_list]
+    assert len(set(codes)) == len(codes)
+    assert codes == [c.confirmation_code for c in again.confirmation_list]
+    assert not set(codes) & {c.confirmation_code for c in other.confirmation_list}
+
+def test_outcomes_set_status_and_service_codes():
+    outcomes = [BookingOutcome(activity_name="Egyptian Museum", date="2025-12-01", idempotency_key="k1", success=True,
+                               attempts=1, confirmation_code="BK-1"),
+                BookingOutcome(activity_name="Khan el-Khalili", date="2025-12-02", idempotency_key="k2", success=False,
+                               attempts=3, error="HTTP 503")]
+    details = {c.activity_name: c for c in build_confirmation(ITINERARY, "2025-12-01", "trip-a", outcomes, "Cairo, Egypt").confirmation_list}
+    assert (details["Egyptian Museum"].status, details["Egyptian Museum"].confirmation_code) == ("Confirmed", "BK-1")
+    assert details["Khan el-Khalili"].status == "Pending"
+    assert details["Giza Pyramids and Sphinx"].status == "Pending"
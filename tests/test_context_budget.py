@@ -0,0 +1,45 @@
+from context_budget import ContextBudget, compact_number, compact_schema, count_tokens, encode_table, parse_budgets, summarize_text
+from schemas import ActivityProposalsList
+
+COLUMNS = ["name", "cost", "category"]
+ROWS = [[f"Activity number {i}", float(10 + i), "History"] for i in range(40)]
+
+def test_encoding():
+    assert compact_number(45.0) == "45" and compact_number(12.499) == "12.5" and compact_number(3) == "3"
+    assert encode_table(["a", "b"], [["x|y", ["p", 1.0]]]) == "a|b\nx/y|p; 1"
+    assert compact_schema(ActivityProposalsList) == "{proposals:[{activity_name:str,estimated_cost:num,category:str}]}"
+    assert parse_budgets("investigate=500, schedule=1200") == {"investigate": 500, "schedule": 1200}
+
+def test_fit_table_keeps_the_rows_that_fit():
+    budget = ContextBudget({"plan": 120})
+    table, kept = budget.fit_table("plan", COLUMNS, ROWS, used=20)
+    assert 1 <= kept < len(ROWS)
+    assert table == encode_table(COLUMNS, ROWS[:kept])
+    assert count_tokens(table) <= 100 < count_tokens(encode_table(COLUMNS, ROWS[:kept + 1]))
+    stats = budget.stats()["plan"]
+    assert stats["compacted"] == 1 and stats["tokens_saved"] == count_tokens(encode_table(COLUMNS, ROWS)) - count_tokens(table)
+
+def test_fit_table_leaves_required_small_and_unbounded_tables_whole():
+    whole = encode_table(COLUMNS, ROWS)
+    assert ContextBudget({"plan": 120}).fit_table("plan", COLUMNS, ROWS, required=True) == (whole, len(ROWS))
+    assert ContextBudget({"plan": 10_000}).fit_table("plan", COLUMNS, ROWS) == (whole, len(ROWS))
+    assert ContextBudget({"plan": 120}, enabled=False).fit_table("plan", COLUMNS, ROWS) == (whole, len(ROWS))
+    assert ContextBudget().fit_table("unknown", COLUMNS, ROWS) == (whole, len(ROWS))
+
+def test_fit_table_keeps_one_row_at_least():
+    table, kept = ContextBudget({"plan": 5}).fit_table("plan", COLUMNS, ROWS)
+    assert kept == 1 and table == encode_table(COLUMNS, ROWS[:1])
+
+def test_summary_prefers_prices_and_keywords():
+    text = "Cairo is big. The museum costs $20. Pyramids open at 8. Food is good near the souk."
+    summary = summarize_text(text, 12, keywords=["museum"])
+    assert "The museum costs $20." in summary
+    assert count_tokens(summary) <= 12
+    assert summarize_text(text, 1000) == text
+
+def test_record_counts_prompts_over_budget():
+    budget = ContextBudget({"memory": 10})
+    budget.record("memory", "x" * 400)
+    budget.record("memory", "short")
+    stats = budget.stats()["memory"]
+    assert stats["prompts"] == 2 and stats["over_budget"] == 1 and stats["max_tokens"] == count_tokens("x" * 400)
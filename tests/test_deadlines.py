@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+import travel
+from deadlines import deadline, parse_deadlines, remaining
+from schemas import DestinationProposal
+
+def test_remaining_is_the_innermost_deadline():
+    assert remaining() is None
+    with deadline(10):
+        assert 9 < remaining() <= 10
+        with deadline(60):
+            assert remaining() <= 10
+        with deadline(None):
+            assert remaining() <= 10
+    assert remaining() is None
+
+def test_parse_deadlines():
+    assert parse_deadlines("memory=5, investigate=12.5") == {"memory": 5.0, "investigate": 12.5}
+
+def test_async_stage_is_cancelled_at_the_trip_deadline():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def main():
+        with deadline(0.02):
+            await travel._arun_stage("test-deadline", "memory", slow)
+
+    with pytest.raises(TimeoutError, match="exceeded the trip deadline"):
+        asyncio.run(main())
+    assert cancelled == [1]
+
+def test_async_stage_within_its_deadline_runs_to_completion():
+    proposals = [DestinationProposal(destination_name="Lisbon, Portugal", reasoning="r", estimated_total_cost=900.0)]
+
+    async def quick():
+        await asyncio.sleep(0)
+        return proposals
+
+    async def main():
+        with deadline(5):
+            return await travel._arun_stage("test-deadline-ok", "memory", quick)
+
+    assert asyncio.run(main()) == proposals
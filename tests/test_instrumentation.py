@@ -0,0 +1,55 @@
+import json
+import logging
+
+import pytest
+
+import instrumentation
+from instrumentation import Tracer, emit, trip_context
+
+@pytest.fixture
+def log_records(monkeypatch):
+    """The "travel" logger's records, with the log format left to be read from the environment."""
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger("travel")
+    monkeypatch.setattr(instrumentation, "_structured", None)
+    monkeypatch.setattr(logger, "handlers", [handler])
+    monkeypatch.setattr(logger, "level", logging.INFO)
+    return records
+
+def test_log_format_is_read_on_first_use(monkeypatch, log_records):
+    monkeypatch.setenv("TRAVEL_LOG_FORMAT", "json")
+    with trip_context("trip-1"):
+        emit("hello")
+    event = json.loads(log_records[-1].getMessage())
+    assert (event["event"], event["trip_id"], event["message"]) == ("message", "trip-1", "hello")
+
+def test_text_format_prints(monkeypatch, capsys, log_records):
+    monkeypatch.setenv("TRAVEL_LOG_FORMAT", "text")
+    emit("hello")
+    assert capsys.readouterr().out == "hello\n"
+    assert log_records == []
+
+def test_trace_sink_is_read_on_the_first_span(monkeypatch, tmp_path):
+    tracer = Tracer(sink_env="TEST_TRACE_PATH")
+    monkeypatch.setenv("TEST_TRACE_PATH", str(tmp_path / "spans.jsonl"))
+    with trip_context("trip-2"), tracer.span("tool", "lookup", size=3) as span:
+        span.retries = 1
+    [line] = (tmp_path / "spans.jsonl").read_text().splitlines()
+    assert json.loads(line)["trip_id"] == "trip-2"
+    assert tracer.trip_spans("trip-2")[0].attributes == {"size": 3}
+
+def test_an_explicit_sink_wins(monkeypatch, tmp_path):
+    monkeypatch.setenv("TEST_TRACE_PATH", str(tmp_path / "env.jsonl"))
+    tracer = Tracer(sink_path=str(tmp_path / "explicit.jsonl"), sink_env="TEST_TRACE_PATH")
+    with tracer.span("tool", "lookup"):
+        pass
+    assert (tmp_path / "explicit.jsonl").exists() and not (tmp_path / "env.jsonl").exists()
+
+def test_span_errors_are_recorded():
+    tracer = Tracer()
+    with pytest.raises(ValueError), tracer.span("model", "plan"):
+        raise ValueError("bad JSON")
+    assert tracer.spans[-1].error == "ValueError: bad JSON"
+    assert 'status="error"' in tracer.prometheus_text()
@@ -0,0 +1,63 @@
+from itinerary_solver import label_theme, repair_itinerary, solve_itinerary
+from schemas import ActivityProposal
+
+def proposal(name: str, cost: float, category: str) -> ActivityProposal:
+    return ActivityProposal(activity_name=name, estimated_cost=cost, category=category)
+
+PROPOSALS = [
+    proposal("Louvre", 20.0, "Art"),
+    proposal("Orsay", 16.0, "Art"),
+    proposal("Rodin Museum", 13.0, "Art"),
+    proposal("Food tour", 90.0, "Food"),
+    proposal("Cheese tasting", 40.0, "Food"),
+    proposal("Eiffel Tower", 30.0, "Sights"),
+    proposal("Seine cruise", 150.0, "Sights"),
+]
+
+def test_days_respect_the_budget_and_the_activity_limit():
+    plans = solve_itinerary(PROPOSALS, duration=3, daily_budget=100.0, start_date="2026-05-01", max_activities_per_day=2)
+    assert [p.date for p in plans] == ["2026-05-01", "2026-05-02", "2026-05-03"]
+    costs = {p.activity_name: p.estimated_cost for p in PROPOSALS}
+    for plan in plans:
+        assert len(plan.activities) <= 2
+        assert plan.total_daily_cost == sum(costs[name] for name in plan.activities) <= 100.0
+    scheduled = [name for plan in plans for name in plan.activities]
+    assert "Seine cruise" not in scheduled
+    assert len(scheduled) == len(set(scheduled))
+
+def test_a_group_shares_a_day():
+    plans = solve_itinerary(PROPOSALS[:3] + PROPOSALS[5:6], duration=2, daily_budget=100.0)
+    art = [plan for plan in plans if "Louvre" in plan.activities][0]
+    assert set(art.activities) >= {"Louvre", "Orsay", "Rodin Museum"}
+    assert art.theme.startswith("Art")
+    assert solve_itinerary([], duration=1, daily_budget=100.0)[0].theme == label_theme([]) == "Free day"
+
+def test_repair_keeps_unchanged_days():
+    plans = solve_itinerary(PROPOSALS, duration=3, daily_budget=100.0, start_date="2026-05-01")
+    repaired, changed = repair_itinerary(plans, PROPOSALS, duration=3, daily_budget=100.0, start_date="2026-05-01")
+    assert changed == []
+    assert all(new is old for new, old in zip(repaired, plans))
+
+def test_repair_removes_fits_and_refills():
+    plans = solve_itinerary(PROPOSALS, duration=3, daily_budget=100.0, start_date="2026-05-01")
+    removed_day = next(plan.day for plan in plans if "Eiffel Tower" in plan.activities)
+    repaired, changed = repair_itinerary(plans, PROPOSALS, duration=2, daily_budget=60.0,
+                                         start_date="2026-05-01", removed=["Eiffel Tower"])
+    assert len(repaired) == 2
+    scheduled = [name for plan in repaired for name in plan.activities]
+    assert "Eiffel Tower" not in scheduled and "Food tour" not in scheduled
+    assert all(plan.total_daily_cost <= 60.0 for plan in repaired)
+    assert "Cheese tasting" in scheduled
+    for plan in repaired:
+        if plan.day not in changed:
+            assert plan is plans[plan.day - 1]
+    if removed_day <= 2:
+        assert removed_day in changed
+
+def test_repair_moves_dates_and_appends_days():
+    plans = solve_itinerary(PROPOSALS[:3], duration=1, daily_budget=100.0, start_date="2026-05-01")
+    repaired, changed = repair_itinerary(plans, PROPOSALS[:3], duration=2, daily_budget=100.0, start_date="2026-06-01")
+    assert changed == [1, 2]
+    assert [p.date for p in repaired] == ["2026-06-01", "2026-06-02"]
+    assert repaired[0].activities == plans[0].activities and repaired[0].theme == plans[0].theme
+    assert repaired[1].activities == []
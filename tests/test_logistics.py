@@ -0,0 +1,53 @@
+import numpy as np
+
+from logistics import DAY_START_MINUTES, UNLOCATED_LEG_MINUTES, UNLOCATED_VISIT_MINUTES, LogisticsEngine, parse_hours, path_cost, shortest_path_order
+
+POIS = {
+    "Bangkok, Thailand": [
+        {"name": "Grand Palace", "lat": 13.7500, "lon": 100.4913, "visit_minutes": 120, "hours": "08:30-15:30"},
+        {"name": "Wat Pho", "lat": 13.7465, "lon": 100.4927, "visit_minutes": 60},
+        {"name": "Chatuchak Weekend Market", "lat": 13.7999, "lon": 100.5503, "aliases": ["Chatuchak Market"]},
+    ],
+}
+
+def test_locate_by_name_alias_and_words():
+    engine = LogisticsEngine(POIS)
+    key, located = engine.locate(["Wat Pho", "Chatuchak Market", "Tour of the Grand Palace", "Cooking class"], "Bangkok, Thailand")
+    assert key == "bangkok"
+    assert located == {"Wat Pho": 1, "Chatuchak Market": 2, "Tour of the Grand Palace": 0}
+
+def test_locate_searches_every_city_only_without_a_destination():
+    engine = LogisticsEngine(POIS)
+    assert engine.locate(["Grand Palace", "Wat Pho"])[0] == "bangkok"
+    assert engine.locate(["Grand Palace", "Wat Pho"], "San Francisco, USA") == (None, {})
+
+def test_unknown_city_uses_the_fallback_estimates():
+    engine = LogisticsEngine(POIS)
+    names = ["Grand Palace", "Wat Pho"]
+    assert engine.route(names, "San Francisco, USA") == (names, 0.0)
+    second = -(-(DAY_START_MINUTES + UNLOCATED_VISIT_MINUTES + UNLOCATED_LEG_MINUTES) // 15) * 15
+    assert engine.timetable(names, "San Francisco, USA") == [("Grand Palace", DAY_START_MINUTES), ("Wat Pho", second)]
+
+def test_shortest_path_order_finds_the_line():
+    rng = np.random.default_rng(0)
+    positions = rng.permutation(12).astype(float)
+    cost = np.abs(positions[:, None] - positions[None, :])
+    order = shortest_path_order(cost)
+    assert sorted(order) == list(range(12))
+    assert path_cost(cost, order) == 11.0
+
+def test_shortest_path_order_is_2_opt_optimal():
+    rng = np.random.default_rng(1)
+    points = rng.random((40, 2))
+    cost = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+    order = shortest_path_order(cost)
+    assert sorted(order) == list(range(40))
+    # No single segment reversal shortens the 2-opt result.
+    best = path_cost(cost, order)
+    for i in range(1, 39):
+        for j in range(i + 1, 40):
+            assert path_cost(cost, order[:i] + order[i:j + 1][::-1] + order[j + 1:]) >= best - 1e-9
+
+def test_parse_hours():
+    assert parse_hours("09:30-18:00") == (570, 1080)
+    assert parse_hours(None) == (0, 1440)
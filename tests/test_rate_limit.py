@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from google.genai import errors
+
+from deadlines import deadline
+from rate_limit import PRIORITY_BATCH, PRIORITY_INTERACTIVE, RateLimiter, estimate_tokens, is_retryable, request_priority
+
+def server_error(code: int = 503) -> errors.APIError:
+    payload = {"error": {"code": code, "message": "Simulated.", "status": "UNAVAILABLE"}}
+    return errors.ServerError(code, payload) if code >= 500 else errors.ClientError(code, payload)
+
+class Flaky:
+    """Fails with the given errors, then answers."""
+
+    def __init__(self, *failures: BaseException):
+        self.failures = list(failures)
+        self.calls = 0
+
+    def __call__(self) -> str:
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return "ok"
+
+def test_retryable_errors():
+    assert is_retryable(server_error(503)) and is_retryable(server_error(429))
+    assert is_retryable(TimeoutError()) and is_retryable(ConnectionError())
+    assert not is_retryable(server_error(400)) and not is_retryable(ValueError())
+    assert estimate_tokens(["abcd" * 10, "xy"]) == 10
+
+def test_transient_errors_are_retried():
+    limiter = RateLimiter(backoff=0.001)
+    fn = Flaky(server_error(503), ConnectionError())
+    assert limiter.call(fn) == "ok"
+    assert fn.calls == 3
+    assert limiter.stats()["retries"] == 2
+
+def test_retries_are_bounded_and_permanent_errors_are_not_retried():
+    limiter = RateLimiter(max_retries=2, backoff=0.001)
+    fn = Flaky(*[server_error(503)] * 5)
+    with pytest.raises(errors.ServerError):
+        limiter.call(fn)
+    assert fn.calls == 3
+
+    fn = Flaky(server_error(400))
+    with pytest.raises(errors.ClientError):
+        limiter.call(fn)
+    assert fn.calls == 1
+    assert limiter.stats()["failed"] == 2
+
+def test_throttling_pauses_the_queue():
+    limiter = RateLimiter(backoff=0.001)
+    assert limiter.call(Flaky(server_error(429))) == "ok"
+    assert limiter.stats()["throttled"] == 1
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_backoff_is_cut_at_the_deadline(use_async):
+    limiter = RateLimiter(backoff=10.0, max_backoff=10.0)
+    fn = Flaky(*[server_error(503)] * 5)
+
+    async def acall():
+        return await limiter.acall(lambda: asyncio.sleep(0, fn()))
+
+    started = time.perf_counter()
+    with deadline(0.05), pytest.raises(errors.ServerError):
+        asyncio.run(acall()) if use_async else limiter.call(fn)
+    assert time.perf_counter() - started < 1.0
+    assert fn.calls == 2
+
+def test_requests_per_minute_quota():
+    limiter = RateLimiter(requests_per_minute=60)
+    assert limiter.acquire() < 0.05
+    started = time.perf_counter()
+    for _ in range(59):
+        limiter.acquire()
+    limiter.acquire()
+    assert time.perf_counter() - started >= 0.9
+
+def test_interactive_calls_go_before_queued_batch_calls():
+    limiter = RateLimiter(requests_per_minute=600)
+    for _ in range(600):
+        limiter.acquire()
+    order = []
+
+    def worker(name: str, priority: int, delay: float) -> None:
+        time.sleep(delay)
+        limiter.call(lambda: order.append(name), priority=priority)
+
+    threads = [threading.Thread(target=worker, args=(f"batch-{i}", PRIORITY_BATCH, 0.0)) for i in range(3)]
+    threads.append(threading.Thread(target=worker, args=("interactive", PRIORITY_INTERACTIVE, 0.02)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert order.index("interactive") <= 1
+    assert limiter.stats()["queue_depth"] == 0
+
+def test_request_priority_sets_the_default():
+    limiter = RateLimiter(requests_per_minute=60)
+    limiter.acquire()
+    with request_priority(PRIORITY_BATCH):
+        waiter = limiter._enqueue(1, None)
+    assert waiter.priority == PRIORITY_BATCH
+    limiter._leave(waiter)
+    assert limiter.stats()["queue_depth"] == 0
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+import travel
+from booking import BookingDispatcher, StubBookingServer
+from confirmations import build_confirmation
+from fake_client import FakeGeminiClient
+from itinerary_solver import solve_itinerary
+from replan import replan_trip, replan_trip_async
+from schemas import ActivityProposal, TripChange, TripPlanResult, TripRequest
+
+ACTIVITIES = [
+    ActivityProposal(activity_name="Giza Pyramids and Sphinx", estimated_cost=40.0, category="History"),
+    ActivityProposal(activity_name="Egyptian Museum", estimated_cost=20.0, category="History"),
+    ActivityProposal(activity_name="Khan el-Khalili", estimated_cost=10.0, category="Shopping"),
+    ActivityProposal(activity_name="Nile dinner cruise", estimated_cost=60.0, category="Food"),
+    ActivityProposal(activity_name="Koshary tasting", estimated_cost=8.0, category="Food"),
+]
+
+@pytest.fixture
+def stub():
+    with StubBookingServer(seed=0) as server:
+        travel.booking_provider.set(BookingDispatcher(server.base_url, backoff=0.001))
+        yield server
+    travel.booking_provider.reset()
+
+def planned_trip() -> TripPlanResult:
+    request = TripRequest(duration=3, start_date="2025-12-01", interests=["History", "Food"],
+                          budget_range="Mid-range", daily_budget=100.0)
+    itinerary = solve_itinerary(ACTIVITIES, request.duration, request.daily_budget, request.start_date)
+    outcomes = travel.booking_provider.get().dispatch(itinerary, request.start_date, "trip-1")
+    return TripPlanResult(request=request, trip_id="trip-1", selected_destination="Cairo, Egypt", activities=ACTIVITIES,
+                          itinerary=itinerary, confirmation=build_confirmation(itinerary, request.start_date, "trip-1",
+                                                                               outcomes, "Cairo, Egypt"))
+
+def test_unchanged_trip_books_nothing(stub):
+    trip = planned_trip()
+    booked = stub.stats["bookings"]
+    replanned = replan_trip(trip, TripChange())
+    assert replanned.changed_days == [] and replanned.recomputed_stages == []
+    assert replanned.kept_bookings == len(trip.confirmation.confirmation_list)
+    assert replanned.result.confirmation.confirmation_list == trip.confirmation.confirmation_list
+    assert stub.stats["bookings"] == booked
+
+def test_added_activity_is_the_only_new_booking(stub):
+    trip = planned_trip()
+    booked = stub.stats["bookings"]
+    extra = ActivityProposal(activity_name="Al-Azhar Park", estimated_cost=5.0, category="Nature")
+    replanned = replan_trip(trip, TripChange(add_activities=[extra]))
+    assert replanned.new_bookings == ["Al-Azhar Park"]
+    assert replanned.cancelled_bookings == []
+    assert stub.stats["bookings"] == booked + 1
+    codes = {c.activity_name: c.confirmation_code for c in replanned.result.confirmation.confirmation_list}
+    assert all(codes[c.activity_name] == c.confirmation_code for c in trip.confirmation.confirmation_list)
+    assert replanned.changed_days == [p.day for p in replanned.result.itinerary if "Al-Azhar Park" in p.activities]
+
+def test_removed_activity_is_cancelled(stub):
+    trip = planned_trip()
+    day = next(p for p in trip.itinerary if "Nile dinner cruise" in p.activities)
+    code = next(c.confirmation_code for c in trip.confirmation.confirmation_list if c.activity_name == "Nile dinner cruise")
+    replanned = replan_trip(trip, TripChange(remove_activities=["Nile dinner cruise"]))
+    assert replanned.cancelled_bookings == [code]
+    assert replanned.changed_days == [day.day]
+    assert all("Nile dinner cruise" not in p.activities for p in replanned.result.itinerary)
+    assert "Nile dinner cruise" not in {a.activity_name for a in replanned.result.activities}
+
+def test_moved_start_date_rebooks_under_the_same_trip(stub):
+    trip = planned_trip()
+    replanned = asyncio.run(replan_trip_async(trip, TripChange(start_date="2025-12-10")))
+    assert replanned.kept_bookings == 0
+    assert replanned.result.itinerary[0].date == "2025-12-10"
+    assert sorted(replanned.new_bookings) == sorted(a for p in trip.itinerary for a in p.activities)
+    again = asyncio.run(replan_trip_async(trip, TripChange(start_date="2025-12-10")))
+    assert [c.confirmation_code for c in again.result.confirmation.confirmation_list] == \
+        [c.confirmation_code for c in replanned.result.confirmation.confirmation_list]
+
+def test_new_interest_is_researched(stub):
+    trip = planned_trip()
+    client = FakeGeminiClient(time_scale=0.001, latency_sigma=0)
+    replanned = replan_trip(trip, TripChange(interests=["History", "Food", "Art"]), client=client)
+    assert replanned.recomputed_stages[0] == "investigate"
+    assert client.models.calls["investigate"] + client.models.calls["investigate_fused"] >= 1
+    assert len(replanned.result.activities) > len(ACTIVITIES)
+
+def test_trip_without_itinerary_is_rejected():
+    trip = TripPlanResult(request=TripRequest(duration=1, start_date="2025-12-01", interests=[], budget_range="Low",
+                                              daily_budget=50.0))
+    with pytest.raises(ValueError):
+        replan_trip(trip, TripChange(daily_budget=40.0))
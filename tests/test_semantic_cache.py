@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+
+from semantic_cache import RequestVectorizer, SemanticCache, investigate_features, parse_thresholds
+
+def features(city: str, *interests: str):
+    return investigate_features(city, list(interests))
+
+def test_near_duplicates_hit_and_different_requests_miss():
+    cache = SemanticCache()
+    cache.put("investigate", features("Cairo, Egypt", "History", "Food"), ["result"])
+    assert cache.lookup("investigate", features("Cairo", "food", "history"))[0] == ["result"]
+    assert cache.lookup("investigate", features("Paris, France", "History", "Food"))[0] is None
+    assert cache.lookup("memory", features("Cairo, Egypt", "History", "Food"))[0] is None
+    assert cache.lookup("investigate", features("Cairo, Egypt", "History", "Food"), partition="other")[0] is None
+
+def test_vectors_are_unit_length():
+    vector = RequestVectorizer().encode(features("Cairo, Egypt", "History"))
+    assert abs(np.linalg.norm(vector) - 1.0) < 1e-5
+    assert parse_thresholds("memory=0.97, investigate=0.9") == {"memory": 0.97, "investigate": 0.9}
+    assert parse_thresholds("0.9") == {"memory": 0.9, "investigate": 0.9}
+
+def test_the_same_request_refreshes_its_entry():
+    cache = SemanticCache()
+    cache.put("investigate", features("Cairo, Egypt", "History"), ["old"])
+    cache.put("investigate", features("Cairo, Egypt", "History"), ["new"])
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup("investigate", features("Cairo, Egypt", "History"))[0] == ["new"]
+
+def test_least_recently_used_entries_are_evicted():
+    cache = SemanticCache(max_entries=3)
+    cities = ["Cairo, Egypt", "Lisbon, Portugal", "Seoul, South Korea", "Bangkok, Thailand"]
+    for city in cities[:3]:
+        cache.put("investigate", features(city, "History"), [city])
+    assert cache.lookup("investigate", features(cities[0], "History"))[0] == [cities[0]]
+    cache.put("investigate", features(cities[3], "History"), [cities[3]])
+    assert cache.stats()["entries"] == 3
+    assert cache.lookup("investigate", features(cities[1], "History"))[0] is None
+    for city in (cities[0], cities[2], cities[3]):
+        assert cache.lookup("investigate", features(city, "History"))[0] == [city]
+    assert cache.stats()["stages"]["investigate"]["evictions"] == 1
+
+def test_growth_and_removals_keep_vectors_and_entries_aligned():
+    cache = SemanticCache(max_entries=50)
+    names = [f"City {i}, Country {i % 7}" for i in range(200)]
+    for name in names:
+        cache.put("investigate", features(name, "Food"), [name])
+    assert cache.stats()["entries"] == 50
+    for name in names[-50:]:
+        assert cache.lookup("investigate", features(name, "Food"))[0] == [name]
+
+def test_entries_expire():
+    cache = SemanticCache(ttl=0.05)
+    cache.put("investigate", features("Cairo, Egypt", "History"), ["result"])
+    time.sleep(0.06)
+    cache.put("investigate", features("Lisbon, Portugal", "History"), ["fresh"])
+    assert cache.lookup("investigate", features("Cairo, Egypt", "History"))[0] is None
+    assert cache.lookup("investigate", features("Lisbon, Portugal", "History"))[0] == ["fresh"]
+    assert cache.stats()["entries"] == 1
+
+def test_disabled_cache_and_empty_results():
+    cache = SemanticCache(enabled=False)
+    cache.put("investigate", features("Cairo, Egypt", "History"), ["result"])
+    assert cache.lookup("investigate", features("Cairo, Egypt", "History")) == (None, 0.0)
+    cache = SemanticCache()
+    cache.put("investigate", features("Cairo, Egypt", "History"), [])
+    assert cache.stats()["entries"] == 0
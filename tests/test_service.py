@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import pytest
+
+import travel
+from booking import BookingDispatcher, StubBookingServer
+from fake_client import FakeGeminiClient
+from schemas import DailyPlan
+from service import PlanningService
+
+ITINERARY = [DailyPlan(day=1, date="2025-12-01", theme="Museums", activities=["Louvre", "Orsay"], total_daily_cost=36.0)]
+
+@pytest.fixture
+def stub():
+    with StubBookingServer(latency=0.05, seed=0) as server:
+        travel.booking_provider.set(BookingDispatcher(server.base_url, backoff=0.001))
+        yield server
+    travel.booking_provider.reset()
+
+def post_twice(service: PlanningService, path: str, payload: dict) -> list:
+    body = json.dumps(payload).encode("utf-8")
+
+    async def main():
+        return await asyncio.gather(service.handle("POST", path, body), service.handle("POST", path, body))
+
+    return asyncio.run(main())
+
+def codes(payload: dict) -> set:
+    return {c["confirmation_code"] for c in payload["confirmation_list"]}
+
+def test_identical_schedules_without_a_trip_id_book_separately(stub):
+    service = PlanningService(client=FakeGeminiClient(time_scale=0.001, latency_sigma=0))
+    (status_a, first), (status_b, second) = post_twice(service, "/schedule", {"itinerary": [p.model_dump() for p in ITINERARY],
+                                                                              "start_date": "2025-12-01"})
+    assert status_a == status_b == 200
+    assert not codes(first) & codes(second)
+    assert stub.stats["bookings"] == 4 and stub.stats["duplicates"] == 0
+    assert service.requests.stats()["calls"] == 0
+
+def test_identical_schedules_of_one_trip_share_a_run(stub):
+    service = PlanningService(client=FakeGeminiClient(time_scale=0.001, latency_sigma=0))
+    (_, first), (_, second) = post_twice(service, "/schedule", {"itinerary": [p.model_dump() for p in ITINERARY],
+                                                                "start_date": "2025-12-01", "trip_id": "trip-a"})
+    assert codes(first) == codes(second)
+    assert stub.stats["bookings"] == 2
+    assert service.requests.stats()["coalesced"] == 1
+
+def test_identical_read_stages_are_coalesced():
+    service = PlanningService(client=FakeGeminiClient(time_scale=0.001, latency_sigma=0))
+    (status_a, first), (status_b, second) = post_twice(service, "/plan", {
+        "destination": "Paris, France", "duration": 1, "daily_budget": 100.0, "start_date": "2025-12-01",
+        "proposals": [{"activity_name": "Louvre", "estimated_cost": 20.0, "category": "Art"}]})
+    assert status_a == status_b == 200 and first == second
+    assert service.requests.stats()["coalesced"] == 1
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from schemas import ActivityProposal, ActivityProposalsList
+from stream_json import RESET, ItemStream, JSONArrayScanner, StreamedResponse, atimed_chunks, timed_chunks, withdrawn_on_error
+
+def activity(name: str, cost: float = 10.0) -> dict:
+    return {"activity_name": name, "estimated_cost": cost, "category": "History", "description": "d"}
+
+def proposals(*names: str) -> ActivityProposalsList:
+    return ActivityProposalsList(proposals=[ActivityProposal(**activity(name)) for name in names])
+
+def response_text(*names: str) -> str:
+    return "```json\n" + proposals(*names).model_dump_json() + "\n```"
+
+def scan_in_pieces(scanner: JSONArrayScanner, text: str, size: int) -> list:
+    return [element for start in range(0, len(text), size) for element in scanner.feed(text[start:start + size])]
+
+@pytest.mark.parametrize("size", [1, 3, 64, 10_000])
+def test_scanner_finds_each_element_whatever_the_chunking(size):
+    text = '{"note": "a [fake] {array}", "proposals": [{"a": "x]}\\"", "b": [1, 2]}, {"c": {}}], "after": [9]}'
+    elements = scan_in_pieces(JSONArrayScanner("proposals"), text, size)
+    assert [json.loads(element) for element in elements] == [{"a": 'x]}"', "b": [1, 2]}, {"c": {}}]
+
+def test_scanner_reads_a_top_level_list_and_scalars():
+    assert scan_in_pieces(JSONArrayScanner("proposals"), '[1, "two", 3.5]', 2) == ["1", '"two"', "3.5"]
+
+def test_scanner_ignores_the_key_in_nested_objects_and_stops_at_the_end():
+    scanner = JSONArrayScanner("proposals")
+    assert scanner.feed('{"meta": {"proposals": [1]}, "proposals": [2]') == ["2"]
+    assert scanner.done
+    assert scanner.feed(', "proposals": [3]}') == []
+
+def test_scanner_waits_for_an_incomplete_element():
+    scanner = JSONArrayScanner("proposals")
+    assert scanner.feed('{"proposals": [{"a": 1') == []
+    assert scanner.feed('}, ') == ['{"a": 1}']
+
+def stream_into(items: list) -> ItemStream:
+    return ItemStream(ActivityProposalsList, "proposals", items.append)
+
+def test_items_are_handed_over_once_streamed_or_not():
+    items = []
+    stream = stream_into(items)
+    text = response_text("Louvre", "Orsay", "Rodin")
+    stream.feed(text[:len(text) // 2])
+    streamed = len(items)
+    assert 0 < streamed < 3
+    stream.feed(text[len(text) // 2:])
+    stream.finish(proposals("Louvre", "Orsay", "Rodin"))
+    assert [item.activity_name for item in items] == ["Louvre", "Orsay", "Rodin"]
+    assert stream.first_item_s is not None
+
+def test_finish_hands_over_the_items_after_an_invalid_one():
+    items = []
+    stream = stream_into(items)
+    stream.feed('{"proposals": [' + json.dumps(activity("Louvre")) + ', {"activity_name": "broken"}, ' + json.dumps(activity("Rodin")))
+    assert [item.activity_name for item in items] == ["Louvre"]
+    assert stream.invalid == 1
+    stream.finish(proposals("Louvre", "Orsay", "Rodin"))
+    assert [item.activity_name for item in items] == ["Louvre", "Orsay", "Rodin"]
+
+def test_a_retry_withdraws_the_failed_attempts_items():
+    items = []
+    stream = stream_into(items)
+    failed = response_text("Louvre", "Orsay", "Rodin")
+    stream.feed(failed[:len(failed) * 2 // 3])
+    assert items and items[-1] is not RESET
+
+    stream.restart()
+    retry = response_text("Orsay", "Pompidou")
+    stream.feed(retry)
+    stream.finish(proposals("Orsay", "Pompidou"))
+    reset = items.index(RESET)
+    assert [item.activity_name for item in items[reset + 1:]] == ["Orsay", "Pompidou"]
+    assert stream.emitted == 2
+
+def test_restart_without_items_sends_no_reset():
+    items = []
+    stream = stream_into(items)
+    stream.restart()
+    stream.finish(proposals("Louvre"))
+    assert [item.activity_name for item in items] == ["Louvre"]
+
+def test_a_failed_call_withdraws_its_items():
+    items = []
+    stream = stream_into(items)
+    with pytest.raises(ValueError), withdrawn_on_error(stream):
+        stream.feed(response_text("Louvre")[:-5])
+        raise ValueError("invalid JSON")
+    assert items[-1] is RESET
+    with withdrawn_on_error(None):
+        pass
+
+def test_a_failing_consumer_does_not_fail_the_stream():
+    def consumer(item):
+        raise RuntimeError("consumer bug")
+
+    stream = ItemStream(ActivityProposalsList, "proposals", consumer)
+    stream.feed(response_text("Louvre"))
+    assert stream.emitted == 1
+
+class Chunk:
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = usage
+
+def test_streamed_response_joins_the_chunks():
+    response = StreamedResponse()
+    assert response.add(Chunk("ab")) == "ab"
+    response.add(Chunk(None))
+    response.add(Chunk("c", usage="totals"))
+    assert (response.text, response.usage_metadata) == ("abc", "totals")
+
+def stalling(stall_after: int, released: threading.Event):
+    for index in range(5):
+        if index == stall_after:
+            released.wait(5)
+        yield index
+
+def test_timed_chunks_passes_a_steady_stream():
+    assert list(timed_chunks(iter(range(5)), lambda: 1.0)) == [0, 1, 2, 3, 4]
+    assert list(timed_chunks(iter(range(3)), lambda: None)) == [0, 1, 2]
+
+@pytest.mark.parametrize("stall_after", [0, 2])
+def test_timed_chunks_raises_when_the_stream_stalls(stall_after):
+    released, received = threading.Event(), []
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        for chunk in timed_chunks(stalling(stall_after, released), lambda: 0.05):
+            received.append(chunk)
+    released.set()
+    assert received == list(range(stall_after))
+    assert time.perf_counter() - started < 1.0
+
+def test_timed_chunks_raises_the_streams_error():
+    def failing():
+        yield 1
+        raise ConnectionError("dropped")
+
+    with pytest.raises(ConnectionError):
+        list(timed_chunks(failing(), lambda: 1.0))
+
+def test_atimed_chunks_raises_when_the_stream_stalls():
+    async def chunks(stall_after):
+        for index in range(5):
+            if index == stall_after:
+                await asyncio.sleep(5)
+            yield index
+
+    async def collect(stall_after):
+        return [chunk async for chunk in atimed_chunks(chunks(stall_after), lambda: 0.05)]
+
+    assert asyncio.run(collect(99)) == [0, 1, 2, 3, 4]
+    with pytest.raises(TimeoutError):
+        asyncio.run(collect(2))
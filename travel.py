@@ -2,438 +2,1593 @@ import os
 import asyncio
 import json
 import re
+import uuid
+from functools import lru_cache
 from pydantic import BaseModel, Field, ValidationError
-from typing import List
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
+from typing import List, Iterable, Callable, Any, Dict, Tuple, TYPE_CHECKING
 
 from TravelTools import TravelTools, LongTermMemoryTool, SchedulerTools
 from schemas import *
+from cache import ResponseCache
+from itinerary_solver import solve_itinerary
+from confirmations import build_confirmation
+from booking import BookingDispatcher
+from checkpoints import CheckpointStore, checkpoint_key
+from instrumentation import tracer, trip_context, emit, current_trip
+from providers import Provider, client_provider, load_environment
+from coalescing import Coalescer
+from rate_limit import RateLimiter
+from deadlines import DeadlinePolicy, deadline, remaining
+from hedging import Hedger
+from activity_catalog import ActivityCatalog, merge_activities
+from context_budget import ContextBudget, compact_schema, parse_budgets
+from stream_json import RESET, ItemStream, StreamedResponse, atimed_chunks, deliver, timed_chunks, within, withdrawn_on_error
 
-# F: 
-def run_scheduler_agent(final_itinerary: List[DailyPlan], start_date: str) -> BookingConfirmation | None:
+if TYPE_CHECKING:
+    from google.genai import types
+    from semantic_cache import SemanticCache
+
+# Stage names of the full sequence, in execution order.
+STAGES = ("memory", "investigate", "plan", "schedule")
+
+# Agent output containers, with the list key used when the model returns a bare list.
+_CONTAINER_KEYS = {
+    DestinationProposalsList: "proposals",
+    ActivityProposalsList: "proposals",
+    ItineraryList: "itinerary",
+    BookingConfirmation: "confirmation_list",
+}
+
+# Schemas and configs are built once, on first use, instead of on every call (or at import).
+# The prompt gets the schema's compact type signature rather than the full JSON schema dump.
+@lru_cache(maxsize=None)
+def _schema_text(container: type[BaseModel]) -> str:
+    return compact_schema(container)
+
+@lru_cache(maxsize=None)
+def _structured_config(container: type[BaseModel]) -> "types.GenerateContentConfig":
+    from google.genai import types
+
+    return types.GenerateContentConfig(response_mime_type="application/json", response_schema=container)
+
+@lru_cache(maxsize=None)
+def _grounded_config() -> "types.GenerateContentConfig":
+    """Request config with the built-in Google Search tool (grounding)."""
+    from google.genai import types
+
+    return types.GenerateContentConfig(tools=[types.Tool(google_search=types.GoogleSearch())])
+
+# Identical model calls in flight at the same time (same cache key) share one upstream request.
+upstream_calls = Coalescer()
+
+def _client(client: Any = None) -> Any:
+    """The injected client, or the shared lazily built one (None when it cannot be created)."""
+    load_environment()
+    return client if client is not None else client_provider.get()
+
+# ==========================================================
+# Shared helpers: prompts and parsing used by the sync and async agents
+# ==========================================================
+
+def _chunk_timeout() -> float | None:
+    """Seconds to wait for the next chunk of a streamed response: the stream idle timeout, cut at the deadline."""
+    limits = [limit for limit in (_stream_idle_timeout(), remaining()) if limit is not None]
+    return min(limits) if limits else None
+
+def _stream_response(client: Any, model: str, contents: list, config: "types.GenerateContentConfig | None", stream: ItemStream) -> StreamedResponse:
     """
-    The scheduling and booking agent processes the itinerary and converts it into simulated booking confirmations.
-    
-    :param final_itinerary: The generated DailyPlan list.
-    :param start_date: The actual start date of the travel (e.g., “2025-12-01”).
-    :returns: The BookingConfirmation object confirms simulated bookings.
+    One streamed request (client.models.generate_content_stream): each chunk is fed to `stream` as it arrives.
+    A stream that stalls before its first chunk or between two raises TimeoutError (see _chunk_timeout).
     """
-    if not client: return None
-    
-    # 1. Convert the final itinerary to LLM text.
-    itinerary_text = json.dumps([p.model_dump() for p in final_itinerary], ensure_ascii=False)
-    
-    # 2. Formulating the Request
+    stream.restart()
+    response = StreamedResponse()
+    for chunk in timed_chunks(client.models.generate_content_stream(model=model, contents=contents, config=config), _chunk_timeout):
+        stream.feed(response.add(chunk))
+        if remaining() == 0:
+            raise TimeoutError("The streamed response passed the deadline.")
+    return response
+
+async def _astream_response(client: Any, model: str, contents: list, config: "types.GenerateContentConfig | None", stream: ItemStream) -> StreamedResponse:
+    """Async version of _stream_response, built on client.aio.models.generate_content_stream."""
+    stream.restart()
+    response = StreamedResponse()
+    chunks = await within(client.aio.models.generate_content_stream(model=model, contents=contents, config=config), _chunk_timeout())
+    async for chunk in atimed_chunks(chunks, _chunk_timeout):
+        stream.feed(response.add(chunk))
+    return response
+
+def _finish_stream(stream: ItemStream | None, result: Any, span: Any) -> Any:
+    """Pass the result's items not streamed yet to `stream`, and record when the first one was available."""
+    if stream is not None:
+        stream.finish(result)
+        if stream.first_item_s is not None:
+            span.attributes["first_item_s"] = round(stream.first_item_s, 4)
+    return result
+
+def _generate(agent: str, contents: list, parse: Callable[[str], Any] | None = None, config: "types.GenerateContentConfig | None" = None, client: Any = None, stream: ItemStream | None = None) -> Any:
+    """
+    Call client.models.generate_content through the response cache, recorded as a "model" span.
+    Upstream requests go through the shared rate limiter, which queues them by priority and
+    retries throttling and transient errors (counted in `span.retries`), and through the hedger,
+    which bounds them by the current deadline and may send a duplicate past the agent's p95.
+
+    With a `stream` in streaming mode (STREAMING=1), the request uses generate_content_stream
+    instead, so the result's items reach the stream's consumer while the response is still
+    being generated; streamed requests are not hedged (a duplicate would hand over its items twice),
+    but every chunk must arrive within STREAM_IDLE_TIMEOUT and the deadline. If the call fails after
+    items were handed over, they are withdrawn (the consumer receives stream_json.RESET).
+
+    :param agent: The calling agent ("memory", "search", "investigate", "plan" or "schedule"); selects the cache TTL.
+    :param contents: The prompt contents.
+    :param parse: Optional parser applied to the response text. Only responses that parse are cached.
+    :param config: Optional GenerateContentConfig.
+    :param client: The genai.Client to call (defaults to the shared client of client_provider).
+    :param stream: Optional ItemStream that receives the parsed result's items: as each one completes
+        in streaming mode, otherwise once the response is parsed or served from the cache.
+    :returns: The parsed result, or the raw response text when no parser is given.
+    """
+    client = _client(client)
+    model = os.environ.get("AGENT_MODEL")
+    response_cache = cache_provider.get()
+    key = response_cache.make_key(model, contents, config)
+
+    with tracer.span("model", agent, model=model) as span:
+        span.attributes["input_tokens_est"] = context_budget.get().record(agent, contents)
+        cached_text = response_cache.get(key)
+        if cached_text is not None:
+            try:
+                result = parse(cached_text) if parse else cached_text
+                span.cache_hit = True
+                return _finish_stream(stream, result, span)
+            except Exception:
+                # A stale entry that no longer validates: drop it and ask the model again.
+                span.validation_failures += 1
+                response_cache.invalidate(key)
+
+        with withdrawn_on_error(stream):
+            if stream is not None and _streaming():
+                span.attributes["streamed"] = True
+                response = rate_limiter.get().call(
+                    lambda: _stream_response(client, model, contents, config, stream),
+                    span.attributes["input_tokens_est"], span=span)
+            else:
+                response = rate_limiter.get().call(
+                    lambda: hedger.get().call(
+                        agent, lambda: client.models.generate_content(model=model, contents=contents, config=config),
+                        timeout=remaining(), span=span),
+                    span.attributes["input_tokens_est"], span=span)
+            span.record_usage(response)
+            try:
+                result = parse(response.text) if parse else response.text
+            except Exception:
+                span.validation_failures += 1
+                raise
+        response_cache.put(key, agent, response.text)
+        return _finish_stream(stream, result, span)
+
+async def _agenerate(agent: str, contents: list, parse: Callable[[str], Any] | None = None, config: "types.GenerateContentConfig | None" = None, client: Any = None, stream: ItemStream | None = None) -> Any:
+    """
+    Async version of _generate, built on client.aio.
+
+    Concurrent calls with the same cache key are coalesced: one request goes upstream and every
+    caller parses its response (the followers' spans are marked `coalesced`). A follower's
+    stream receives the items once the shared response is complete.
+    """
+    client = _client(client)
+    model = os.environ.get("AGENT_MODEL")
+    response_cache = cache_provider.get()
+    key = response_cache.make_key(model, contents, config)
+
+    with tracer.span("model", agent, model=model) as span:
+        span.attributes["input_tokens_est"] = context_budget.get().record(agent, contents)
+        cached_text = response_cache.get(key)
+        if cached_text is not None:
+            try:
+                result = parse(cached_text) if parse else cached_text
+                span.cache_hit = True
+                return _finish_stream(stream, result, span)
+            except Exception:
+                span.validation_failures += 1
+                response_cache.invalidate(key)
+
+        if stream is not None and _streaming():
+            span.attributes["streamed"] = True
+            request = lambda: rate_limiter.get().acall(
+                lambda: _astream_response(client, model, contents, config, stream),
+                span.attributes["input_tokens_est"], span=span)
+        else:
+            request = lambda: rate_limiter.get().acall(
+                lambda: hedger.get().arun(
+                    agent, lambda: client.aio.models.generate_content(model=model, contents=contents, config=config), span=span),
+                span.attributes["input_tokens_est"], span=span)
+        with withdrawn_on_error(stream):
+            response, shared = await upstream_calls.run((id(client), key), request)
+            if shared:
+                span.attributes["coalesced"] = True
+            else:
+                span.record_usage(response)
+            try:
+                result = parse(response.text) if parse else response.text
+            except Exception:
+                span.validation_failures += 1
+                raise
+        if not shared:
+            response_cache.put(key, agent, response.text)
+        return _finish_stream(stream, result, span)
+
+def _parse_agent_json(raw_text: str, container: type[BaseModel], key: str) -> BaseModel:
+    """
+    Clean the model's text output and validate it against the agent's container schema.
+
+    :param raw_text: The raw response text returned by the model.
+    :param container: The Pydantic container model (e.g., ActivityProposalsList).
+    :param key: The container's list key, used when the model returns a bare list.
+    :returns: The validated container object.
+    """
+    # 🧹 Remove Markdown tags if they were added by mistake by the model.
+    raw_json_text = re.sub(r'```json|```', '', (raw_text or "").strip(), flags=re.IGNORECASE).strip()
+
+    if not raw_json_text:
+        raise ValueError("LLM returned an empty response text.")
+
+    data = json.loads(raw_json_text)
+
+    # ⚠️ Reform step (packaging): If it generated a list instead of a dictionary
+    if isinstance(data, list):
+        fixed_data = {key: data}
+    elif isinstance(data, dict):
+        fixed_data = data
+    else:
+        raise ValueError("LLM returned neither a list nor a dictionary.")
+
+    return container.model_validate(fixed_data)
+
+def _parse_structured(raw_text: str, container: type[BaseModel]) -> BaseModel:
+    """
+    Validate a native structured-output response straight from the raw JSON text, using the
+    container's compiled pydantic-core validator. Falls back to the lenient cleanup parser.
+    """
+    try:
+        return container.model_validate_json(raw_text)
+    except ValidationError:
+        return _parse_agent_json(raw_text, container, _CONTAINER_KEYS[container])
+
+def _output_parser(container: type[BaseModel]) -> Callable[[str], BaseModel]:
+    """The response parser of an agent returning `container`, for the active output mode."""
+    if _structured_output():
+        return lambda text: _parse_structured(text, container)
+    return lambda text: _parse_agent_json(text, container, _CONTAINER_KEYS[container])
+
+def _output_config(container: type[BaseModel]) -> "types.GenerateContentConfig | None":
+    """The request config of an agent returning `container`: the response schema in structured mode."""
+    return _structured_config(container) if _structured_output() else None
+
+def _item_stream(container: type[BaseModel], on_item: Callable[[Any], None] | None) -> ItemStream | None:
+    """The ItemStream handing the items of an agent's `container` result to `on_item` (None without a consumer)."""
+    return ItemStream(container, _CONTAINER_KEYS[container], on_item) if on_item is not None else None
+
+def _notify(on_item: Callable[[Any], None] | None, items: Iterable[Any] | None) -> None:
+    """Hand items that did not come from a model call (caches, catalog, solver, local builder) to a consumer."""
+    if on_item is not None:
+        for item in items or ():
+            deliver(on_item, item)
+
+def _notified(on_item: Callable[[Any], None] | None, items: List[Any] | None) -> List[Any] | None:
+    _notify(on_item, items)
+    return items
+
+def _schema_hint(container: type[BaseModel]) -> str:
+    """The schema pasted into the prompt; empty in structured mode, where the API enforces it."""
+    return "" if _structured_output() else f"\nSchema: {_schema_text(container)}"
+
+def _scheduler_prompt(final_itinerary: List[DailyPlan], start_date: str) -> List[str]:
+    """Build the scheduler agent's [system, user] prompt."""
+    # 1. Formulating the Request
     system_prompt = (
         "You are The Scheduler Agent. Your task is to finalize the travel itinerary by simulating "
         "the booking of all planned activities and generating a **BookingConfirmation** JSON object. "
         "You must generate unique, realistic-sounding confirmation codes (e.g., 'CAI789-F') "
         "and booking times for each activity. The total cost must reflect the sum of the estimated daily costs from the itinerary. "
         "Your output MUST be a clean JSON object that strictly follows the provided Pydantic schema."
-        f"\nSchema: {BookingConfirmation.model_json_schema()}"
+        f"{_schema_hint(BookingConfirmation)}"
         "\n\nCRITICAL: Output ONLY the JSON object. Do not include any text or markdown fences."
     )
-    
-    user_prompt = (
-        f"The final itinerary to be confirmed is: {itinerary_text}. "
-        f"The entire trip starts on the **actual date**: {start_date}. " 
+
+    instructions = (
+        f"The entire trip starts on the **actual date**: {start_date}. "
         "Ensure your suggested booking times and confirmation codes are realistic considering this starting date."
     )
 
+    # 2. Convert the final itinerary to a compact table (themes are not needed to book); every day must be booked.
+    itinerary_text, _ = context_budget.get().fit_table(
+        "schedule", ("day", "date", "activities", "daily_cost"),
+        [(p.day, p.date, p.activities, p.total_daily_cost) for p in final_itinerary],
+        used=[system_prompt, instructions, "The final itinerary to be confirmed is:\n\n"], required=True,
+    )
+    user_prompt = f"The final itinerary to be confirmed is:\n{itinerary_text}\n{instructions}"
+    return [system_prompt, user_prompt]
+
+def _report_bookings(outcomes: List[BookingOutcome]) -> int:
+    """Print the booking summary and any per-activity failures. :returns: The number of successful bookings."""
+    successful_calls = sum(1 for outcome in outcomes if outcome.success)
+    for outcome in outcomes:
+        if not outcome.success:
+            emit(f"⚠️ Booking failed for {outcome.activity_name} on {outcome.date} after {outcome.attempts} attempts: {outcome.error}")
+    emit(f"✅ Scheduling Agent: The booking tool has been successfully called. {successful_calls}/{len(outcomes)} مرات.")
+    return successful_calls
+
+def _booking_namespace(trip_id: str | None) -> str:
+    """
+    Scope of a trip's booking idempotency keys and confirmation codes: the given trip id, else the
+    current trip's (trip_context), else a fresh one, so that different trips never share a booking.
+    """
+    return trip_id or current_trip.get() or uuid.uuid4().hex
+
+def _book_itinerary(final_itinerary: List[DailyPlan], start_date: str, namespace: str) -> List[BookingOutcome]:
+    """
+    Send every planned activity of the itinerary to the booking service in one concurrent dispatch
+    (on an event loop of its own: not callable from a running loop, see _abook_itinerary).
+
+    :param namespace: The trip's booking namespace (see _booking_namespace).
+
+    :returns: One BookingOutcome per activity.
+    """
+    with tracer.span("tool", "BookingDispatcher.dispatch"):
+        outcomes = booking_provider.get().dispatch(final_itinerary, start_date, namespace)
+    _report_bookings(outcomes)
+    return outcomes
+
+async def _abook_itinerary(final_itinerary: List[DailyPlan], start_date: str, namespace: str) -> List[BookingOutcome]:
+    """Async version of _book_itinerary."""
+    with tracer.span("tool", "BookingDispatcher.dispatch"):
+        outcomes = await booking_provider.get().dispatch_async(final_itinerary, start_date, namespace)
+    _report_bookings(outcomes)
+    return outcomes
+
+def _search_prompt(destination: str, interests: list) -> str:
+    """Build the search prompt used by fetch_real_data_with_gemini_tool."""
+    interests_str = ", ".join(interests)
+
+    # 1. Building the query
+    query = (
+        f"Key activities, estimated daily travel cost, and top tourist sites in {destination} "
+        f"for a visitor interested in {interests_str}. Provide activity names and rough prices."
+    )
+    # 2. Drafting the claim
+    return (
+        f"Use your access to Google Search to find the following information: {query}. "
+        "Provide a concise summary including the average daily travel cost and two key historical activities."
+    )
+
+def _planner_prompt(destination: str, duration: int, proposals: List[ActivityProposal], daily_budget: float, logistics_data: str) -> List[str]:
+    """Build the planner agent's [system, user] prompt."""
+    system_prompt = (
+        "You are The Logistics Planner Agent, an expert in travel strategy. "
+        f"Your goal is to organize the given activities into a cohesive, day-by-day itinerary for a {duration}-day trip (for simulation). "
+        "Use the logistics data to group activities logically (e.g., geographically close). "
+        f"The total cost for any single day MUST NOT exceed the daily budget of ${daily_budget}. "
+        "Your final output MUST be a JSON object with a key named 'itinerary' that strictly follows the provided Pydantic schema."
+        f"{_schema_hint(ItineraryList)}"
+        "\n\nCRITICAL: Output ONLY the JSON object. Do not include any text or markdown fences."
+    )
+
+    header = f"Design the {duration}-day itinerary for {destination}. Daily Budget: ${daily_budget}. "
+
+    # Establishment of a list of activities and budget (as part of the context), as a compact table;
+    # the activities come first, the logistics notes get what the stage's budget leaves.
+    budget = context_budget.get()
+    proposals_text, kept = budget.fit_table(
+        "plan", ("activity_name", "estimated_cost", "category"),
+        [(p.activity_name, p.estimated_cost, p.category) for p in proposals],
+        used=[system_prompt, header, "Available Activities (with costs):\n\nLogistical Constraints: ."],
+    )
+    if kept < len(proposals):
+        emit(f"⚠️ Planner prompt over budget: {len(proposals) - kept} of {len(proposals)} activities left out.")
+    logistics_text = budget.fit_text("plan", logistics_data, used=[system_prompt, header, proposals_text, "Available Activities (with costs):\n\nLogistical Constraints: ."])
+
+    user_prompt = (
+        f"{header}"
+        f"Available Activities (with costs):\n{proposals_text}\n"
+        f"Logistical Constraints: {logistics_text}."
+    )
+    return [system_prompt, user_prompt]
+
+def _solve_plan(destination: str, duration: int, proposals: List[ActivityProposal], daily_budget: float, start_date: str | None) -> List[DailyPlan] | None:
+    """
+    Build the itinerary with the local solver; None when no activity fits the daily budget.
+    Activities with known coordinates are grouped by area instead of category, and each day is in visit order.
+    """
+    logistics = TravelTools.logistics()
+    itinerary = solve_itinerary(proposals, duration, daily_budget, start_date,
+                                group_key=logistics.group_key(destination, proposals))
+    if not any(day_plan.activities for day_plan in itinerary):
+        emit(f"❌ Solver: no activity fits the daily budget of ${daily_budget}.")
+        return None
+    itinerary = logistics.order_itinerary(destination, itinerary)
+    emit("✅ The planning solver successfully generated the itinerary.")
+    return itinerary
+
+def _theme_prompt(destination: str, itinerary: List[DailyPlan]) -> List[str]:
+    """Build the prompt asking the model for one theme label per day."""
+    days_text = "; ".join(f"Day {p.day}: {', '.join(p.activities) or 'free time'}" for p in itinerary)
+    return [
+        "You are The Logistics Planner Agent. Give each day of the itinerary a short, catchy theme (max 5 words). "
+        "Output ONLY a JSON list of strings, one per day, in order. Do not include any text or markdown fences.",
+        f"Itinerary for {destination}: {days_text}",
+    ]
+
+def _apply_theme_labels(itinerary: List[DailyPlan], raw_text: str) -> List[DailyPlan]:
+    """Replace the solver's day themes with the model's labels."""
+    labels = json.loads(re.sub(r'```json|```', '', raw_text.strip(), flags=re.IGNORECASE).strip())
+    if not isinstance(labels, list) or len(labels) != len(itinerary):
+        raise ValueError("LLM returned the wrong number of theme labels.")
+    return [p.model_copy(update={"theme": str(label)}) for p, label in zip(itinerary, labels)]
+
+def _investigator_prompt(destination: str, interests: List[str], tool_data: str) -> List[str]:
+    """Build the investigator agent's [system, user] prompt."""
+    system_prompt = (
+        "You are The Investigator Agent, an expert travel researcher. "
+        "Your task is to analyze the provided travel data and user interests, "
+        "then select exactly 5 highly relevant activities. "
+        "Your output MUST be a clean JSON object containing a 'proposals' list that strictly follows the provided structure."
+        f"{_schema_hint(ActivityProposalsList)}"
+        "\n\nCRITICAL: Output ONLY the JSON object. Do not include any explanations or markdown fences. "
+        "ENSURE all elements in the array are separated by a COMMA. **IMPORTANT: 'estimated_cost' MUST be a number (float or integer), NOT a string (e.g., 25.0, not '25.0').**" # ⬅️ الإضافة الجديدة
+        "DO NOT add any conversational text, explanations, or markdown fences (e.g., ```json) "
+        "Generate a list of 5 activity proposals using the required JSON schema."
+        "before or after the JSON output."
+    )
+
+    request = f"The user is planning a trip to {destination} with interests in {', '.join(interests)}. "
+    # The search summary is free text of unbounded length: summarized down to the stage's budget.
+    tool_data = context_budget.get().fit_text("investigate", tool_data, used=[system_prompt, request, "Based on the following data: . "], keywords=interests)
+
+    user_prompt = (
+        f"Based on the following data: {tool_data}. "
+        f"{request}"
+
+    )
+    return [system_prompt, user_prompt]
+
+def _fused_investigator_prompt(destination: str, interests: List[str]) -> List[str]:
+    """
+    Build the [system, user] prompt of the fused investigator: grounded search and selection in one request.
+
+    The search tool cannot be combined with a response schema, so the schema is always pasted in the prompt.
+    """
+    system_prompt = (
+        "You are The Investigator Agent, an expert travel researcher. You have access to Google Search. "
+        "Search for current activities, opening details and prices at the destination that match the user's interests, "
+        "then select exactly 5 highly relevant activities with their approximate cost in dollars. "
+        "Your output MUST be a clean JSON object containing a 'proposals' list that strictly follows the provided structure."
+        f"\nSchema: {_schema_text(ActivityProposalsList)}"
+        "\n\nCRITICAL: Output ONLY the JSON object. Do not include any explanations, citations or markdown fences. "
+        "'estimated_cost' MUST be a number (e.g., 25.0, not '25.0')."
+    )
+    user_prompt = f"The user is planning a trip to {destination} with interests in {', '.join(interests)}."
+    return [system_prompt, user_prompt]
+
+def _semantic_lookup(stage: str, features: Dict[str, Any], partition: str = "") -> Any:
+    """The result of a sufficiently similar earlier request of `stage`, or None."""
+    with tracer.span("tool", "SemanticCache.lookup") as span:
+        result, similarity = semantic_cache_provider.get().lookup(stage, features, partition)
+        span.attributes.update(hit=result is not None, similarity=round(similarity, 4))
+    if result is not None:
+        emit(f"🧲 Stage '{stage}' served from a similar earlier request (similarity {similarity:.3f}).")
+    return result
+
+def _memory_request(duration_days: int, start_date: str, budget_range: str, interests: List[str] | None) -> Tuple[Dict[str, Any], str]:
+    """Semantic-cache features of a memory analyst request, and its partition: the user's history size."""
+    from semantic_cache import memory_features
+
+    return (memory_features(duration_days, start_date, budget_range, interests),
+            f"default:{LongTermMemoryTool.store().trip_count('default')}")
+
+def _investigate_request(destination: str, interests: List[str]) -> Dict[str, Any]:
+    from semantic_cache import investigate_features
+
+    return investigate_features(destination, interests)
+
+def _catalog_lookup(destination: str, interests: List[str]) -> Tuple[Dict[str, List[ActivityProposal]], List[str]]:
+    """Split the interests into those the activity catalog covers for `destination` and those to research."""
+    with tracer.span("tool", "ActivityCatalog.lookup") as span:
+        covered, missing = catalog_provider.get().lookup(destination, interests)
+        span.attributes.update(covered=len(covered), missing=len(missing))
+    if covered and missing:
+        emit(f"📚 Catalog covers {', '.join(covered)} in {destination}; researching {', '.join(missing)}.")
+    return covered, missing
+
+def _from_catalog(destination: str, interests: List[str], covered: Dict[str, List[ActivityProposal]]) -> List[ActivityProposal]:
+    emit(f"📚 Activities for {', '.join(interests)} in {destination} served from the catalog.")
+    return merge_activities(covered[interest] for interest in interests)
+
+def _with_catalog(destination: str, researched: List[str], covered: Dict[str, List[ActivityProposal]],
+                  proposals: List[ActivityProposal] | None) -> List[ActivityProposal] | None:
+    """Add freshly researched proposals to the catalog and merge them with the activities it already covered."""
+    if proposals is None:
+        return None
+    catalog_provider.get().add(destination, researched, proposals)
+    if not covered:
+        return proposals
+    return merge_activities([*covered.values(), proposals])
+
+# Fixed text around the memory report in the memory analyst's user prompt (counted against the stage's budget).
+_MEMORY_REPORT_FRAME = (
+    "Analyze the following data and generate 3 destination proposals: \n\n*** MEMORY ANALYSIS REPORT START ***\n"
+    "\n*** MEMORY ANALYSIS REPORT END ***\n\nGenerate 3 destination proposals using the required JSON schema."
+)
+
+def _memory_analyst_prompt(duration_days: int, start_date: str, budget_range: str, memory_report: str) -> List[str]:
+    """Build the memory analyst agent's [system, user] prompt."""
+    system_prompt = (
+        "You are The Memory Analyst Agent. Your task is to propose exactly 3 destinations "
+        "by analyzing the user's travel history and comparing it with their current budget and duration request. "
+        "The output MUST be a clean JSON object with a key 'proposals' that strictly follows the provided schema. "
+        f"{_schema_hint(DestinationProposalsList)}"
+        "\n\nCRITICAL: Output ONLY the JSON object. Justify each proposal using data from the memory report."
+    )
+
+    request = f"*** USER REQUEST ***: The user requested a trip of {duration_days} days starts in {start_date} with a {budget_range} budget.\n\n"
+    memory_report = context_budget.get().fit_text("memory", memory_report, used=[system_prompt, request, _MEMORY_REPORT_FRAME])
+
+    user_prompt = (
+        "Analyze the following data and generate 3 destination proposals: \n\n"
+        f"{request}"
+        "*** MEMORY ANALYSIS REPORT START ***\n"
+        f"{memory_report}\n" # ⬅️ وضع التقرير داخل فواصل
+        "*** MEMORY ANALYSIS REPORT END ***\n\n"
+        "Generate 3 destination proposals using the required JSON schema."
+    )
+    return [system_prompt, user_prompt]
+
+def _run_stage(request_key: str, stage: str, run: Callable[[], Any]) -> Any:
+    """
+    Return the stage's checkpointed output, or run the stage and checkpoint a successful result.
+
+    The stage's model calls are bounded by its deadline (and the trip's); a stage that starts
+    after the trip deadline has passed produces no result.
+    """
+    checkpoint_store = checkpoint_provider.get()
+    with tracer.span("stage", stage) as span, deadline(deadline_policy.get().for_stage(stage)):
+        output = checkpoint_store.load(request_key, stage)
+        if output:
+            span.attributes["resumed"] = True
+            emit(f"♻️ Resuming: stage '{stage}' loaded from checkpoint.")
+            return output
+        if remaining() == 0:
+            emit(f"⏱️ Stage '{stage}' skipped: the trip deadline has passed.")
+            span.error = "deadline exceeded"
+            return None
+        output = run()
+        if output:
+            checkpoint_store.save(request_key, stage, output)
+        else:
+            span.error = "no result"
+        return output
+
+async def _arun_stage(request_key: str, stage: str, run: Callable[[], Any]) -> Any:
+    """
+    Async version of _run_stage; `run` returns an awaitable.
+
+    The stage is cancelled when it passes its deadline (or the trip's), raising TimeoutError.
+    """
+    checkpoint_store = checkpoint_provider.get()
+    stage_deadline = deadline_policy.get().for_stage(stage)
+    trip_left = remaining()
+    trip_bound = stage_deadline is None or (trip_left is not None and trip_left < stage_deadline)
+    with tracer.span("stage", stage) as span, deadline(stage_deadline):
+        output = checkpoint_store.load(request_key, stage)
+        if output:
+            span.attributes["resumed"] = True
+            emit(f"♻️ Resuming: stage '{stage}' loaded from checkpoint.")
+            return output
+        try:
+            output = await asyncio.wait_for(run(), remaining())
+        except (TimeoutError, asyncio.TimeoutError):
+            # Python 3.10's asyncio.TimeoutError is not yet the builtin TimeoutError.
+            raise TimeoutError(f"Stage '{stage}' exceeded "
+                               + ("the trip deadline." if trip_bound else f"its deadline of {stage_deadline:g}s.")) from None
+        if output:
+            checkpoint_store.save(request_key, stage, output)
+        else:
+            span.error = "no result"
+        return output
+
+# F:
+def run_scheduler_agent(final_itinerary: List[DailyPlan], start_date: str, client: Any = None, destination: str | None = None,
+                        on_confirmation: Callable[[ConfirmationDetails], None] | None = None, trip_id: str | None = None) -> BookingConfirmation | None:
+    """
+    The scheduling and booking agent processes the itinerary and converts it into simulated booking confirmations.
+
+    By default no model call is made: the itinerary is booked and the confirmation is built
+    locally from the booking outcomes (confirmations.build_confirmation: exact total, unique
+    codes, booking times from the visit order and opening hours). With LLM_SCHEDULER=1, or if
+    the local build fails, the model writes the confirmation instead.
+
+    :param final_itinerary: The generated DailyPlan list.
+    :param start_date: The actual start date of the travel (e.g., “2025-12-01”).
+    :param client: The genai.Client to use (defaults to the shared client).
+    :param destination: The trip's destination (confirmation code prefix and POIs for the booking times).
+    :param on_confirmation: Optional consumer of each ConfirmationDetails, called as soon as it is available
+        (while the model's response is still streaming in streaming mode; stream_json.RESET withdraws those so far).
+    :param trip_id: Scopes the booking keys and confirmation codes to this trip (defaults to the current trip's id).
+    :returns: The BookingConfirmation object confirms simulated bookings.
+    """
+    namespace = _booking_namespace(trip_id)
+    if not _llm_scheduler():
+        outcomes = _book_itinerary(final_itinerary, start_date, namespace)
+        try:
+            return _local_confirmation(final_itinerary, start_date, namespace, outcomes, destination, on_confirmation)
+        except Exception as e:
+            emit(f"⚠️ Local confirmation failed, asking the model instead: {e}")
+
+    client = _client(client)
+    if not client: return None
+
     try:
-        # 3. Calling LLM to generate booking confirmations
-        response = client.models.generate_content(
-            model=os.environ.get("AGENT_MODEL"),
-            contents=[system_prompt, user_prompt]
+        # 3. Calling LLM to generate booking confirmations (4. JSON + 5. Validation)
+        validated_confirmation = _generate(
+            "schedule",
+            _scheduler_prompt(final_itinerary, start_date),
+            parse=_output_parser(BookingConfirmation),
+            config=_output_config(BookingConfirmation),
+            client=client,
+            stream=_item_stream(BookingConfirmation, on_confirmation),
         )
-        
-        # 4. JSON
-        raw_json_text = response.text.strip()
-        raw_json_text = re.sub(r'```json|```', '', raw_json_text, flags=re.IGNORECASE).strip()
-        data = json.loads(raw_json_text)
-        
-        # 5. Validation
-        validated_confirmation = BookingConfirmation.model_validate(data)
-        
-        print(f"✅ The scheduling agent successfully confirmed {len(validated_confirmation.confirmation_list)} Simulated Booking.")
-        
-        successful_calls = 0
-        
-        for day_plan in final_itinerary:
-            current_date = SchedulerTools.calculate_itinerary_date(start_date, day_plan.day) 
-            print(f"Test: Day {day_plan.day} is {current_date}") # طباعة أفضل للاختبار
-            # التكرار على جميع الأنشطة المخطط لها في هذا اليوم
-            for activity_name in day_plan.activities:
-                # Simulate sending the request
-                success = SchedulerTools.send_to_booking_api(
-                    activity=activity_name,
-                    date=current_date
-                )
-                if success:
-                    successful_calls += 1
-        
-        print(f"✅ Scheduling Agent: The booking tool has been successfully called. {successful_calls} مرات.")
+
+        emit(f"✅ The scheduling agent successfully confirmed {len(validated_confirmation.confirmation_list)} Simulated Booking.")
+
+        # The bookings are idempotent, so a fallback after the local build does not book twice.
+        _book_itinerary(final_itinerary, start_date, namespace)
 
         # =======================================================
-        
+
         return validated_confirmation
-        
+
     except Exception as e:
-        print(f"❌ Scheduler failed to plan or verify JSON: {e}")
-        return None       
+        emit(f"❌ Scheduler failed to plan or verify JSON: {e}")
+        return None
+
+def _local_confirmation(final_itinerary: List[DailyPlan], start_date: str, namespace: str, outcomes: List[BookingOutcome],
+                        destination: str | None, on_confirmation: Callable[[ConfirmationDetails], None] | None = None) -> BookingConfirmation:
+    confirmation = build_confirmation(final_itinerary, start_date, namespace, outcomes, destination)
+    _notify(on_confirmation, confirmation.confirmation_list)
+    confirmed = sum(1 for details in confirmation.confirmation_list if details.status == "Confirmed")
+    emit(f"✅ The scheduling agent confirmed {confirmed}/{len(confirmation.confirmation_list)} bookings locally.")
+    return confirmation
 
 # E: Search Agent To get destination Data
 # Called From C: 1
-def fetch_real_data_with_gemini_tool(destination: str, interests: list) -> str:
+def fetch_real_data_with_gemini_tool(destination: str, interests: list, client: Any = None) -> str:
     """
     The Gemini model uses the built-in Google Search tool to retrieve real information.
-    
+
     :param destination: The Area to be searched for on the web.
     :param interests: The interests in the Area to be searched for on the web.
+    :param client: The genai.Client to use (defaults to the shared client).
     :returns: The model's response, which includes the search results.
     """
-    
-    interests_str = ", ".join(interests)
-    
-    # 1. Building the query
-    query = (
-        f"Key activities, estimated daily travel cost, and top tourist sites in {destination} "
-        f"for a visitor interested in {interests_str}. Provide activity names and rough prices."
-    )
-    # 2. Drafting the claim
-    prompt = (
-        f"Use your access to Google Search to find the following information: {query}. "
-        "Provide a concise summary including the average daily travel cost and two key historical activities."
-    )
-    
+
+    prompt = _search_prompt(destination, interests)
+
     try:
         # Call up
-        response = client.models.generate_content(
-            model=os.environ.get("AGENT_MODEL"),
-            contents=[prompt],
+        text = _generate(
+            "search",
+            [prompt],
             #config=config # تمرير التكوين
+            client=client,
         )
-        
-        print("✅ Gemini successfully executed the search and generated a response.")
-        return response.text
-        
+
+        emit("✅ Gemini successfully executed the search and generated a response.")
+        return text
+
     except Exception as e:
         return f"❌ Failed to fetch data using Gemini tool: {e}"
 
 # D: The Plan Agent
 # Called From A: 3
-def run_planner_agent(destination: str, duration: int, proposals: List[ActivityProposal], daily_budget: float) -> List[DailyPlan] | None:
+def run_planner_agent(destination: str, duration: int, proposals: List[ActivityProposal], daily_budget: float, start_date: str | None = None, use_solver: bool = True, llm_themes: bool = False, client: Any = None,
+                      on_day: Callable[[DailyPlan], None] | None = None) -> List[DailyPlan] | None:
     """
-    The logistics planner agent organizes the selected activities into a coherent daily itinerary 
+    The logistics planner agent organizes the selected activities into a coherent daily itinerary
     that respects the total duration and the user's daily budget constraints.
-    
+
+    By default the itinerary is built by the local solver (itinerary_solver.solve_itinerary), which
+    guarantees the budget; the model is only asked for day themes when `llm_themes` is set.
+
     :param destination: The selected area for the travel (e.g., "Cairo").
     :param duration: The total number of days for the trip (e.g., 7).
     :param proposals: The list of analyzed and selected activity proposals (from the Investigator Agent).
     :param daily_budget: The maximum allowed spending per day (in USD, e.g., 180.0).
+    :param start_date: The actual start date of the trip ('YYYY-MM-DD'), used for the daily dates.
+    :param use_solver: Build the itinerary locally instead of asking the model.
+    :param llm_themes: With the solver, ask the model for day theme labels.
+    :param client: The genai.Client to use (defaults to the shared client).
+    :param on_day: Optional consumer of each DailyPlan, called as soon as it is available
+        (while the model's response is still streaming when the model plans in streaming mode; stream_json.RESET
+        withdraws those so far).
     :returns: The generated list of DailyPlan objects, or None if planning fails due to constraints.
     """
+    if use_solver:
+        itinerary = _solve_plan(destination, duration, proposals, daily_budget, start_date)
+        if itinerary and llm_themes and _client(client):
+            try:
+                itinerary = _generate("theme", _theme_prompt(destination, itinerary),
+                                      parse=lambda text: _apply_theme_labels(itinerary, text), client=client)
+            except Exception as e:
+                emit(f"⚠️ Theme labelling failed, keeping the solver's themes: {e}")
+        _notify(on_day, itinerary)
+        return itinerary
+
+    client = _client(client)
     if not client: return None
 
     # 1. Using the tool to collect logistical data (simulation)
     activity_names = [p.activity_name for p in proposals]
-    logistics_data = TravelTools.calculate_travel_time(activity_names)
-    
-    # 2. Establishment of a list of activities and budget (as part of the context)
-    proposals_text = json.dumps([p.model_dump() for p in proposals], ensure_ascii=False)
+    logistics_data = TravelTools.calculate_travel_time(activity_names, destination)
 
-    # 3. Formulating the claim
-    system_prompt = (
-        "You are The Logistics Planner Agent, an expert in travel strategy. "
-        f"Your goal is to organize the given activities into a cohesive, day-by-day itinerary for a {duration}-day trip (for simulation). "
-        "Use the logistics data to group activities logically (e.g., geographically close). "
-        "The total cost for any single day MUST NOT exceed the daily budget of $180. "
-        "Your final output MUST be a JSON object with a key named 'itinerary' that strictly follows the provided Pydantic schema."
-        f"\nSchema: {ItineraryList.model_json_schema()}"
-        "\n\nCRITICAL: Output ONLY the JSON object. Do not include any text or markdown fences."
-    )
-    
-    user_prompt = (
-        f"Design the {duration}-day itinerary for {destination}. Daily Budget: ${daily_budget}. "
-        f"Available Activities (with costs): {proposals_text}. "
-        f"Logistical Constraints: {logistics_data}."
-    )
+    # 2. + 3. Formulating the claim
+    contents = _planner_prompt(destination, duration, proposals, daily_budget, logistics_data)
 
     try:
         # Call LLM (without response_schema)
-        response = client.models.generate_content(
-            model=os.environ.get("AGENT_MODEL"),
-            contents=[system_prompt, user_prompt]
+        validated_container = _generate(
+            "plan",
+            contents,
+            parse=_output_parser(ItineraryList),
+            config=_output_config(ItineraryList),
+            client=client,
+            stream=_item_stream(ItineraryList, on_day),
         )
-        
-        raw_json_text = response.text.strip()
-        raw_json_text = re.sub(r'```json|```', '', raw_json_text, flags=re.IGNORECASE).strip()
-
-        data = json.loads(raw_json_text)
-        
-        # ⚠️ Reform step (packaging): If it generated a list instead of a dictionary
-        if isinstance(data, list):
-            fixed_data = {"itinerary": data}
-        else:
-            fixed_data = data
-        
-        validated_container = ItineraryList.model_validate(fixed_data)
-        
-        print("✅ The planning agent successfully generated the itinerary.!")
+
+        emit("✅ The planning agent successfully generated the itinerary.!")
         return validated_container.itinerary
-        
+
     except Exception as e:
-        print(f"❌ The agent's failure to plan or verify JSON: {e}")
-        return None        
+        emit(f"❌ The agent's failure to plan or verify JSON: {e}")
+        return None
 
 # C: investigator Agent
 # Called From A: 2
-def run_investigator_agent(destination: str, interests: List[str]) -> List[ActivityProposal] | None:
+def run_investigator_agent(destination: str, interests: List[str], client: Any = None,
+                           on_activity: Callable[[ActivityProposal], None] | None = None) -> List[ActivityProposal] | None:
     """
-    The investigator agent conducts real-time web research (via Gemini Search Tool) to find 
-    relevant activities and costs, then converts the findings into a structured list 
+    The investigator agent conducts real-time web research (via Gemini Search Tool) to find
+    relevant activities and costs, then converts the findings into a structured list
     of activity proposals in JSON format.
-    
+
     :param destination: The confirmed travel destination (e.g., "Cairo, Egypt").
     :param interests: A list of the user's key interests (e.g., ["History", "Art", "Local Cuisine"]).
-    :returns: A list of ActivityProposal objects containing the activity name, price, and description, 
+    :param client: The genai.Client to use (defaults to the shared client).
+    :param on_activity: Optional consumer of each ActivityProposal, called as soon as it is available
+        (while the model's response is still streaming in streaming mode; stream_json.RESET withdraws those so far).
+    :returns: A list of ActivityProposal objects containing the activity name, price, and description,
               or None if the search fails or the JSON is invalid.
+
+    A near-duplicate of an earlier request (e.g. "Cairo" for "Cairo, Egypt") reuses its result
+    from the semantic cache. Otherwise, interests already researched for the destination are
+    served from the activity catalog; only the missing ones are researched (and then added to
+    the catalog). When the catalog covers part of the interests, the consumer receives the
+    merged list once the research is done rather than the researched activities as they stream.
     """
+    features = _investigate_request(destination, interests)
+    similar = _semantic_lookup("investigate", features)
+    if similar is not None:
+        return _notified(on_activity, similar)
+
+    covered, missing = _catalog_lookup(destination, interests)
+    if covered and not missing:
+        return _notified(on_activity, _from_catalog(destination, interests, covered))
+
+    researched = _research_activities(destination, missing, client, on_activity=None if covered else on_activity)
+    proposals = _with_catalog(destination, missing, covered, researched)
+    if covered:
+        _notify(on_activity, proposals)
+    semantic_cache_provider.get().put("investigate", features, proposals)
+    return proposals
+
+def _research_activities(destination: str, interests: List[str], client: Any = None,
+                         on_activity: Callable[[ActivityProposal], None] | None = None) -> List[ActivityProposal] | None:
+    """
+    Search the web for `interests` in `destination` and structure the findings: two model calls,
+    or one grounded call in fused mode (see _fused_investigator).
+    """
+    client = _client(client)
     if not client:
-        print("Agent execution skipped due to missing API client.")
+        emit("Agent execution skipped due to missing API client.")
         return None
-    
+
+    if _fused_investigator():
+        try:
+            validated_container = _generate(
+                "investigate_fused",
+                _fused_investigator_prompt(destination, interests),
+                parse=lambda text: _parse_agent_json(text, ActivityProposalsList, "proposals"),
+                config=_grounded_config(),
+                client=client,
+                stream=_item_stream(ActivityProposalsList, on_activity),
+            )
+            emit("✅ The agent searched and generated valid JSON in one grounded call.")
+            return validated_container.proposals
+        except Exception as e:
+            emit(f"Error : B: ❌ Fused investigator failed to search or verify JSON: {e}")
+            return None
+
     # Use the tool to collect the data the agent needs.
-    tool_data = fetch_real_data_with_gemini_tool(destination, interests)
+    tool_data = fetch_real_data_with_gemini_tool(destination, interests, client)
     if tool_data.startswith("❌ Failed"):
-        print("Agent execution stopped due to failure in data fetching.")
+        emit("Agent execution stopped due to failure in data fetching.")
         return None
-    
-    # صياغة المطالبة
-    system_prompt = (
-        "You are The Investigator Agent, an expert travel researcher. "
-        "Your task is to analyze the provided travel data and user interests, "
-        "then select exactly 5 highly relevant activities. "
-        "Your output MUST be a clean JSON object containing a 'proposals' list that strictly follows the provided structure: "
-        f"{ActivityProposalsList.model_json_schema()}"
-        "\n\nCRITICAL: Output ONLY the JSON object. Do not include any explanations or markdown fences. "
-        "ENSURE all elements in the array are separated by a COMMA. **IMPORTANT: 'estimated_cost' MUST be a number (float or integer), NOT a string (e.g., 25.0, not '25.0').**" # ⬅️ الإضافة الجديدة
-        "DO NOT add any conversational text, explanations, or markdown fences (e.g., ```json) "
-        "Generate a list of 5 activity proposals using the required JSON schema."
-        "before or after the JSON output."
-    )
-    
-    user_prompt = (
-        f"Based on the following data: {tool_data}. "
-        f"The user is planning a trip to {destination} with interests in {', '.join(interests)}. "
-        
-    )
-    
+
     try:
         # LLM invocation with response JSON (Output Formatting)
-        response = client.models.generate_content(
-            model=os.environ.get("AGENT_MODEL"),
-            contents=[system_prompt, user_prompt],
-            
-        )
         # Note: The Gemini API model returns JSON as text in response.text.
-        raw_json_text = response.text.strip()
-        
-        # 🧹Additional cleaning step: Remove Markdown tags if they were added by mistake by the form.
-        raw_json_text = re.sub(r'```json|```', '', raw_json_text, flags=re.IGNORECASE).strip()
-
-        if not raw_json_text:
-            raise ValueError("LLM returned an empty response text.")
-        
-        # Uploading raw text to the Python dictionary
-        data = json.loads(raw_json_text)
-        
-        # ⚠️ The crucial step: fixing the structure before validating Pydantic
-        if isinstance(data, list):
-            # If the output is a list, wrap it inside the expected structure.
-            fixed_data = {"proposals": data}
-            print("🔧 Formatting fixed: Menu wrapped inside key 'proposals'.")
-        elif isinstance(data, dict):
-            # If the output is a dictionary, use it directly.
-            fixed_data = data
-        else:
-             raise ValueError("LLM returned neither a list nor a dictionary.")
-        
         # Validating the dictionary using the container Pydantic
-        validated_container = ActivityProposalsList.model_validate(fixed_data)
-        
+        validated_container = _generate(
+            "investigate",
+            _investigator_prompt(destination, interests, tool_data),
+            parse=_output_parser(ActivityProposalsList),
+            config=_output_config(ActivityProposalsList),
+            client=client,
+            stream=_item_stream(ActivityProposalsList, on_activity),
+        )
+
         # Return to the actual list
         proposals = validated_container.proposals
-        
-        print("✅ The agent successfully generated valid and authenticated JSON (based on the claim).")
+
+        emit("✅ The agent successfully generated valid and authenticated JSON (based on the claim).")
         return proposals
-        
+
     except Exception as e:
-        print(f"Error : B: ❌ Agent failed to generate or verify JSON: {e}")
+        emit(f"Error : B: ❌ Agent failed to generate or verify JSON: {e}")
         return None
 
 # B Analyst Agent
 # Called From A: 1
-def run_memory_analyst_agent(duration_days: int, start_date: str, budget_range: str) -> List[DestinationProposal] | None:
+def run_memory_analyst_agent(duration_days: int, start_date: str, budget_range: str, interests: List[str] | None = None, client: Any = None) -> List[DestinationProposal] | None:
     """
-    The Memory Analyst Agent utilizes the LongTermMemoryTool to analyze the user's past travel 
+    The Memory Analyst Agent utilizes the LongTermMemoryTool to analyze the user's past travel
     history and uses this context to suggest exactly 3 tailored destinations.
-    
+
     :param duration_days: The requested number of days for the new trip.
     :param start_date: The actual start date of the planned trip (e.g., '2025-12-01').
     :param budget_range: The user's desired budget level (e.g., "Mid-range", "Luxury").
-    :returns: A list of 3 structured DestinationProposal objects, including the estimated cost and reasoning, 
+    :param interests: The user's interests for the new trip, used to retrieve similar past trips.
+    :param client: The genai.Client to use (defaults to the shared client).
+    :returns: A list of 3 structured DestinationProposal objects, including the estimated cost and reasoning,
               or None if the agent fails to generate valid JSON.
+
+    Near-duplicates of an earlier request with the same history (e.g. reordered interests or
+    another start date in the same season) reuse its proposals from the semantic cache.
     """
+    features, partition = _memory_request(duration_days, start_date, budget_range, interests)
+    similar = _semantic_lookup("memory", features, partition)
+    if similar is not None:
+        return similar
+
+    client = _client(client)
     if not client: return None
 
     # 1. Using the tool to retrieve the long-term memory report
-    memory_report = LongTermMemoryTool.analyze_past_trips(budget_range, duration_days)
-    
+    memory_report = LongTermMemoryTool.analyze_past_trips(budget_range, duration_days, interests, start_date)
+
     # 2. Formulating the claim
-    system_prompt = (
-        "You are The Memory Analyst Agent. Your task is to propose exactly 3 destinations "
-        "by analyzing the user's travel history and comparing it with their current budget and duration request. "
-        "The output MUST be a clean JSON object with a key 'proposals' that strictly follows the provided schema. "
-        f"\nSchema: {DestinationProposalsList.model_json_schema()}"
-        "\n\nCRITICAL: Output ONLY the JSON object. Justify each proposal using data from the memory report."
-    )
-    
-    user_prompt = (
-        "Analyze the following data and generate 3 destination proposals: \n\n"
-        f"*** USER REQUEST ***: The user requested a trip of {duration_days} days starts in {start_date} with a {budget_range} budget.\n\n"
-        "*** MEMORY ANALYSIS REPORT START ***\n"
-        f"{memory_report}\n" # ⬅️ وضع التقرير داخل فواصل
-        "*** MEMORY ANALYSIS REPORT END ***\n\n"
-        "Generate 3 destination proposals using the required JSON schema."
-    )
+    contents = _memory_analyst_prompt(duration_days, start_date, budget_range, memory_report)
     try:
         # Call LLM
-        response = client.models.generate_content(
-            model=os.environ.get("AGENT_MODEL"),
-            contents=[system_prompt, user_prompt]
+        validated_container = _generate(
+            "memory",
+            contents,
+            parse=_output_parser(DestinationProposalsList),
+            config=_output_config(DestinationProposalsList),
+            client=client,
         )
-        
-        raw_json_text = response.text.strip()
-        raw_json_text = re.sub(r'```json|```', '', raw_json_text, flags=re.IGNORECASE).strip()
-
-        data = json.loads(raw_json_text)
-        
-        # ⚠️ Reform step (packaging)
-        if isinstance(data, list):
-            fixed_data = {"proposals": data}
-        else:
-            fixed_data = data
-        
-        validated_container = DestinationProposalsList.model_validate(fixed_data)
-        
-        print("✅ The analyst's assistant successfully analysed the memory and suggested destinations.")
+
+        emit("✅ The analyst's assistant successfully analysed the memory and suggested destinations.")
+        semantic_cache_provider.get().put("memory", features, validated_container.proposals, partition)
         return validated_container.proposals
-        
+
     except Exception as e:
-        print(f"❌ Failure of the agent and memory: {e}")
+        emit(f"❌ Failure of the agent and memory: {e}")
+        return None
+
+def _activity_consumer(destination: str) -> Callable[[ActivityProposal], None] | None:
+    """
+    The sequence's consumer of the investigator's activities in streaming mode (None otherwise): each activity is
+    printed as it arrives, and the first one found among the destination's POIs starts building the destination's
+    distance matrix, which the planner then finds ready.
+    """
+    if not _streaming():
         return None
+    logistics = TravelTools.logistics()
+    warmed = set()
+
+    def _on_activity(proposal: ActivityProposal) -> None:
+        if proposal is RESET:
+            emit("  ↩️ The activities above came from a failed response; its retry follows.")
+            return
+        emit(f"  🔎 {proposal.activity_name}: ${proposal.estimated_cost:g} ({proposal.category})")
+        key, located = logistics.locate([proposal.activity_name], destination)
+        if located and key not in warmed:
+            warmed.add(key)
+            logistics.matrix(key)
+
+    return _on_activity
+
+def _confirmation_consumer() -> Callable[[ConfirmationDetails], None] | None:
+    """The sequence's consumer of the scheduler's confirmations in streaming mode: each one is printed as it arrives."""
+    if not _streaming():
+        return None
+
+    def _on_confirmation(details: ConfirmationDetails) -> None:
+        if details is RESET:
+            emit("  ↩️ The confirmations above came from a failed response; its retry follows.")
+            return
+        emit(f"  🎫 {details.activity_name}: {details.status} {details.confirmation_code} at {details.booking_time}")
+
+    return _on_confirmation
 
 # A: Start
-def test_full_sequence_interactive(duration: int, start_date: str,interests: List[str], budget_range: str, daily_budget: float):
+def test_full_sequence_interactive(duration: int, start_date: str,interests: List[str], budget_range: str, daily_budget: float, fresh: bool = False, client: Any = None, deadline_s: float | None = None):
     """
     Executes the full multi-agent travel planning workflow interactively, simulating user selection.
-    
+
     The sequence covers four main stages:
-    1.  Memory Analysis: The Memory Analyst Agent proposes destinations based on past trips, 
+    1.  Memory Analysis: The Memory Analyst Agent proposes destinations based on past trips,
         duration, and budget (using LongTermMemoryTool).
-    2.  User Selection & Investigation: Simulates the user selecting a destination. The Investigator 
+    2.  User Selection & Investigation: Simulates the user selecting a destination. The Investigator
         Agent then searches for real activities and costs (using Gemini Search Tool).
-    3.  Logistics Planning: The Planner Agent organizes the activities into a coherent daily itinerary, 
+    3.  Logistics Planning: The Planner Agent organizes the activities into a coherent daily itinerary,
         respecting the duration and daily budget.
-    4.  Execution Simulation: The Scheduler Agent simulates the final booking process, confirming 
+    4.  Execution Simulation: The Scheduler Agent simulates the final booking process, confirming
         the activities and generating a confirmation summary.
-        
+
     :param duration: Total duration of the trip in days.
     :param start_date: The actual start date of the trip ('YYYY-MM-DD').
     :param interests: A list of the user's key interests for the trip.
     :param budget_range: The general budget level (e.g., "Mid-range").
     :param daily_budget: The maximum spending limit per day (float).
+    :param fresh: Ignore (and discard) the checkpoints of a previous run of the same request.
+    :param client: The genai.Client shared by the agents (defaults to the lazily built shared client).
+    :param deadline_s: End-to-end deadline of the trip in seconds (defaults to TRAVEL_TRIP_DEADLINE; None without it).
     :returns: None (This function primarily prints the process and the final output to the console).
+
+    Every completed stage is checkpointed (see checkpoints.CheckpointStore), so rerunning the same
+    request after a failure resumes from the first incomplete stage; a booked request's checkpoints are cleared.
     """
-    # ----------------------------------------------------
-    # Stage 0: Memory Analyst Agent
-    # ----------------------------------------------------
-    print("--- 0. Run the memory agent and analyser to suggest destinations. ---")
-    suggested_destinations = run_memory_analyst_agent(duration, start_date, budget_range)
-    
-    if not suggested_destinations:
-        print("❌ Sequence failure: The memory agent did not provide any suggestions.")
-        return
-
-    print("\n--- ✅ Destinations suggested based on previous history ---")
-    
-    # User selection simulation
-    selected_proposal = suggested_destinations[0] # ⬅️ We choose the first suggestion as an example.
-    
-    # Specifying the data that would be collected interactively via conversation
-    final_destination = selected_proposal.destination_name
-    
-    print(f"--- 🗣️ Simulating user decision: Selected {final_destination} With interest {interests} ---")
-    
-    # ----------------------------------------------------
-    # Stage 1: Investigator Agent
-    # ----------------------------------------------------
-    print("\n--- 1. Run the Investigator Agent to fetch real activities (using Google Search Tool) ---")
-    proposals = run_investigator_agent(final_destination, interests)
-
-    if proposals:
+    request_key = checkpoint_key(TripRequest(duration=duration, start_date=start_date, interests=interests,
+                                             budget_range=budget_range, daily_budget=daily_budget))
+    if fresh:
+        checkpoint_provider.get().clear(request_key)
+
+    if deadline_s is None:
+        deadline_s = deadline_policy.get().trip
+
+    with trip_context(request_key[:16]), deadline(deadline_s):
+        # ----------------------------------------------------
+        # Stage 0: Memory Analyst Agent
+        # ----------------------------------------------------
+        emit("--- 0. Run the memory agent and analyser to suggest destinations. ---")
+        suggested_destinations = _run_stage(request_key, "memory", lambda: run_memory_analyst_agent(duration, start_date, budget_range, interests, client=client))
+
+        if not suggested_destinations:
+            emit("❌ Sequence failure: The memory agent did not provide any suggestions.")
+            return
+
+        emit("\n--- ✅ Destinations suggested based on previous history ---")
+
+        # User selection simulation
+        selected_proposal = suggested_destinations[0] # ⬅️ We choose the first suggestion as an example.
+
+        # Specifying the data that would be collected interactively via conversation
+        final_destination = selected_proposal.destination_name
+
+        emit(f"--- 🗣️ Simulating user decision: Selected {final_destination} With interest {interests} ---")
+
         # ----------------------------------------------------
-        # Stage 2: Logistics Planner Agent (Planner Agent)
+        # Stage 1: Investigator Agent
         # ----------------------------------------------------
-        print("\n--- 2. Run the logistics planner agent to create the route. ---")
-        itinerary = run_planner_agent(final_destination, duration, proposals, daily_budget)
-        
-        if itinerary:
-            print("\n--- 🗺️ The final track has been successfully created. ---")
-            
-            for day_plan in itinerary:
-                print(f"Day {day_plan.day} ({day_plan.theme}): {', '.join(day_plan.activities)} | Cost: ${day_plan.total_daily_cost}")
-                
-            # =======================================================
-            # ⬅️ Required modification: Add a call to the scheduling agent. (Scheduler Agent)
-            # =======================================================
-            
-            print("\n--- 3. Run the Scheduling and Booking Agent (Simulated Booking) ---")
-            confirmation = run_scheduler_agent(itinerary,start_date) # ⬅️ The new call
-            
-            if confirmation:
-                print("\n--- 🏁 Sequence complete: Simulated reservations confirmed ---")
-                print(f"✅ Total confirmed cost of bookings: ${confirmation.total_cost_booked:.2f}")
-                print(f"✅ Confirmed {len(confirmation.confirmation_list)} Reservation. (Example: {confirmation.confirmation_list[0].activity_name})")
+        emit("\n--- 1. Run the Investigator Agent to fetch real activities (using Google Search Tool) ---")
+        proposals = _run_stage(request_key, "investigate", lambda: run_investigator_agent(
+            final_destination, interests, client=client, on_activity=_activity_consumer(final_destination)))
+
+        if proposals:
+            # ----------------------------------------------------
+            # Stage 2: Logistics Planner Agent (Planner Agent)
+            # ----------------------------------------------------
+            emit("\n--- 2. Run the logistics planner agent to create the route. ---")
+            itinerary = _run_stage(request_key, "plan", lambda: run_planner_agent(final_destination, duration, proposals, daily_budget, start_date, client=client))
+
+            if itinerary:
+                emit("\n--- 🗺️ The final track has been successfully created. ---")
+
+                for day_plan in itinerary:
+                    emit(f"Day {day_plan.day} ({day_plan.theme}): {', '.join(day_plan.activities)} | Cost: ${day_plan.total_daily_cost}")
+
+                # =======================================================
+                # ⬅️ Required modification: Add a call to the scheduling agent. (Scheduler Agent)
+                # =======================================================
+
+                emit("\n--- 3. Run the Scheduling and Booking Agent (Simulated Booking) ---")
+                confirmation = _run_stage(request_key, "schedule", lambda: run_scheduler_agent(
+                    itinerary,start_date, client=client, destination=final_destination, on_confirmation=_confirmation_consumer(),
+                    trip_id=request_key[:16])) # ⬅️ The new call
+
+                if confirmation:
+                    # Booked: the checkpoints were only for resuming, an identical request later is planned anew.
+                    checkpoint_provider.get().clear(request_key)
+                    emit("\n--- 🏁 Sequence complete: Simulated reservations confirmed ---")
+                    emit(f"✅ Total confirmed cost of bookings: ${confirmation.total_cost_booked:.2f}")
+                    emit(f"✅ Confirmed {len(confirmation.confirmation_list)} Reservation. (Example: {confirmation.confirmation_list[0].activity_name})")
+                else:
+                    emit("❌ Sequence failure: The scheduling agent did not succeed.")
+
             else:
-                print("❌ Sequence failure: The scheduling agent did not succeed.")
-            
+                emit("❌ Sequence failure: The agent didn't work..")
         else:
-            print("❌ Sequence failure: The agent didn't work..")
-    else:
-        print("❌ Sequence failure: The agent didn't work..")
+            emit("❌ Sequence failure: The agent didn't work..")
 
+# ==========================================================
+# Async agents (client.aio): same prompts and parsing as the sync agents above,
+# but every model call is awaited so many trips can share one event loop.
+# ==========================================================
+
+async def run_scheduler_agent_async(final_itinerary: List[DailyPlan], start_date: str, client: Any = None, destination: str | None = None,
+                                    on_confirmation: Callable[[ConfirmationDetails], None] | None = None, trip_id: str | None = None) -> BookingConfirmation | None:
+    """
+    Async version of run_scheduler_agent.
+
+    With the model writing the confirmation, the bookings do not depend on it, so they are
+    dispatched while the confirmation request is in flight.
+    """
+    namespace = _booking_namespace(trip_id)
+    if not _llm_scheduler():
+        outcomes = await _abook_itinerary(final_itinerary, start_date, namespace)
+        try:
+            return _local_confirmation(final_itinerary, start_date, namespace, outcomes, destination, on_confirmation)
+        except Exception as e:
+            emit(f"⚠️ Local confirmation failed, asking the model instead: {e}")
+
+    client = _client(client)
+    if not client: return None
 
-# Load API Key
-try:
-    load_dotenv()
-    os.environ["GOOGLE_API_KEY"] = os.environ.get("GOOGLE_API_KEY") 
-    print("✅ Gemini API key setup complete.")
-except Exception as e:
-    print(
-        f"🔑 Authentication Error: Please make sure you have added 'GOOGLE_API_KEY' to your Kaggle secrets. Details: {e}"
+    try:
+        validated_confirmation, _ = await asyncio.gather(
+            _agenerate(
+                "schedule",
+                _scheduler_prompt(final_itinerary, start_date),
+                parse=_output_parser(BookingConfirmation),
+                config=_output_config(BookingConfirmation),
+                client=client,
+                stream=_item_stream(BookingConfirmation, on_confirmation),
+            ),
+            _abook_itinerary(final_itinerary, start_date, namespace),
+        )
+
+        emit(f"✅ The scheduling agent successfully confirmed {len(validated_confirmation.confirmation_list)} Simulated Booking.")
+        return validated_confirmation
+
+    except Exception as e:
+        emit(f"❌ Scheduler failed to plan or verify JSON: {e}")
+        return None
+
+async def fetch_real_data_with_gemini_tool_async(destination: str, interests: list, client: Any = None) -> str:
+    """Async version of fetch_real_data_with_gemini_tool."""
+    try:
+        text = await _agenerate("search", [_search_prompt(destination, interests)], client=client)
+
+        emit("✅ Gemini successfully executed the search and generated a response.")
+        return text
+
+    except Exception as e:
+        return f"❌ Failed to fetch data using Gemini tool: {e}"
+
+async def run_planner_agent_async(destination: str, duration: int, proposals: List[ActivityProposal], daily_budget: float, start_date: str | None = None, use_solver: bool = True, llm_themes: bool = False, client: Any = None,
+                                  on_day: Callable[[DailyPlan], None] | None = None) -> List[DailyPlan] | None:
+    """Async version of run_planner_agent."""
+    if use_solver:
+        itinerary = _solve_plan(destination, duration, proposals, daily_budget, start_date)
+        if itinerary and llm_themes and _client(client):
+            try:
+                itinerary = await _agenerate("theme", _theme_prompt(destination, itinerary),
+                                             parse=lambda text: _apply_theme_labels(itinerary, text), client=client)
+            except Exception as e:
+                emit(f"⚠️ Theme labelling failed, keeping the solver's themes: {e}")
+        _notify(on_day, itinerary)
+        return itinerary
+
+    client = _client(client)
+    if not client: return None
+
+    activity_names = [p.activity_name for p in proposals]
+    logistics_data = TravelTools.calculate_travel_time(activity_names, destination)
+
+    try:
+        validated_container = await _agenerate(
+            "plan",
+            _planner_prompt(destination, duration, proposals, daily_budget, logistics_data),
+            parse=_output_parser(ItineraryList),
+            config=_output_config(ItineraryList),
+            client=client,
+            stream=_item_stream(ItineraryList, on_day),
+        )
+
+        emit("✅ The planning agent successfully generated the itinerary.!")
+        return validated_container.itinerary
+
+    except Exception as e:
+        emit(f"❌ The agent's failure to plan or verify JSON: {e}")
+        return None
+
+async def run_investigator_agent_async(destination: str, interests: List[str], client: Any = None,
+                                       on_activity: Callable[[ActivityProposal], None] | None = None) -> List[ActivityProposal] | None:
+    """Async version of run_investigator_agent."""
+    features = _investigate_request(destination, interests)
+    similar = _semantic_lookup("investigate", features)
+    if similar is not None:
+        return _notified(on_activity, similar)
+
+    covered, missing = _catalog_lookup(destination, interests)
+    if covered and not missing:
+        return _notified(on_activity, _from_catalog(destination, interests, covered))
+
+    researched = await _research_activities_async(destination, missing, client, on_activity=None if covered else on_activity)
+    proposals = _with_catalog(destination, missing, covered, researched)
+    if covered:
+        _notify(on_activity, proposals)
+    semantic_cache_provider.get().put("investigate", features, proposals)
+    return proposals
+
+async def _research_activities_async(destination: str, interests: List[str], client: Any = None,
+                                     on_activity: Callable[[ActivityProposal], None] | None = None) -> List[ActivityProposal] | None:
+    """Async version of _research_activities."""
+    client = _client(client)
+    if not client:
+        emit("Agent execution skipped due to missing API client.")
+        return None
+
+    if _fused_investigator():
+        try:
+            validated_container = await _agenerate(
+                "investigate_fused",
+                _fused_investigator_prompt(destination, interests),
+                parse=lambda text: _parse_agent_json(text, ActivityProposalsList, "proposals"),
+                config=_grounded_config(),
+                client=client,
+                stream=_item_stream(ActivityProposalsList, on_activity),
+            )
+            emit("✅ The agent searched and generated valid JSON in one grounded call.")
+            return validated_container.proposals
+        except Exception as e:
+            emit(f"Error : B: ❌ Fused investigator failed to search or verify JSON: {e}")
+            return None
+
+    tool_data = await fetch_real_data_with_gemini_tool_async(destination, interests, client)
+    if tool_data.startswith("❌ Failed"):
+        emit("Agent execution stopped due to failure in data fetching.")
+        return None
+
+    try:
+        validated_container = await _agenerate(
+            "investigate",
+            _investigator_prompt(destination, interests, tool_data),
+            parse=_output_parser(ActivityProposalsList),
+            config=_output_config(ActivityProposalsList),
+            client=client,
+            stream=_item_stream(ActivityProposalsList, on_activity),
+        )
+
+        emit("✅ The agent successfully generated valid and authenticated JSON (based on the claim).")
+        return validated_container.proposals
+
+    except Exception as e:
+        emit(f"Error : B: ❌ Agent failed to generate or verify JSON: {e}")
+        return None
+
+async def run_memory_analyst_agent_async(duration_days: int, start_date: str, budget_range: str, interests: List[str] | None = None, client: Any = None) -> List[DestinationProposal] | None:
+    """Async version of run_memory_analyst_agent."""
+    features, partition = _memory_request(duration_days, start_date, budget_range, interests)
+    similar = _semantic_lookup("memory", features, partition)
+    if similar is not None:
+        return similar
+
+    client = _client(client)
+    if not client: return None
+
+    memory_report = LongTermMemoryTool.analyze_past_trips(budget_range, duration_days, interests, start_date)
+
+    try:
+        validated_container = await _agenerate(
+            "memory",
+            _memory_analyst_prompt(duration_days, start_date, budget_range, memory_report),
+            parse=_output_parser(DestinationProposalsList),
+            config=_output_config(DestinationProposalsList),
+            client=client,
+        )
+
+        emit("✅ The analyst's assistant successfully analysed the memory and suggested destinations.")
+        semantic_cache_provider.get().put("memory", features, validated_container.proposals, partition)
+        return validated_container.proposals
+
+    except Exception as e:
+        emit(f"❌ Failure of the agent and memory: {e}")
+        return None
+
+async def run_full_sequence_async(trip: TripRequest, destination_index: int = 0, fresh: bool = False, client: Any = None, deadline_s: float | None = None) -> TripPlanResult:
+    """
+    Async equivalent of test_full_sequence_interactive.
+
+    Runs the same four stages, but returns a TripPlanResult instead of only printing,
+    so that many trips can be awaited together and their outcome inspected.
+
+    :param trip: The trip request to plan.
+    :param destination_index: Which proposed destination to plan (simulates the user's selection).
+    :param fresh: Ignore (and discard) the checkpoints of a previous run of the same request.
+    :param client: The genai.Client shared by the agents (defaults to the lazily built shared client).
+    :param deadline_s: End-to-end deadline of the trip in seconds (defaults to TRAVEL_TRIP_DEADLINE; None without it).
+        Each stage is bounded by the time left, and a stage that runs out fails with a TimeoutError.
+    :returns: The TripPlanResult; `failed_stage` is set when a stage produced no result.
+    """
+    request_key = checkpoint_key(trip, destination_index)
+    result = TripPlanResult(request=trip, trip_id=request_key[:16])
+    if fresh:
+        checkpoint_provider.get().clear(request_key)
+
+    if deadline_s is None:
+        deadline_s = deadline_policy.get().trip
+
+    with trip_context(result.trip_id), deadline(deadline_s):
+        return await _run_sequence_async(trip, destination_index, request_key, result, client)
+
+async def _run_sequence_async(trip: TripRequest, destination_index: int, request_key: str, result: TripPlanResult, client: Any = None) -> TripPlanResult:
+    """The stages of run_full_sequence_async, run inside the trip's tracing context."""
+    stage = "memory"
+
+    try:
+        # Stage 0: Memory Analyst Agent
+        destinations = await _arun_stage(request_key, "memory", lambda: run_memory_analyst_agent_async(
+            trip.duration, trip.start_date, trip.budget_range, trip.interests, client=client))
+        if not destinations:
+            raise RuntimeError("The memory agent did not provide any suggestions.")
+        result.destinations = destinations
+
+        selected = destinations[min(destination_index, len(destinations) - 1)]
+        result.selected_destination = selected.destination_name
+        emit(f"--- 🗣️ Simulating user decision: Selected {result.selected_destination} With interest {trip.interests} ---")
+
+        # Stage 1: Investigator Agent
+        stage = "investigate"
+        activities = await _arun_stage(request_key, "investigate", lambda: run_investigator_agent_async(
+            result.selected_destination, trip.interests, client=client, on_activity=_activity_consumer(result.selected_destination)))
+        if not activities:
+            raise RuntimeError("The investigator agent did not return any activities.")
+        result.activities = activities
+
+        # Stage 2: Logistics Planner Agent
+        stage = "plan"
+        itinerary = await _arun_stage(request_key, "plan", lambda: run_planner_agent_async(
+            result.selected_destination, trip.duration, activities, trip.daily_budget, trip.start_date, client=client))
+        if not itinerary:
+            raise RuntimeError("The planner agent did not return an itinerary.")
+        result.itinerary = itinerary
+
+        # Stage 3: Scheduler Agent
+        stage = "schedule"
+        confirmation = await _arun_stage(request_key, "schedule", lambda: run_scheduler_agent_async(
+            itinerary, trip.start_date, client=client, destination=result.selected_destination, on_confirmation=_confirmation_consumer(),
+            trip_id=result.trip_id))
+        if not confirmation:
+            raise RuntimeError("The scheduling agent did not succeed.")
+        result.confirmation = confirmation
+        # Booked: the checkpoints were only for resuming, an identical request later is planned anew.
+        checkpoint_provider.get().clear(request_key)
+
+    except Exception as e:
+        emit(f"❌ Sequence failure at stage '{stage}': {e}")
+        result.failed_stage = stage
+        result.error = str(e)
+        return result
+
+    emit(f"🏁 Sequence complete for {result.selected_destination}: ${confirmation.total_cost_booked:.2f} booked.")
+    return result
+
+async def run_trips_async(trips: Iterable[TripRequest], max_concurrency: int | None = None, client: Any = None) -> List[TripPlanResult]:
+    """
+    Run many trip requests on one event loop, with at most `max_concurrency` sequences in flight.
+
+    :param trips: The trip requests to plan.
+    :param max_concurrency: Concurrency cap (defaults to the TRIP_MAX_CONCURRENCY env var, or 8).
+    :param client: The genai.Client shared by every trip (defaults to the lazily built shared client).
+    :returns: One TripPlanResult per request, in input order.
+    """
+    if max_concurrency is None:
+        load_environment()
+        max_concurrency = int(os.environ.get("TRIP_MAX_CONCURRENCY", 8))
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _run_one(trip: TripRequest) -> TripPlanResult:
+        async with semaphore:
+            return await run_full_sequence_async(trip, client=client)
+
+    return await asyncio.gather(*(_run_one(trip) for trip in trips))
+
+
+# ==========================================================
+# Comparison mode: plan every proposed destination concurrently and rank them.
+# ==========================================================
+
+def _build_option(trip: TripRequest, destination: DestinationProposal, activities: List[ActivityProposal], itinerary: List[DailyPlan]) -> DestinationOption:
+    """Summarize one planned destination against its estimate and the daily budget."""
+    planned_total_cost = round(sum(day_plan.total_daily_cost for day_plan in itinerary), 2)
+    return DestinationOption(
+        destination=destination,
+        activities=activities,
+        itinerary=itinerary,
+        planned_total_cost=planned_total_cost,
+        cost_vs_estimate=round(planned_total_cost - destination.estimated_total_cost, 2),
+        within_budget=all(day_plan.total_daily_cost <= trip.daily_budget for day_plan in itinerary),
+        activity_count=sum(len(day_plan.activities) for day_plan in itinerary),
     )
 
-# Ensure that the environment variable for the API key is defined.
-try:
-    client = genai.Client()
-except Exception:
-    print("⚠️ WARNING: Google GenAI Client not initialized. Check your API Key.")
-    client = None
+def rank_options(options: List[DestinationOption]) -> List[DestinationOption]:
+    """
+    Order the options best first: planned before failed, within budget before over budget,
+    then the most scheduled activities, then the cheapest plan.
+    """
+    ranked = sorted(options, key=lambda o: (not o.ok, not o.within_budget, -o.activity_count, o.planned_total_cost))
+    return [option.model_copy(update={"rank": rank}) for rank, option in enumerate(ranked, start=1)]
+
+class DestinationComparisonRun:
+    """
+    The investigator and planner running concurrently for every proposed destination of a trip.
+
+    Options can be consumed as they finish (`as_completed`), all at once and ranked (`result`),
+    or cut short with `select`, which cancels the other destinations and books the chosen one.
+    Started with start_destination_comparison.
+    """
+
+    def __init__(self, trip: TripRequest, trip_id: str, destinations: List[DestinationProposal], client: Any = None):
+        self.trip = trip
+        self.trip_id = trip_id
+        self.destinations = destinations
+        self.client = client
+        self.selected_destination: str | None = None
+        with trip_context(trip_id):
+            self.tasks = [asyncio.create_task(self._plan_option(index, destination)) for index, destination in enumerate(destinations)]
+
+    async def _plan_option(self, index: int, destination: DestinationProposal) -> DestinationOption:
+        # Each destination is checkpointed under its own request key, so that run_full_sequence_async
+        # (trip, index) resumes straight at the schedule stage once the user picks it.
+        request_key = checkpoint_key(self.trip, index)
+        checkpoint_provider.get().save(request_key, "memory", self.destinations)
+        name = destination.destination_name
+        stage = "investigate"
+        try:
+            activities = await _arun_stage(request_key, "investigate", lambda: run_investigator_agent_async(
+                name, self.trip.interests, client=self.client))
+            if not activities:
+                raise RuntimeError("The investigator agent did not return any activities.")
+
+            stage = "plan"
+            itinerary = await _arun_stage(request_key, "plan", lambda: run_planner_agent_async(
+                name, self.trip.duration, activities, self.trip.daily_budget, self.trip.start_date, client=self.client))
+            if not itinerary:
+                raise RuntimeError("The planner agent did not return an itinerary.")
+        except Exception as e:
+            emit(f"❌ Comparison: {name} failed at stage '{stage}': {e}")
+            return DestinationOption(destination=destination, failed_stage=stage, error=str(e))
+
+        emit(f"⚖️ Comparison: {name} planned.")
+        return _build_option(self.trip, destination, activities, itinerary)
+
+    def _option(self, index: int, outcome: Any) -> DestinationOption:
+        if isinstance(outcome, DestinationOption):
+            return outcome
+        if isinstance(outcome, asyncio.CancelledError):
+            return DestinationOption(destination=self.destinations[index], error="Cancelled: another destination was selected.")
+        return DestinationOption(destination=self.destinations[index], error=f"{type(outcome).__name__}: {outcome}")
+
+    async def as_completed(self):
+        """Yield the options in the order they finish (cancelled destinations are skipped)."""
+        for next_done in asyncio.as_completed(self.tasks):
+            try:
+                yield await next_done
+            except asyncio.CancelledError:
+                continue
+
+    async def result(self) -> DestinationComparison:
+        """Wait for every destination and return the ranked comparison."""
+        outcomes = await asyncio.gather(*self.tasks, return_exceptions=True)
+        return DestinationComparison(
+            request=self.trip,
+            trip_id=self.trip_id,
+            options=rank_options([self._option(index, outcome) for index, outcome in enumerate(outcomes)]),
+            selected_destination=self.selected_destination,
+        )
+
+    def cancel(self, keep: int | None = None) -> None:
+        """Cancel the destinations still in progress, except the one at index `keep`."""
+        for index, task in enumerate(self.tasks):
+            if index != keep and not task.done():
+                task.cancel()
+
+    async def select(self, index: int) -> TripPlanResult:
+        """
+        The user picked destination `index`: cancel the others, finish its planning and schedule it.
+
+        :returns: The TripPlanResult of the full sequence for that destination (resumed from the comparison's checkpoints).
+        """
+        index = min(max(0, index), len(self.tasks) - 1)
+        self.cancel(keep=index)
+        self.selected_destination = self.destinations[index].destination_name
+        await asyncio.gather(self.tasks[index], return_exceptions=True)
+        result = await run_full_sequence_async(self.trip, index, client=self.client)
+        if not result.failed_stage:
+            # The trip is booked: the other destinations' checkpoints will not be resumed either.
+            for other in range(len(self.destinations)):
+                checkpoint_provider.get().clear(checkpoint_key(self.trip, other))
+        return result
+
+async def start_destination_comparison(trip: TripRequest, fresh: bool = False, client: Any = None) -> DestinationComparisonRun | None:
+    """
+    Run the memory stage, then start investigating and planning every proposed destination concurrently.
+
+    :param trip: The trip request to compare destinations for.
+    :param fresh: Ignore (and discard) the checkpoints of previous runs of the same request.
+    :param client: The genai.Client shared by the agents (defaults to the lazily built shared client).
+    :returns: The running comparison, or None when the memory agent proposed no destination.
+    """
+    request_key = checkpoint_key(trip)
+    if fresh:
+        checkpoint_provider.get().clear(request_key)
+
+    trip_id = request_key[:16]
+    with trip_context(trip_id):
+        destinations = await _arun_stage(request_key, "memory", lambda: run_memory_analyst_agent_async(
+            trip.duration, trip.start_date, trip.budget_range, trip.interests, client=client))
+        if not destinations:
+            emit("❌ Comparison failure: The memory agent did not provide any suggestions.")
+            return None
+        if fresh:
+            for index in range(1, len(destinations)):
+                checkpoint_provider.get().clear(checkpoint_key(trip, index))
+        emit(f"--- ⚖️ Comparing {len(destinations)} destinations: {', '.join(d.destination_name for d in destinations)} ---")
+    return DestinationComparisonRun(trip, trip_id, destinations, client)
+
+async def compare_destinations_async(trip: TripRequest, fresh: bool = False, client: Any = None) -> DestinationComparison:
+    """
+    Plan every proposed destination concurrently and rank them side by side.
+
+    :returns: The DestinationComparison (no options when the memory agent proposed no destination).
+    """
+    run = await start_destination_comparison(trip, fresh, client)
+    if run is None:
+        return DestinationComparison(request=trip, trip_id=checkpoint_key(trip)[:16])
+    return await run.result()
+
+# Shared dependencies, built on first use so that importing this module stays cheap:
+# the .env file, google-genai, the SQLite stores and the booking client are only loaded
+# when an agent actually needs them (see providers.py; the Gemini client is providers.client_provider).
+
+# Response cache shared by all agents (set TRAVEL_CACHE_PATH="" for a memory-only cache).
+cache_provider: Provider[ResponseCache] = Provider(lambda: ResponseCache(
+    path=os.environ.get("TRAVEL_CACHE_PATH", ".travel_cache.sqlite"),
+    max_entries=int(os.environ.get("TRAVEL_CACHE_MAX_ENTRIES", 1024)),
+))
+
+# Stage checkpoints, so a failed sequence resumes from its first incomplete stage (TRAVEL_CHECKPOINT_PATH="" keeps them in memory,
+# TRAVEL_CHECKPOINT_MAX_AGE is how many seconds a failed run stays resumable; 0 for no limit).
+checkpoint_provider: Provider[CheckpointStore] = Provider(lambda: CheckpointStore(
+    os.environ.get("TRAVEL_CHECKPOINT_PATH", ".travel_checkpoints.sqlite"),
+    max_age=float(os.environ.get("TRAVEL_CHECKPOINT_MAX_AGE", 24 * 3600)),
+))
+
+# Activities researched per destination and interest (TRAVEL_CATALOG_PATH="" keeps them in memory, TRAVEL_CATALOG_TTL=0 disables the catalog).
+catalog_provider: Provider[ActivityCatalog] = Provider(lambda: ActivityCatalog(
+    os.environ.get("TRAVEL_CATALOG_PATH", ".travel_catalog.sqlite"),
+    ttl=float(os.environ.get("TRAVEL_CATALOG_TTL", 7 * 24 * 3600)),
+))
+
+# Near-duplicate requests of the memory and investigate stages (opt-in with TRAVEL_SEMANTIC_CACHE=1;
+# TRAVEL_SEMANTIC_THRESHOLDS="memory=0.97,investigate=0.93" or a single value tunes the similarity thresholds).
+def _build_semantic_cache() -> "SemanticCache":
+    from semantic_cache import SemanticCache, parse_thresholds
+
+    return SemanticCache(
+        thresholds=parse_thresholds(os.environ.get("TRAVEL_SEMANTIC_THRESHOLDS", "")),
+        max_entries=int(os.environ.get("TRAVEL_SEMANTIC_MAX_ENTRIES", 2048)),
+        ttl=float(os.environ.get("TRAVEL_SEMANTIC_TTL", 6 * 3600)),
+        enabled=os.environ.get("TRAVEL_SEMANTIC_CACHE", "0") == "1",
+    )
+
+semantic_cache_provider: Provider["SemanticCache"] = Provider(_build_semantic_cache)
+
+# Per-stage input token budgets of the prompts (TRAVEL_INPUT_BUDGETS="investigate=500,schedule=1200";
+# TRAVEL_PROMPT_COMPACTION=0 sends the payloads whole).
+context_budget: Provider[ContextBudget] = Provider(lambda: ContextBudget(
+    budgets=parse_budgets(os.environ.get("TRAVEL_INPUT_BUDGETS", "")),
+    enabled=os.environ.get("TRAVEL_PROMPT_COMPACTION", "1") == "1",
+))
+
+# Quota shared by every model call (GEMINI_RPM / GEMINI_TPM unset means unlimited; retries still apply).
+rate_limiter: Provider[RateLimiter] = Provider(lambda: RateLimiter(
+    requests_per_minute=float(os.environ.get("GEMINI_RPM") or 0) or None,
+    tokens_per_minute=float(os.environ.get("GEMINI_TPM") or 0) or None,
+    max_retries=int(os.environ.get("GEMINI_MAX_RETRIES", 4)),
+    backoff=float(os.environ.get("GEMINI_BACKOFF", 1.0)),
+))
+
+# Stage and trip deadlines in seconds (TRAVEL_STAGE_DEADLINES="memory=30,investigate=90", TRAVEL_TRIP_DEADLINE=240).
+deadline_policy: Provider[DeadlinePolicy] = Provider(DeadlinePolicy.from_env)
+
+# Hedged model calls (TRAVEL_HEDGING=1): a duplicate request past the agent's p95, capped at TRAVEL_HEDGE_MAX_EXTRA of all calls.
+hedger: Provider[Hedger] = Provider(lambda: Hedger(
+    enabled=os.environ.get("TRAVEL_HEDGING", "0") == "1",
+    max_extra=float(os.environ.get("TRAVEL_HEDGE_MAX_EXTRA", 0.1)),
+))
+
+# Booking dispatcher (set BOOKING_API_URL to use a real booking service instead of the simulation).
+booking_provider: Provider[BookingDispatcher] = Provider(lambda: BookingDispatcher(
+    base_url=os.environ.get("BOOKING_API_URL") or None,
+    max_concurrency=int(os.environ.get("BOOKING_MAX_CONCURRENCY", 8)),
+))
+
+# Native structured output: pass the Pydantic schemas as the API's response schema instead of pasting them in the prompt.
+# None reads the STRUCTURED_OUTPUT env var on first use.
+STRUCTURED_OUTPUT: bool | None = None
+
+def _structured_output() -> bool:
+    global STRUCTURED_OUTPUT
+    if STRUCTURED_OUTPUT is None:
+        load_environment()
+        STRUCTURED_OUTPUT = os.environ.get("STRUCTURED_OUTPUT", "0") == "1"
+    return STRUCTURED_OUTPUT
+
+# Fused investigator: one grounded search request returns the activity proposals directly,
+# instead of a search summary plus a structuring call. None reads the FUSED_INVESTIGATOR env var on first use.
+FUSED_INVESTIGATOR: bool | None = None
+
+def _fused_investigator() -> bool:
+    global FUSED_INVESTIGATOR
+    if FUSED_INVESTIGATOR is None:
+        load_environment()
+        FUSED_INVESTIGATOR = os.environ.get("FUSED_INVESTIGATOR", "0") == "1"
+    return FUSED_INVESTIGATOR
+
+# Scheduler: the model writes the booking confirmation (the original behaviour) instead of the local builder.
+# None reads the LLM_SCHEDULER env var on first use.
+LLM_SCHEDULER: bool | None = None
+
+def _llm_scheduler() -> bool:
+    global LLM_SCHEDULER
+    if LLM_SCHEDULER is None:
+        load_environment()
+        LLM_SCHEDULER = os.environ.get("LLM_SCHEDULER", "0") == "1"
+    return LLM_SCHEDULER
+
+# Streaming: an agent given an item consumer streams its model response (generate_content_stream) and hands over
+# each activity, day or confirmation as soon as it is complete and valid. None reads the STREAMING env var on first use.
+STREAMING: bool | None = None
+
+def _streaming() -> bool:
+    global STREAMING
+    if STREAMING is None:
+        load_environment()
+        STREAMING = os.environ.get("STREAMING", "0") == "1"
+    return STREAMING
+
+# Seconds a streamed response may go without a chunk (before the first one or between two) before the
+# attempt fails with a retryable TimeoutError; 0 disables it. None reads the STREAM_IDLE_TIMEOUT env var on first use.
+STREAM_IDLE_TIMEOUT: float | None = None
+
+def _stream_idle_timeout() -> float | None:
+    global STREAM_IDLE_TIMEOUT
+    if STREAM_IDLE_TIMEOUT is None:
+        load_environment()
+        STREAM_IDLE_TIMEOUT = float(os.environ.get("STREAM_IDLE_TIMEOUT") or 60)
+    return STREAM_IDLE_TIMEOUT or None
 
 if __name__ == "__main__":
-    
+
     test_full_sequence_interactive(duration=4,start_date='2025-12-01',interests=["History", "Food"], budget_range="Mid-range", daily_budget=180.0)